@@ -1,12 +1,33 @@
+import argparse
 import json
+from collections import defaultdict
+from pathlib import Path
 
-def load_fingerprints(path="data/fingerprints/fingerprints.json"):
-    with open(path, "r") as f:
-        return json.load(f)
+from scanner.columnar import iter_stage_records
+from scanner.records import NDJSONWriter, iter_records, ndjson_path
 
-def load_tls(path="data/tls_certs/tls_certs.json"):
-    with open(path, "r") as f:
-        return json.load(f)
+FINGERPRINTS_PATH = "data/fingerprints/fingerprints.json"
+TLS_PATH = "data/tls_certs/tls_certs.json"
+SCORES_PATH = "data/honeypot_score/honeypot_scores.json"
+RULE_STATS_PATH = "data/honeypot_score/rule_stats.json"
+STATE_PATH = "data/honeypot_score/index_state.json"
+
+# clusters at least this big add to the score
+CLUSTER_MIN_SIZE = 5
+
+# the iter_* readers use the columnar store when it holds the latest scan,
+# otherwise they stream the .ndjson outputs when present
+def iter_fingerprints(path=FINGERPRINTS_PATH):
+    return iter_stage_records("fingerprints") if path == FINGERPRINTS_PATH else iter_records(path)
+
+def iter_tls(path=TLS_PATH):
+    return iter_stage_records("tls_certs") if path == TLS_PATH else iter_records(path)
+
+def load_fingerprints(path=FINGERPRINTS_PATH):
+    return list(iter_fingerprints(path))
+
+def load_tls(path=TLS_PATH):
+    return list(iter_tls(path))
 
 def load_tls_clusters(path="data/tls_clusters/tls_clusters_fingerprint.json"):
     with open(path, "r") as f:
@@ -18,7 +39,7 @@ def compute_tls_signals(tls_entry, tls_cluster_size):
     score = 0
     signals = []
 
-    if tls_cluster_size >= 5:
+    if tls_cluster_size >= CLUSTER_MIN_SIZE:
         score += min(tls_cluster_size * 2, 40)
         signals.append(f"reused_certificate_cluster_of_{tls_cluster_size}")
 
@@ -67,7 +88,7 @@ def compute_behavior_signals(fp_entry, cluster_map):
     behavior_hash = fp_entry["response_hash_banner"]
     if behavior_hash in cluster_map:
         csize = len(cluster_map[behavior_hash])
-        if csize >= 5:
+        if csize >= CLUSTER_MIN_SIZE:
             score += min(csize * 2, 30)
             signals.append(f"identical_behavior_cluster_{csize}")
 
@@ -75,85 +96,309 @@ def compute_behavior_signals(fp_entry, cluster_map):
 
 
 
-def main():
-    print("[+] Loading data...")
-    fingerprints = load_fingerprints()
-    tls_entries = load_tls()
+def score_server(fp, tls_info, tls_cluster_size, behavior_clusters):
+    host = fp["host"]
+
+    total_score = 0
+    signals = []
+
+    if tls_info:
+        s, sig = compute_tls_signals(tls_info, tls_cluster_size)
+        total_score += s
+        signals.extend(sig)
+
+    else:
+        total_score += 20
+        signals.append("no_tls_certificate_detected")
+
+    bscore, bsig = compute_behavior_signals(fp, behavior_clusters)
+    total_score += bscore
+    signals.extend(bsig)
+
+    final_score = min(total_score, 100)
+
+    return {
+        "host": host,
+        "port": fp["port"],
+        "honeypot_score": final_score,
+        "risk_level": (
+            "HIGH" if final_score >= 70 else
+            "MEDIUM" if final_score >= 40 else
+            "LOW"
+        ),
+        "signals": signals,
+    }
+
+
+def score_all():
     tls_clusters = load_tls_clusters()
 
     tls_fps = {}
     for c in tls_clusters:
         tls_fps[c["key"]] = c["count"]
 
+    # first streaming pass: behavior clusters only need the members' hosts
     behavior_clusters = {}
-    for fp in fingerprints:
+    for fp in iter_fingerprints():
         banner_hash = fp["response_hash_banner"]
         if banner_hash not in behavior_clusters:
             behavior_clusters[banner_hash] = []
-        behavior_clusters[banner_hash].append(fp)
+        behavior_clusters[banner_hash].append(fp["host"])
 
-    tls_by_host = {c["host"]: c for c in tls_entries}
-    results = []
+    tls_by_host = {c["host"]: c for c in iter_tls()}
 
     print("[+] Computing scores for each server...")
 
-    for fp in fingerprints:
-        host = fp["host"]
+    # second pass scores each server as it streams by
+    for fp in iter_fingerprints():
+        tls_info = tls_by_host.get(fp["host"])
+        tls_cluster_size = tls_fps.get(tls_info["fingerprint_sha256"], 1) if tls_info else None
+
+        yield score_server(fp, tls_info, tls_cluster_size, behavior_clusters)
+
+
+# bumped when the state layout changes; an older state is rebuilt from scratch
+STATE_VERSION = 2
 
-        tls_info = tls_by_host.get(host)
 
-        total_score = 0
-        signals = []
+def _record_key(fp):
+    return f"{fp['host']}:{fp['port']}"
+
+
+def _group(records, key):
+    # every record is kept, so clusters count records exactly like the full run
+    grouped = defaultdict(list)
+    for r in records:
+        grouped[key(r)].append(r)
+    return grouped
+
+
+class IncrementalScorer:
+    """Honeypot scores maintained across runs.
 
-        if tls_info:
-            fp_sha = tls_info["fingerprint_sha256"]
-            tls_cluster_size = tls_fps.get(fp_sha, 1)
+    The fingerprint/TLS records, the cluster indices (certificate
+    fingerprint -> hosts, banner hash -> servers) and the scores are kept
+    in a state file. An update diffs the incoming records against it and
+    rescores only servers whose records changed, plus every member of a
+    cluster whose size changed on either side of CLUSTER_MIN_SIZE, since
+    cluster size feeds both the score and the signal name.
 
-            s, sig = compute_tls_signals(tls_info, tls_cluster_size)
-            total_score += s
-            signals.extend(sig)
+    Clusters count records, duplicates included, as tls_clusters.json and
+    the full run do, so both paths give the same scores for the same data.
+    """
 
-        else:
-            total_score += 20
-            signals.append("no_tls_certificate_detected")
+    def __init__(self, state_path=STATE_PATH):
+        self.state_path = Path(state_path)
+
+        self.fingerprints = {}                   # "host:port" -> fingerprint records
+        self.tls = {}                            # host -> TLS records
+        self.scores = {}                         # "host:port" -> one score per record
+        self.tls_clusters = defaultdict(list)    # cert sha256 -> host per record
+        self.behavior_clusters = defaultdict(list)  # banner hash -> "host:port" per record
+        self.keys_by_host = defaultdict(set)     # host -> "host:port"
+
+        if self.state_path.exists():
+            self.load()
+
+    def load(self):
+        with open(self.state_path, "r") as f:
+            state = json.load(f)
+
+        if state.get("version") != STATE_VERSION:
+            print("[!] Incremental state is from an older version, rescoring everything")
+            return
+
+        self.fingerprints = state["fingerprints"]
+        self.tls = state["tls"]
+        self.scores = state["scores"]
+
+        # hashes can be null, so clusters are stored as [key, members] pairs
+        for key, members in state["tls_clusters"]:
+            self.tls_clusters[key] = members
+        for key, members in state["behavior_clusters"]:
+            self.behavior_clusters[key] = members
+
+        for key, records in self.fingerprints.items():
+            self.keys_by_host[records[0]["host"]].add(key)
+
+    def save(self):
+        state = {
+            "version": STATE_VERSION,
+            "fingerprints": self.fingerprints,
+            "tls": self.tls,
+            "scores": self.scores,
+            "tls_clusters": [[k, v] for k, v in self.tls_clusters.items()],
+            "behavior_clusters": [[k, v] for k, v in self.behavior_clusters.items()],
+        }
+
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.state_path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        tmp.replace(self.state_path)
+
+    @staticmethod
+    def _move(clusters, old_keys, new_keys, member, touched):
+        # one cluster key per record; touched remembers each cluster's size before this update
+        for k in (*old_keys, *new_keys):
+            touched.setdefault(k, len(clusters.get(k, ())))
 
-        bscore, bsig = compute_behavior_signals(fp, behavior_clusters)
-        total_score += bscore
-        signals.extend(bsig)
+        for k in old_keys:
+            clusters[k].remove(member)
+            if not clusters[k]:
+                del clusters[k]
 
-        final_score = min(total_score, 100)
+        for k in new_keys:
+            clusters[k].append(member)
+
+    def _crossed(self, clusters, touched):
+        for key, before in touched.items():
+            after = len(clusters.get(key, ()))
+            if before != after and max(before, after) >= CLUSTER_MIN_SIZE:
+                yield key
+
+    def update(self, fingerprints, tls_entries, snapshot: bool = True):
+        """Apply new or changed records and rescore the affected servers.
+
+        With snapshot=True the inputs are the complete current data set and
+        servers missing from them are dropped; otherwise they are a diff.
+        Returns the keys that were rescored.
+        """
+        affected = set()
+        touched_behavior = {}
+        touched_tls = {}
+
+        def banners(records):
+            return [fp["response_hash_banner"] for fp in records]
+
+        def shas(records):
+            return [c["fingerprint_sha256"] for c in records]
+
+        incoming = _group(fingerprints, _record_key)
+
+        for key, records in incoming.items():
+            old = self.fingerprints.get(key)
+            if old == records:
+                continue
+
+            self._move(self.behavior_clusters, banners(old or []), banners(records), key, touched_behavior)
+            self.fingerprints[key] = records
+            self.keys_by_host[records[0]["host"]].add(key)
+            affected.add(key)
+
+        if snapshot:
+            for key in set(self.fingerprints) - set(incoming):
+                old = self.fingerprints.pop(key)
+                self._move(self.behavior_clusters, banners(old), [], key, touched_behavior)
+                self.keys_by_host[old[0]["host"]].discard(key)
+                self.scores.pop(key, None)
+
+        incoming = _group(tls_entries, lambda c: c["host"])
+
+        for host, records in incoming.items():
+            old = self.tls.get(host)
+            if old == records:
+                continue
+
+            self._move(self.tls_clusters, shas(old or []), shas(records), host, touched_tls)
+            self.tls[host] = records
+            affected |= self.keys_by_host[host]
+
+        if snapshot:
+            for host in set(self.tls) - set(incoming):
+                old = self.tls.pop(host)
+                self._move(self.tls_clusters, shas(old), [], host, touched_tls)
+                affected |= self.keys_by_host[host]
+
+        for banner_hash in self._crossed(self.behavior_clusters, touched_behavior):
+            affected |= set(self.behavior_clusters.get(banner_hash, ()))
+
+        for sha in self._crossed(self.tls_clusters, touched_tls):
+            for host in set(self.tls_clusters.get(sha, ())):
+                affected |= self.keys_by_host[host]
+
+        rescored = set()
+        for key in affected:
+            records = self.fingerprints.get(key)
+            if records is None:
+                continue
+
+            # as in the full run, a host's last certificate record is the one scored
+            tls_records = self.tls.get(records[0]["host"])
+            tls_info = tls_records[-1] if tls_records else None
+            tls_cluster_size = len(self.tls_clusters[tls_info["fingerprint_sha256"]]) if tls_info else None
+
+            self.scores[key] = [score_server(fp, tls_info, tls_cluster_size, self.behavior_clusters)
+                                for fp in records]
+            rescored.add(key)
+
+        return rescored
+
+    def results(self):
+        return [score for scores in self.scores.values() for score in scores]
 
-        results.append({
-            "host": host,
-            "port": fp["port"],
-            "honeypot_score": final_score,
-            "risk_level": (
-                "HIGH" if final_score >= 70 else
-                "MEDIUM" if final_score >= 40 else
-                "LOW"
-            ),
-            "signals": signals,
-        })
 
-    with open("data/honeypot_score/honeypot_scores.json", "w") as f:
+def write_scores(results, path=SCORES_PATH):
+    with NDJSONWriter(ndjson_path(path)) as scores_out:
+        scores_out.write_many(results)
+
+    with open(path, "w") as f:
         json.dump(results, f, indent=2)
 
 
+def main():
+    p = argparse.ArgumentParser(description="Honeypot suspicion scores from fingerprints and TLS data")
+    p.add_argument("--incremental", action="store_true",
+                   help="keep cluster indices between runs and rescore only changed servers")
+    p.add_argument("--state", default=STATE_PATH, help="state file for --incremental")
+    p.add_argument("--vectorized", action="store_true",
+                   help="score all servers at once over NumPy columns (needs numpy)")
+    p.add_argument("--rules", nargs="?", const="analysis/rules/honeypot.json", default=None,
+                   help="score with a declarative rule file (JSON or YAML) and report per-rule stats")
+    args = p.parse_args()
+
+    print("[+] Loading data...")
+
+    top = None
+    if args.incremental:
+        scorer = IncrementalScorer(args.state)
+        rescored = scorer.update(iter_fingerprints(), iter_tls())
+        scorer.save()
+        results = scorer.results()
+        print(f"[+] Rescored {len(rescored)} of {len(results)} servers")
+    elif args.rules:
+        from analysis.signal_rules import RuleEngine
+        engine = RuleEngine.load(args.rules)
+        results = engine.score_records(iter_fingerprints(), iter_tls())
+        engine.print_stats()
+        with open(RULE_STATS_PATH, "w") as f:
+            json.dump(engine.stats(), f, indent=2)
+    elif args.vectorized:
+        from analysis.honeypot_vector import score_stage_outputs, top_records, write_score_columns
+        scored = score_stage_outputs()
+        write_score_columns(scored, SCORES_PATH)
+        top = top_records(scored, 20)
+    else:
+        results = list(score_all())
+
+    if top is None:
+        write_scores(results)
+        top = sorted(results, key=lambda x: x["honeypot_score"], reverse=True)[:20]
+
+
     print("\n==============================")
     print("       TOP SUSPECTED")
     print("==============================\n")
 
-    results_sorted = sorted(results, key=lambda x: x["honeypot_score"], reverse=True)
-
-    for r in results_sorted[:20]:
+    for r in top:
         print(f"{r['host']} → score {r['honeypot_score']} ({r['risk_level']})")
         for sig in r["signals"][:5]:
             print(f"   - {sig}")
         print("")
 
     print("[✓] Honeypot scoring complete.")
-    print("[✓] Files written: honeypot_scores.json\n")
+    print("[✓] Files written: honeypot_scores.json, honeypot_scores.ndjson\n")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
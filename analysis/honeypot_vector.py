@@ -0,0 +1,314 @@
+import json
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+
+from analysis.honeypot_score import CLUSTER_MIN_SIZE, iter_fingerprints, iter_tls
+from scanner.columnar import load_table, store_is_current
+from scanner.records import ndjson_path
+
+
+# bit i of a server's signal mask is SIGNALS[i], in the order the
+# row-wise scorer lists them; the two cluster signals carry their size
+SIGNALS = [
+    "reused_certificate_cluster",
+    "self_signed_or_unknown_issuer",
+    "suspicious_subject_CN",
+    "very_long_certificate_validity",
+    "no_tls_certificate_detected",
+    "suspicious_low_latency",
+    "suspicious_high_latency",
+    "cannot_serve_history",
+    "missing_p2wpkh_support",
+    "missing_taproot_support",
+    "identical_behavior_cluster",
+]
+BIT = {name: i for i, name in enumerate(SIGNALS)}
+
+LONG_VALIDITY_YEARS = ("2035", "2040", "2050")
+UNKNOWN_ISSUERS = ["", "UNKNOWN_ISSUER"]
+SUSPICIOUS_SUBJECTS = ["", "localhost", "UNKNOWN_SUBJECT"]
+
+# the store columns the scorer reads
+FINGERPRINT_COLUMNS = ["host", "port", "latency_ping", "error_history", "supports_p2wpkh",
+                       "supports_p2tr", "response_hash_banner"]
+TLS_COLUMNS = ["host", "fingerprint_sha256", "issuer_cn", "subject_cn", "not_after"]
+
+
+def _text(values) -> np.ndarray:
+    return np.array(["" if v is None else str(v) for v in values], dtype=str)
+
+
+def _codes(values, table: Dict) -> np.ndarray:
+    # dense integer code per distinct value (None included), so grouping
+    # is a bincount instead of a sort over strings
+    return np.fromiter((table.setdefault(v, len(table)) for v in values), dtype=np.int64)
+
+
+def tls_columns(tls_entries: Iterable[Dict]) -> Dict:
+    entries = list(tls_entries)
+    not_after = _text(c.get("not_after") for c in entries)
+    long_validity = np.zeros(len(entries), dtype=bool)
+    for year in LONG_VALIDITY_YEARS:
+        long_validity |= np.char.find(not_after, year) >= 0
+
+    return {
+        "fingerprint_code": _codes((c["fingerprint_sha256"] for c in entries), {}),
+        "unknown_issuer": np.isin(_text(c.get("issuer_cn") for c in entries), UNKNOWN_ISSUERS),
+        "suspicious_subject": np.isin(_text(c.get("subject_cn") for c in entries), SUSPICIOUS_SUBJECTS),
+        "long_validity": long_validity,
+        # the last certificate of a host wins, as in the row-wise scorer
+        "row_by_host": {c["host"]: i for i, c in enumerate(entries)},
+    }
+
+
+def fingerprint_columns(fingerprints: Iterable[Dict], tls: Dict) -> Dict[str, np.ndarray]:
+    """One pass over the fingerprint records into the arrays the scorer
+    reads, joined to their host's certificate row (-1 for none)."""
+    row_by_host = tls["row_by_host"]
+    host, port, latency, history_ok, p2wpkh, p2tr, banner, tls_row = [], [], [], [], [], [], [], []
+
+    for fp in fingerprints:
+        host.append(fp["host"])
+        port.append(fp["port"])
+        latency.append(fp["latency_ping"])
+        history_ok.append(fp["error_history"] == "ok")
+        p2wpkh.append(bool(fp["supports_p2wpkh"]))
+        p2tr.append(bool(fp["supports_p2tr"]))
+        banner.append(fp["response_hash_banner"])
+        tls_row.append(row_by_host.get(fp["host"], -1))
+
+    return {
+        "host": np.array(host, dtype=str),
+        "port": np.array(port, dtype=np.int64),
+        "latency_ping": np.array(latency, dtype=np.float64),  # None -> nan
+        "history_ok": np.array(history_ok, dtype=bool),
+        "supports_p2wpkh": np.array(p2wpkh, dtype=bool),
+        "supports_p2tr": np.array(p2tr, dtype=bool),
+        "banner_code": _codes(banner, {}),
+        "tls_row": np.array(tls_row, dtype=np.int64),
+    }
+
+
+def _table_codes(column) -> np.ndarray:
+    # the dictionary indices are already dense codes, nulls included
+    encoded = pc.dictionary_encode(column.combine_chunks(), null_encoding="encode")
+    return encoded.indices.to_numpy().astype(np.int64)
+
+
+def _table_text_in(column, values: List[str]) -> np.ndarray:
+    return pc.is_in(pc.fill_null(column, ""), value_set=pa.array(values)).to_numpy()
+
+
+def tls_table_columns(table: "pa.Table") -> Dict:
+    """tls_columns() for a store table, without a dict per certificate.
+    not_after is a timestamp there, so the long validity check reads its year."""
+    years = pc.fill_null(pc.year(table["not_after"]), 0).to_numpy()
+    return {
+        "fingerprint_code": _table_codes(table["fingerprint_sha256"]),
+        "unknown_issuer": _table_text_in(table["issuer_cn"], UNKNOWN_ISSUERS),
+        "suspicious_subject": _table_text_in(table["subject_cn"], SUSPICIOUS_SUBJECTS),
+        "long_validity": np.isin(years, [int(y) for y in LONG_VALIDITY_YEARS]),
+        "host": table["host"].combine_chunks(),
+    }
+
+
+def fingerprint_table_columns(table: "pa.Table", tls: Dict) -> Dict[str, np.ndarray]:
+    # looking hosts up in the reversed certificate hosts finds each host's
+    # last certificate, as row_by_host does
+    tls_host = tls["host"]
+    last = len(tls_host) - 1
+    pos = pc.fill_null(pc.index_in(table["host"], value_set=tls_host[::-1]), -1).to_numpy()
+    tls_row = np.where(pos >= 0, last - pos.astype(np.int64), -1)
+
+    return {
+        "host": table["host"].to_numpy(),
+        "port": pc.fill_null(table["port"], 0).to_numpy().astype(np.int64),
+        "latency_ping": table["latency_ping"].to_numpy(),  # null -> nan
+        "history_ok": pc.fill_null(pc.equal(table["error_history"], "ok"), False).to_numpy(),
+        "supports_p2wpkh": pc.fill_null(table["supports_p2wpkh"], False).to_numpy(),
+        "supports_p2tr": pc.fill_null(table["supports_p2tr"], False).to_numpy(),
+        "banner_code": _table_codes(table["response_hash_banner"]),
+        "tls_row": tls_row,
+    }
+
+
+def _group_sizes(codes: np.ndarray) -> np.ndarray:
+    if len(codes) == 0:
+        return codes
+    return np.bincount(codes)[codes]
+
+
+def score_columns(fp: Dict[str, np.ndarray], tls: Dict):
+    """Evaluate every signal as a mask over all servers at once.
+
+    Returns (scores, signal masks, certificate cluster sizes, behavior
+    cluster sizes), one element per fingerprint row. Cluster sizes count
+    records, like the row-wise scorer.
+    """
+    n = len(fp["host"])
+    scores = np.zeros(n, dtype=np.int64)
+    masks = np.zeros(n, dtype=np.uint32)
+
+    def signal(name, cond, points):
+        np.add(scores, np.where(cond, points, 0), out=scores)
+        np.bitwise_or(masks, np.uint32(1 << BIT[name]), out=masks, where=cond)
+
+    has_tls = fp["tls_row"] >= 0
+    idx = np.where(has_tls, fp["tls_row"], 0)
+
+    def tls_field(values, fill):
+        if len(values) == 0:
+            return np.full(n, fill)
+        return np.where(has_tls, values[idx], fill)
+
+    tls_size = tls_field(_group_sizes(tls["fingerprint_code"]), 0)
+    signal("reused_certificate_cluster", has_tls & (tls_size >= CLUSTER_MIN_SIZE),
+           np.minimum(tls_size * 2, 40))
+
+    signal("self_signed_or_unknown_issuer", has_tls & tls_field(tls["unknown_issuer"], False), 10)
+    signal("suspicious_subject_CN", has_tls & tls_field(tls["suspicious_subject"], False), 5)
+    signal("very_long_certificate_validity", has_tls & tls_field(tls["long_validity"], False), 15)
+
+    signal("no_tls_certificate_detected", ~has_tls, 20)
+
+    # nan (no reply) compares false; a latency of 0 is skipped like the row-wise check
+    latency = fp["latency_ping"]
+    signal("suspicious_low_latency", (latency != 0) & (latency < 10), 10)
+    signal("suspicious_high_latency", latency > 2000, 10)
+
+    signal("cannot_serve_history", ~fp["history_ok"], 10)
+    signal("missing_p2wpkh_support", ~fp["supports_p2wpkh"], 3)
+    signal("missing_taproot_support", ~fp["supports_p2tr"], 3)
+
+    behavior_size = _group_sizes(fp["banner_code"])
+    signal("identical_behavior_cluster", behavior_size >= CLUSTER_MIN_SIZE,
+           np.minimum(behavior_size * 2, 30))
+
+    return np.minimum(scores, 100), masks, tls_size, behavior_size
+
+
+def risk_levels(scores: np.ndarray) -> np.ndarray:
+    return np.select([scores >= 70, scores >= 40], ["HIGH", "MEDIUM"], "LOW")
+
+
+@lru_cache(maxsize=65536)
+def _signal_names(mask: int, tls_size: int, behavior_size: int) -> Tuple[str, ...]:
+    signals = []
+    for i, name in enumerate(SIGNALS):
+        if not mask >> i & 1:
+            continue
+        if name == "reused_certificate_cluster":
+            signals.append(f"reused_certificate_cluster_of_{tls_size}")
+        elif name == "identical_behavior_cluster":
+            signals.append(f"identical_behavior_cluster_{behavior_size}")
+        else:
+            signals.append(name)
+    return tuple(signals)
+
+
+def expand_signals(mask: int, tls_size: int, behavior_size: int) -> List[str]:
+    # few distinct (mask, sizes) combinations exist, so the names are cached
+    return list(_signal_names(mask, tls_size, behavior_size))
+
+
+def _scored(fp: Dict[str, np.ndarray], tls: Dict) -> Dict[str, np.ndarray]:
+    scores, masks, tls_size, behavior_size = score_columns(fp, tls)
+    return {
+        "host": fp["host"],
+        "port": fp["port"],
+        "honeypot_score": scores,
+        "risk_level": risk_levels(scores),
+        "mask": masks,
+        "tls_size": tls_size,
+        "behavior_size": behavior_size,
+    }
+
+
+def score_tables(fingerprints: "pa.Table", tls: "pa.Table") -> Dict[str, np.ndarray]:
+    tls_cols = tls_table_columns(tls)
+    return _scored(fingerprint_table_columns(fingerprints, tls_cols), tls_cols)
+
+
+def score_stage_outputs() -> Dict[str, np.ndarray]:
+    """Score the latest fingerprints and certificates into result columns,
+    read straight from the columnar store when both tables are current."""
+    if store_is_current("fingerprints") and store_is_current("tls_certs"):
+        return score_tables(load_table("fingerprints", FINGERPRINT_COLUMNS),
+                            load_table("tls_certs", TLS_COLUMNS))
+
+    tls = tls_columns(iter_tls())
+    return _scored(fingerprint_columns(iter_fingerprints(), tls), tls)
+
+
+def _rows(scored: Dict[str, np.ndarray], order=slice(None)):
+    cols = ["host", "port", "honeypot_score", "risk_level", "mask", "tls_size", "behavior_size"]
+    return zip(*(scored[c][order].tolist() for c in cols))
+
+
+def score_records(fingerprints: Iterable[Dict], tls_entries: Iterable[Dict]) -> List[Dict]:
+    # same records the row-wise scorer writes, in the same order
+    tls = tls_columns(tls_entries)
+    return records(_scored(fingerprint_columns(fingerprints, tls), tls))
+
+
+def records(scored: Dict[str, np.ndarray], order=slice(None)) -> List[Dict]:
+    return [
+        {
+            "host": host,
+            "port": port,
+            "honeypot_score": score,
+            "risk_level": risk,
+            "signals": expand_signals(mask, ts, bs),
+        }
+        for host, port, score, risk, mask, ts, bs in _rows(scored, order)
+    ]
+
+
+def top_records(scored: Dict[str, np.ndarray], n: int) -> List[Dict]:
+    # a stable sort, so ties keep their input order as with sorted()
+    order = np.argsort(-scored["honeypot_score"], kind="stable")[:n]
+    return records(scored, order)
+
+
+def write_score_columns(scored: Dict[str, np.ndarray], path) -> int:
+    """Write the same honeypot_scores.json and .ndjson as write_scores(),
+    formatting each line from its columns instead of dumping a dict per
+    server. Everything after the port depends only on the signal mask and
+    the two cluster sizes, so that text is built once per combination."""
+    tails: Dict[Tuple, Tuple[str, str]] = {}
+
+    def tail(score, risk, mask, ts, bs):
+        key = (mask, ts, bs)
+        if key not in tails:
+            signals = expand_signals(mask, ts, bs)
+            flat = f'"honeypot_score": {score}, "risk_level": {json.dumps(risk)}, "signals": {json.dumps(signals)}}}'
+            if signals:
+                listed = "[\n" + ",\n".join(f"      {json.dumps(s)}" for s in signals) + "\n    ]"
+            else:
+                listed = "[]"
+            indented = (f'    "honeypot_score": {score},\n    "risk_level": {json.dumps(risk)},\n'
+                        f'    "signals": {listed}\n  }}')
+            tails[key] = (flat, indented)
+        return tails[key]
+
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    count = 0
+    with open(ndjson_path(path), "w") as lines, open(path, "w") as pretty:
+        pretty.write("[")
+        for host, port, score, risk, mask, ts, bs in _rows(scored):
+            flat, indented = tail(score, risk, mask, ts, bs)
+            host = json.dumps(host)
+            lines.write(f'{{"host": {host}, "port": {port}, {flat}\n')
+            pretty.write(f'{"," if count else ""}\n  {{\n    "host": {host},\n    "port": {port},\n{indented}')
+            count += 1
+        pretty.write("\n]" if count else "]")
+    return count
@@ -0,0 +1,224 @@
+import argparse
+import ipaddress
+import json
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+from scanner.columnar import parse_version
+from scanner.geoip import load_geo_cache
+from scanner.records import iter_records
+
+
+STRONG_KEYS = ("cert_fingerprint", "subject_cn", "banner_hash", "version")
+# many unrelated operators share a cloud ASN or /24, so these only link
+# hosts that a strong key already ties to another host
+NETWORK_KEYS = ("asn", "prefix")
+KEY_TYPES = STRONG_KEYS + NETWORK_KEYS
+
+# placeholder values every default install shares; they say nothing about the operator
+IGNORED_VALUES = {None, "", "localhost", "UNKNOWN_SUBJECT", "UNKNOWN_ISSUER"}
+
+OUTPUT_PATH = Path("data/operator_clusters/operator_clusters.json")
+
+
+class DisjointSet:
+    """Union-find with union by size and path halving: near-constant
+    amortized cost per operation."""
+
+    def __init__(self):
+        self.parent: Dict[Hashable, Hashable] = {}
+        self.size: Dict[Hashable, int] = {}
+
+    def add(self, x):
+        if x not in self.parent:
+            self.parent[x] = x
+            self.size[x] = 1
+
+    def find(self, x):
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a, b) -> bool:
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return False
+        if self.size[ra] < self.size[rb]:
+            ra, rb = rb, ra
+        self.parent[rb] = ra
+        self.size[ra] += self.size[rb]
+        return True
+
+    def groups(self) -> Dict[Hashable, List]:
+        out = defaultdict(list)
+        for x in self.parent:
+            out[self.find(x)].append(x)
+        return out
+
+
+def network_prefix(host: str) -> Optional[str]:
+    # /24 for IPv4, /48 for IPv6; hostnames have no prefix
+    try:
+        ip = ipaddress.ip_address(host)
+    except ValueError:
+        return None
+    bits = 24 if ip.version == 4 else 48
+    return str(ipaddress.ip_network(f"{ip}/{bits}", strict=False))
+
+
+def asn_of(geo: Dict) -> Optional[str]:
+    # ip-api style "as" field: "AS14061 DigitalOcean, LLC"
+    value = (geo or {}).get("as") or ""
+    return value.split(" ", 1)[0] or None
+
+
+def iter_host_keys(tls_certs: Iterable[Dict] = (), fingerprints: Iterable[Dict] = (),
+                   online_peers: Iterable[Dict] = (), geo: Optional[Dict[str, Dict]] = None
+                   ) -> Iterator[Tuple[str, str, str]]:
+    """(host, key type, value) for every linking attribute in the stage outputs."""
+    hosts = set()
+
+    for c in tls_certs:
+        hosts.add(c["host"])
+        yield c["host"], "cert_fingerprint", c.get("fingerprint_sha256")
+        yield c["host"], "subject_cn", c.get("subject_cn")
+
+    for fp in fingerprints:
+        hosts.add(fp["host"])
+        yield fp["host"], "banner_hash", fp.get("response_hash_banner")
+
+    for p in online_peers:
+        hosts.add(p["host"])
+        software, _ = parse_version(p.get("version_raw"))
+        yield p["host"], "version", software
+
+    for host in hosts:
+        if geo and host in geo:
+            yield host, "asn", asn_of(geo[host])
+        yield host, "prefix", network_prefix(host)
+
+
+def cluster_operators(host_keys: Iterable[Tuple[str, str, str]], key_types=KEY_TYPES,
+                      max_group: Optional[int] = 50):
+    """Merge hosts that share a linking key.
+
+    Each distinct (key type, value) links all of its hosts to the first
+    one seen. Only unions that joined two clusters are kept as edges, so
+    the edges form a spanning forest explaining every cluster.
+
+    Strong keys (certificate, subject, banner, version) link first. The
+    network keys then only link hosts already in a multi-host cluster, so
+    sharing an ASN or prefix never groups hosts on its own. Network values
+    shared by more than `max_group` hosts (a cloud ASN) would chain
+    unrelated operators together and are skipped.
+    """
+    dsu = DisjointSet()
+    members = defaultdict(set)
+
+    for host, kind, value in host_keys:
+        dsu.add(host)
+        if kind in key_types and value not in IGNORED_VALUES:
+            members[(kind, value)].add(host)
+
+    edges = []
+    skipped = []
+
+    def link(kind, value, hosts):
+        hosts = sorted(hosts)
+        anchor = hosts[0]
+        for h in hosts[1:]:
+            if dsu.union(anchor, h):
+                edges.append((anchor, h, kind, value))
+
+    for (kind, value), hosts in members.items():
+        if kind in STRONG_KEYS and len(hosts) > 1:
+            link(kind, value, hosts)
+
+    strongly_linked = {h for h in dsu.parent if dsu.size[dsu.find(h)] > 1}
+
+    for (kind, value), hosts in members.items():
+        if kind not in NETWORK_KEYS:
+            continue
+        if max_group and len(hosts) > max_group:
+            skipped.append({"via": kind, "value": value, "hosts": len(hosts)})
+            continue
+        hosts = hosts & strongly_linked
+        if len(hosts) > 1:
+            link(kind, value, hosts)
+
+    return dsu, edges, skipped
+
+
+def build_clusters(dsu: DisjointSet, edges) -> List[Dict]:
+    edges_by_root = defaultdict(list)
+    for a, b, kind, value in edges:
+        edges_by_root[dsu.find(a)].append({"a": a, "b": b, "via": kind, "value": value})
+
+    clusters = []
+    for root, hosts in dsu.groups().items():
+        if len(hosts) < 2:
+            continue
+
+        cluster_edges = edges_by_root[root]
+        via = defaultdict(set)
+        for e in cluster_edges:
+            via[e["via"]].add(e["value"])
+
+        clusters.append({
+            "size": len(hosts),
+            "hosts": sorted(hosts),
+            "linked_by": {k: sorted(map(str, v)) for k, v in via.items()},
+            "edges": cluster_edges,
+        })
+
+    clusters.sort(key=lambda c: c["size"], reverse=True)
+    for i, c in enumerate(clusters):
+        c["cluster_id"] = i
+    return clusters
+
+
+def main():
+    p = argparse.ArgumentParser(description="Group servers into likely operators over shared TLS, banner and network keys")
+    p.add_argument("--keys", nargs="+", choices=KEY_TYPES, default=list(KEY_TYPES),
+                   help="key types allowed to link hosts")
+    p.add_argument("--max-group", type=int, default=50,
+                   help="ignore ASN/prefix values shared by more hosts than this (0 = no limit)")
+    args = p.parse_args()
+
+    host_keys = iter_host_keys(
+        tls_certs=iter_records("data/tls_certs/tls_certs.json"),
+        fingerprints=iter_records("data/fingerprints/fingerprints.json"),
+        online_peers=iter_records("data/online_peers/online_peers.json"),
+        geo=load_geo_cache(),
+    )
+
+    dsu, edges, skipped = cluster_operators(host_keys, args.keys, args.max_group)
+    clusters = build_clusters(dsu, edges)
+
+    OUTPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with open(OUTPUT_PATH, "w") as f:
+        json.dump({"clusters": clusters, "skipped_keys": skipped}, f, indent=2)
+
+    clustered = sum(c["size"] for c in clusters)
+    print("\n==============================")
+    print("      OPERATOR CLUSTERS")
+    print("==============================\n")
+    print(f"[+] Hosts: {len(dsu.parent)} ({clustered} in {len(clusters)} multi-host clusters)")
+    print(f"[+] Linking edges: {len(edges)}")
+    print(f"[+] Network keys skipped as too common (>{args.max_group} hosts): {len(skipped)}\n")
+
+    for c in clusters[:10]:
+        links = ", ".join(f"{k}×{len(v)}" for k, v in c["linked_by"].items())
+        print(f"[+] Cluster {c['cluster_id']} → {c['size']} hosts via {links}")
+        for h in c["hosts"][:5]:
+            print(f"    - {h}")
+        print("")
+
+    print(f"[✓] Saved to {OUTPUT_PATH}")
+
+
+if __name__ == "__main__":
+    main()
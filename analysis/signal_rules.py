@@ -0,0 +1,348 @@
+import json
+import operator
+import string
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+from scanner.columnar import parse_cert_time
+
+
+DEFAULT_RULES = Path(__file__).parent / "rules" / "honeypot.json"
+
+
+# derived fields shared by every rule that mentions them; each is
+# computed once per server, before the rules run
+def _tls_cluster_size(plan, fp, tls, values):
+    return plan.tls_clusters[tls["fingerprint_sha256"]] if tls else None
+
+def _behavior_cluster_size(plan, fp, tls, values):
+    return plan.behavior_clusters[fp.get("response_hash_banner")]
+
+def _similar_banner_cluster_size(plan, fp, tls, values):
+    # near-duplicate banner clusters from analysis.similarity; 1 when not clustered
+    return plan.similar_banners.get(f"{fp['host']}:{fp['port']}", 1)
+
+def _cert_times(plan, fp, tls, values):
+    # one certificate date parse shared by the date fields below
+    if not tls:
+        return None, None
+    return _cert_time(tls.get("not_before")), _cert_time(tls.get("not_after"))
+
+def _validity_days(plan, fp, tls, values):
+    not_before, not_after = values["cert_times"]
+    if not_before is None or not_after is None:
+        return None
+    return (not_after - not_before) / 86400
+
+def _expires_year(plan, fp, tls, values):
+    not_after = values["cert_times"][1]
+    return time.gmtime(not_after).tm_year if not_after is not None else None
+
+
+def _cert_time(value):
+    # tls_analyzer writes ISO dates, older records the OpenSSL form
+    dt = parse_cert_time(value)
+    return dt.timestamp() if dt is not None else None
+
+
+def require_yaml():
+    if yaml is None:
+        raise RuntimeError("YAML rule files need pyyaml (pip install pyyaml)")
+
+
+# name -> (function, derived fields it reads); listed in dependency order
+DERIVED = {
+    "has_tls": (lambda plan, fp, tls, values: tls is not None, ()),
+    "tls_cluster_size": (_tls_cluster_size, ()),
+    "behavior_cluster_size": (_behavior_cluster_size, ()),
+    "similar_banner_cluster_size": (_similar_banner_cluster_size, ()),
+    "cert_times": (_cert_times, ()),
+    "tls_validity_days": (_validity_days, ("cert_times",)),
+    "tls_expires_year": (_expires_year, ("cert_times",)),
+}
+
+
+def _compare(op):
+    def check(actual, expected):
+        try:
+            return op(actual, expected)
+        except TypeError:
+            # missing values never satisfy an ordering
+            return False
+    return check
+
+
+OPS = {
+    "<": _compare(operator.lt),
+    "<=": _compare(operator.le),
+    ">": _compare(operator.gt),
+    ">=": _compare(operator.ge),
+    "==": operator.eq,
+    "!=": operator.ne,
+    "in": lambda actual, expected: actual in expected,
+    "not_in": lambda actual, expected: actual not in expected,
+    "contains_any": lambda actual, expected: bool(actual) and isinstance(actual, str)
+                                             and any(s in actual for s in expected),
+    "truthy": lambda actual, expected: bool(actual),
+    "falsy": lambda actual, expected: not actual,
+}
+
+
+class RuleError(ValueError):
+    pass
+
+
+class Rule:
+    __slots__ = ("name", "signal", "predicate", "points", "hits", "evaluated", "ns", "points_total")
+
+    def __init__(self, name, signal, predicate, points):
+        self.name = name
+        self.signal = signal
+        self.predicate = predicate
+        self.points = points
+        self.hits = 0
+        self.evaluated = 0
+        self.ns = 0
+        self.points_total = 0
+
+
+class RuleEngine:
+    """Honeypot signals from a declarative rule file, compiled once.
+
+    Each rule is a condition over fingerprint fields (`latency_ping`),
+    certificate fields (`tls.issuer_cn`) and derived fields (`has_tls`,
+    `tls_cluster_size`, ...), plus a score and a signal name. Compiling
+    turns conditions into closures and collects the derived fields the
+    rules use, so a certificate lookup, cluster-size join or date parse
+    happens once per server however many rules read it. Every rule
+    counts its hits and the time spent evaluating it.
+    """
+
+    def __init__(self, spec: Dict):
+        self.constants = spec.get("constants", {})
+        self.max_score = spec.get("max_score", 100)
+        self.risk_levels = [tuple(level) for level in spec.get("risk_levels", [])]
+        self.default_risk = spec.get("default_risk", "LOW")
+
+        self._fields = set()
+        self.rules = [self._compile_rule(r) for r in spec["rules"] if r.get("enabled", True)]
+        self.derived = self._plan_derived()
+
+        self.tls_clusters: Counter = Counter()
+        self.behavior_clusters: Counter = Counter()
+        self.similar_banners: Dict[str, int] = {}
+        self.shared_ns = 0
+        self.servers = 0
+
+    @classmethod
+    def load(cls, path=DEFAULT_RULES) -> "RuleEngine":
+        path = Path(path)
+        with open(path, "r") as f:
+            if path.suffix in (".yaml", ".yml"):
+                require_yaml()
+                spec = yaml.safe_load(f)
+            else:
+                spec = json.load(f)
+        return cls(spec)
+
+
+    def _value(self, value, rule):
+        if isinstance(value, str) and value.startswith("$"):
+            try:
+                return self.constants[value[1:]]
+            except KeyError:
+                raise RuleError(f"rule {rule}: unknown constant {value}")
+        if isinstance(value, list):
+            return [self._value(v, rule) for v in value]
+        return value
+
+    def _getter(self, field: str) -> Callable:
+        self._fields.add(field)
+        if field in DERIVED:
+            return lambda fp, tls, values: values[field]
+        if field.startswith("tls."):
+            key = field[4:]
+            return lambda fp, tls, values: tls.get(key) if tls else None
+        return lambda fp, tls, values: fp.get(field)
+
+    def _compile_condition(self, cond: Dict, rule: str) -> Callable:
+        if "all" in cond:
+            parts = [self._compile_condition(c, rule) for c in cond["all"]]
+            return lambda fp, tls, values: all(p(fp, tls, values) for p in parts)
+        if "any" in cond:
+            parts = [self._compile_condition(c, rule) for c in cond["any"]]
+            return lambda fp, tls, values: any(p(fp, tls, values) for p in parts)
+        if "not" in cond:
+            inner = self._compile_condition(cond["not"], rule)
+            return lambda fp, tls, values: not inner(fp, tls, values)
+
+        try:
+            op = OPS[cond["op"]]
+        except KeyError:
+            raise RuleError(f"rule {rule}: unknown operator {cond.get('op')!r}")
+
+        get = self._getter(cond["field"])
+        expected = self._value(cond.get("value"), rule)
+        if cond["op"] in ("in", "not_in"):
+            expected = set(expected) if all(isinstance(v, (str, int, type(None))) for v in expected) \
+                else list(expected)
+
+        return lambda fp, tls, values: op(get(fp, tls, values), expected)
+
+    def _compile_points(self, score, rule: str) -> Callable:
+        if isinstance(score, (int, float)):
+            return lambda fp, tls, values: score
+
+        get = self._getter(score["field"])
+        multiply = self._value(score.get("multiply", 1), rule)
+        cap = self._value(score.get("max"), rule)
+
+        def points(fp, tls, values):
+            p = get(fp, tls, values) * multiply
+            return min(p, cap) if cap is not None else p
+        return points
+
+    def _compile_signal(self, template: str) -> Callable:
+        fields = [name for _, name, _, _ in string.Formatter().parse(template) if name]
+        if not fields:
+            return lambda fp, tls, values: template
+
+        getters = {name: self._getter(name) for name in fields}
+        return lambda fp, tls, values: template.format(
+            **{name: get(fp, tls, values) for name, get in getters.items()})
+
+    def _compile_rule(self, spec: Dict) -> Rule:
+        name = spec["name"]
+        return Rule(
+            name,
+            self._compile_signal(spec.get("signal", name)),
+            self._compile_condition(spec["when"], name),
+            self._compile_points(spec.get("score", 0), name),
+        )
+
+    def _plan_derived(self) -> List[Tuple[str, Callable]]:
+        needed = set()
+
+        def need(name):
+            if name in needed:
+                return
+            func, deps = DERIVED[name]
+            for d in deps:
+                need(d)
+            needed.add(name)
+
+        for field in self._fields:
+            if field in DERIVED:
+                need(field)
+
+        return [(name, DERIVED[name][0]) for name in DERIVED if name in needed]
+
+    def uses(self, field: str) -> bool:
+        return any(name == field for name, _ in self.derived)
+
+
+    def prepare(self, fingerprints: List[Dict], tls_entries: Iterable[Dict]) -> Dict[str, Dict]:
+        # indices shared by all servers; only the ones the rules need
+        count_certs = self.uses("tls_cluster_size")
+        tls_by_host = {}
+        self.tls_clusters = Counter()
+        for c in tls_entries:
+            tls_by_host[c["host"]] = c
+            if count_certs:
+                self.tls_clusters[c["fingerprint_sha256"]] += 1
+
+        self.behavior_clusters = Counter(
+            fp.get("response_hash_banner") for fp in fingerprints
+        ) if self.uses("behavior_cluster_size") else Counter()
+
+        if self.uses("similar_banner_cluster_size"):
+            from analysis.similarity import load_similarity_clusters
+            self.similar_banners = load_similarity_clusters("banner")
+
+        return tls_by_host
+
+    def score_server(self, fp: Dict, tls: Optional[Dict]) -> Tuple[int, List[str]]:
+        started = time.perf_counter_ns()
+        values = {}
+        for name, func in self.derived:
+            values[name] = func(self, fp, tls, values)
+        now = time.perf_counter_ns()
+        self.shared_ns += now - started
+        self.servers += 1
+
+        total = 0
+        signals = []
+        for rule in self.rules:
+            rule.evaluated += 1
+            if rule.predicate(fp, tls, values):
+                points = rule.points(fp, tls, values)
+                total += points
+                rule.hits += 1
+                rule.points_total += points
+                signals.append(rule.signal(fp, tls, values))
+
+            end = time.perf_counter_ns()
+            rule.ns += end - now
+            now = end
+
+        return min(total, self.max_score), signals
+
+    def risk(self, score) -> str:
+        for level, threshold in self.risk_levels:
+            if score >= threshold:
+                return level
+        return self.default_risk
+
+    def score_records(self, fingerprints: Iterable[Dict], tls_entries: Iterable[Dict]) -> List[Dict]:
+        fingerprints = list(fingerprints)
+        tls_by_host = self.prepare(fingerprints, tls_entries)
+
+        results = []
+        for fp in fingerprints:
+            score, signals = self.score_server(fp, tls_by_host.get(fp["host"]))
+            results.append({
+                "host": fp["host"],
+                "port": fp["port"],
+                "honeypot_score": score,
+                "risk_level": self.risk(score),
+                "signals": signals,
+            })
+        return results
+
+
+    def stats(self) -> List[Dict]:
+        rows = [{
+            "rule": "(shared lookups)",
+            "evaluated": self.servers,
+            "hits": None,
+            "points": None,
+            "total_ms": round(self.shared_ns / 1e6, 3),
+            "avg_us": round(self.shared_ns / self.servers / 1e3, 3) if self.servers else 0.0,
+        }]
+        for r in self.rules:
+            rows.append({
+                "rule": r.name,
+                "evaluated": r.evaluated,
+                "hits": r.hits,
+                "points": r.points_total,
+                "total_ms": round(r.ns / 1e6, 3),
+                "avg_us": round(r.ns / r.evaluated / 1e3, 3) if r.evaluated else 0.0,
+            })
+        return rows
+
+    def print_stats(self):
+        print("\n==============================")
+        print("        RULE STATISTICS")
+        print("==============================\n")
+        print(f"{'rule':34} {'hits':>8} {'points':>9} {'total ms':>10} {'avg µs':>8}")
+        for s in self.stats():
+            hits = "" if s["hits"] is None else s["hits"]
+            points = "" if s["points"] is None else s["points"]
+            print(f"{s['rule']:34} {hits:>8} {points:>9} {s['total_ms']:>10.2f} {s['avg_us']:>8.2f}")
@@ -0,0 +1,204 @@
+import argparse
+import json
+import re
+import zlib
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from analysis.operator_clusters import DisjointSet
+from scanner.columnar import parse_banner, parse_version
+from scanner.records import iter_records
+
+
+SIMILARITY_PATH = Path("data/similarity/similarity_clusters.json")
+FIELDS = ("banner", "version", "cert")
+
+# 32 bands of 4 rows: pairs above ~0.42 Jaccard collide in some band
+# with high probability, pairs below ~0.2 almost never do
+NUM_PERM = 128
+BANDS = 32
+SHINGLE = 4
+
+# the Mersenne prime 2**31 - 1; with a, b and the shingle hashes all below
+# it, a*x + b stays under 2**63 and never wraps in uint64
+_MERSENNE_31 = 2**31 - 1
+_PRIME = np.uint64(_MERSENNE_31)
+
+
+def normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text.strip().lower())
+
+
+def shingles(text: str, k: int = SHINGLE) -> np.ndarray:
+    text = normalize(text)
+    if len(text) <= k:
+        grams = {text}
+    else:
+        grams = {text[i:i + k] for i in range(len(text) - k + 1)}
+    return np.fromiter((zlib.crc32(g.encode()) % _MERSENNE_31 for g in grams), dtype=np.uint64, count=len(grams))
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, _MERSENNE_31, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, _MERSENNE_31, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        x = shingles(text)
+        # (num_perm, shingles) table of permuted hashes, min per permutation
+        return ((np.outer(self.a, x) + self.b[:, None]) % _PRIME).min(axis=1)
+
+
+def similarity(sig_a: np.ndarray, sig_b: np.ndarray) -> float:
+    # fraction of agreeing minhashes estimates the Jaccard similarity
+    return float(np.mean(sig_a == sig_b))
+
+
+def near_duplicates(docs: Dict[Tuple, str], threshold: float = 0.6, bands: int = BANDS,
+                    hasher: Optional[MinHasher] = None) -> List[Dict]:
+    """Cluster documents whose estimated Jaccard similarity reaches `threshold`.
+
+    Identical texts are collapsed first, so a fleet running a stock
+    banner costs one signature. Unique texts are MinHashed and split into
+    bands; only texts that share a band bucket are compared, which keeps
+    the work close to linear instead of all pairs.
+    """
+    hasher = hasher or MinHasher()
+
+    by_text = defaultdict(list)
+    for key, text in docs.items():
+        if text:
+            by_text[normalize(text)].append(key)
+
+    texts = list(by_text)
+    if not texts:
+        return []
+
+    sigs = np.vstack([hasher.signature(t) for t in texts])
+    rows = sigs.shape[1] // bands
+
+    dsu = DisjointSet()
+    for i in range(len(texts)):
+        dsu.add(i)
+
+    for band in range(bands):
+        buckets = defaultdict(list)
+        chunk = sigs[:, band * rows:(band + 1) * rows]
+        for i, row in enumerate(chunk):
+            buckets[row.tobytes()].append(i)
+
+        for members in buckets.values():
+            if len(members) < 2:
+                continue
+
+            # each text is compared once against one representative per
+            # cluster already in the bucket rather than against every
+            # member, and all of those comparisons are one numpy op
+            reps = [members[0]]
+            for i in members[1:]:
+                roots = [dsu.find(j) for j in reps]
+                if dsu.find(i) in roots:
+                    continue
+                sims = (sigs[reps] == sigs[i]).mean(axis=1)
+                best = int(sims.argmax())
+                if sims[best] >= threshold:
+                    dsu.union(i, reps[best])
+                else:
+                    reps.append(i)
+
+    clusters = []
+    for group in dsu.groups().values():
+        keys = [k for i in group for k in by_text[texts[i]]]
+        if len(keys) < 2 or len(group) < 2:
+            # exact duplicates alone are already caught by the hash clusters
+            continue
+        clusters.append({
+            "size": len(keys),
+            "variants": len(group),
+            "min_similarity_to_first": round(min(similarity(sigs[group[0]], sigs[i]) for i in group[1:]), 3),
+            "members": [{"host": h, "port": p} for h, p in sorted(keys)],
+            "examples": [texts[i] for i in group[:3]],
+        })
+
+    clusters.sort(key=lambda c: c["size"], reverse=True)
+    return clusters
+
+
+def field_documents(online_peers: Iterable[Dict], tls_certs: Iterable[Dict]) -> Dict[str, Dict[Tuple, str]]:
+    # the last record per (host, port) wins
+    docs = {f: {} for f in FIELDS}
+
+    for p in online_peers:
+        key = (p["host"], p["port"])
+        banner = parse_banner(p.get("banner_raw"))
+        if banner:
+            docs["banner"][key] = banner
+        software, protocol = parse_version(p.get("version_raw"))
+        if software:
+            docs["version"][key] = f"{software} {protocol}"
+
+    for c in tls_certs:
+        # full subject and issuer names plus SANs; records from before the
+        # TLS stage parsed the DER only have the CNs, if anything
+        parts = [c.get("subject") or c.get("subject_cn"), c.get("issuer") or c.get("issuer_cn"),
+                 *(c.get("san") or [])]
+        text = " ".join(x for x in parts if x)
+        if text:
+            docs["cert"][(c["host"], c["port"])] = text
+
+    return docs
+
+
+def load_similarity_clusters(field: str, path=SIMILARITY_PATH) -> Dict[str, int]:
+    """host:port -> size of its near-duplicate cluster for one field."""
+    path = Path(path)
+    if not path.exists():
+        return {}
+
+    with open(path, "r") as f:
+        data = json.load(f)
+
+    sizes = {}
+    for c in data.get(field, []):
+        for m in c["members"]:
+            sizes[f"{m['host']}:{m['port']}"] = c["size"]
+    return sizes
+
+
+def main():
+    p = argparse.ArgumentParser(description="Near-duplicate banner, version and certificate clusters (MinHash-LSH)")
+    p.add_argument("--threshold", type=float, default=0.6, help="minimum estimated Jaccard similarity")
+    p.add_argument("--bands", type=int, default=BANDS, help=f"LSH bands over {NUM_PERM} minhashes")
+    args = p.parse_args()
+
+    docs = field_documents(
+        iter_records("data/online_peers/online_peers.json"),
+        iter_records("data/tls_certs/tls_certs.json"),
+    )
+
+    hasher = MinHasher()
+    result = {f: near_duplicates(docs[f], args.threshold, args.bands, hasher) for f in FIELDS}
+
+    SIMILARITY_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with open(SIMILARITY_PATH, "w") as f:
+        json.dump(result, f, indent=2)
+
+    print("\n==============================")
+    print("   NEAR-DUPLICATE CLUSTERS")
+    print("==============================\n")
+    for field in FIELDS:
+        clusters = result[field]
+        print(f"[+] {field}: {len(docs[field])} servers, {len(clusters)} clusters")
+        for c in clusters[:5]:
+            print(f"    - {c['size']} servers, {c['variants']} variants: {c['examples'][0][:70]}")
+        print("")
+
+    print(f"[✓] Saved to {SIMILARITY_PATH}")
+
+
+if __name__ == "__main__":
+    main()
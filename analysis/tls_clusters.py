@@ -2,10 +2,21 @@ import json
 from pathlib import Path
 from collections import defaultdict
 
+from scanner.columnar import iter_stage_records
+from scanner.records import iter_records
 
-def load_tls_certs(path="data/tls_certs/tls_certs.json"):
-    with open(path, "r") as f:
-        return json.load(f)
+
+TLS_PATH = "data/tls_certs/tls_certs.json"
+
+
+# reads the columnar store when it holds the latest scan, otherwise streams
+# tls_certs.ndjson when present and falls back to tls_certs.json
+def iter_tls_certs(path=TLS_PATH):
+    return iter_stage_records("tls_certs") if path == TLS_PATH else iter_records(path)
+
+
+def load_tls_certs(path=TLS_PATH):
+    return list(iter_tls_certs(path))
 
 
 def group_by_fingerprint(certs):
@@ -31,6 +42,22 @@ def group_by_subject(certs):
     return clusters
 
 
+def group_all(certs):
+    # fingerprint, issuer and subject groupings in a single pass over the certs
+    fp_clusters = defaultdict(list)
+    issuer_clusters = defaultdict(list)
+    subject_clusters = defaultdict(list)
+    total = 0
+
+    for c in certs:
+        total += 1
+        fp_clusters[c["fingerprint_sha256"]].append(c)
+        issuer_clusters[c["issuer_cn"] or "UNKNOWN_ISSUER"].append(c)
+        subject_clusters[c["subject_cn"] or "UNKNOWN_SUBJECT"].append(c)
+
+    return total, fp_clusters, issuer_clusters, subject_clusters
+
+
 def save_clusters_to_json(clusters, path):
     formatted = [
         {
@@ -65,27 +92,42 @@ def print_cluster_summary(title, clusters):
             print("")
 
 
-def main():
-    certs = load_tls_certs()
+def print_similarity_summary(path="data/similarity/similarity_clusters.json"):
+    # near-duplicate subject/issuer/SAN groups from analysis/similarity.py, if it ran
+    if not Path(path).exists():
+        return
+
+    with open(path, "r") as f:
+        clusters = json.load(f).get("cert", [])
+
+    print("\n===================================")
+    print("      NEAR-DUPLICATE CERT CLUSTERS")
+    print("===================================\n")
+
+    for c in clusters:
+        print(f"[+] {c['size']} servers, {c['variants']} certificate name variants, e.g. '{c['examples'][0]}'")
+        for m in c["members"][:5]:
+            print(f"    - {m['host']}:{m['port']}")
+        print("")
 
-    print(f"[+] Loaded {len(certs)} certificates")
 
+def main():
     # group by fingerprint, issuer, subject
-    fp_clusters = group_by_fingerprint(certs)
+    total, fp_clusters, issuer_clusters, subject_clusters = group_all(iter_tls_certs())
+
+    print(f"[+] Loaded {total} certificates")
+
     output_dir = Path("data/tls_clusters")
     output_dir.mkdir(parents=True, exist_ok=True)
 
     save_clusters_to_json(fp_clusters, output_dir / "tls_clusters_fingerprint.json")
-
-    issuer_clusters = group_by_issuer(certs)
     save_clusters_to_json(issuer_clusters, output_dir / "tls_clusters_issuer.json")
-
-    subject_clusters = group_by_subject(certs)
     save_clusters_to_json(subject_clusters, output_dir / "tls_clusters_subject.json")
 
     print_cluster_summary("FINGERPRINT", fp_clusters)
     print_cluster_summary("ISSUER", issuer_clusters)
     print_cluster_summary("SUBJECT", subject_clusters)
+    print_similarity_summary()
 
     biggest_fp = max(fp_clusters.items(), key=lambda x: len(x[1]))
     print("\n==============================")
@@ -0,0 +1,149 @@
+import argparse
+import filecmp
+import random
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+from analysis.honeypot_score import score_server, write_scores
+from analysis.honeypot_vector import (FINGERPRINT_COLUMNS, TLS_COLUMNS, fingerprint_columns, score_columns,
+                                      score_records, score_tables, tls_columns, write_score_columns)
+from scanner.columnar import iter_stage_records, load_table, write_columnar
+from scanner.records import ndjson_path
+
+
+ERRORS = ["ok", "ok", "ok", "invalid_json", "connection_failed", None]
+ISSUERS = ["Let's Encrypt", "R3", None, "", "UNKNOWN_ISSUER"]
+SUBJECTS = ["electrum.example.org", "localhost", None, "", "UNKNOWN_SUBJECT"]
+NOT_AFTER = ["Jan  1 00:00:00 2026 GMT", "Mar  3 12:00:00 2035 GMT", "Dec 31 23:59:59 2050 GMT", None]
+
+
+def synthetic(n: int, seed: int = 1):
+    """n fingerprints plus certificates for about a third of their hosts,
+    with hash pools small enough to form clusters of every size."""
+    rng = random.Random(seed)
+    banner_pool = [f"{rng.getrandbits(64):016x}" for _ in range(max(n // 20, 1))] + [None]
+    cert_pool = [f"{rng.getrandbits(128):032x}" for _ in range(max(n // 15, 1))]
+
+    fingerprints = []
+    tls = []
+    for i in range(n):
+        host = f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}"
+        latency = rng.choice([None, 0, rng.uniform(1, 10), rng.uniform(10, 500), rng.uniform(2000, 6000)])
+        fingerprints.append({
+            "host": host,
+            "port": rng.choice([50001, 50002]),
+            "latency_ping": latency,
+            "error_history": rng.choice(ERRORS),
+            "supports_p2wpkh": rng.random() < 0.7,
+            "supports_p2tr": rng.random() < 0.5,
+            "response_hash_banner": rng.choice(banner_pool),
+        })
+
+        if rng.random() < 0.35:
+            tls.append({
+                "host": host,
+                "port": 50002,
+                "fingerprint_sha256": rng.choice(cert_pool),
+                "issuer_cn": rng.choice(ISSUERS),
+                "subject_cn": rng.choice(SUBJECTS),
+                "not_after": rng.choice(NOT_AFTER),
+            })
+
+    return fingerprints, tls
+
+
+def score_rowwise(fingerprints, tls):
+    # the per-record path of analysis.honeypot_score, on in-memory records
+    tls_fps = Counter(c["fingerprint_sha256"] for c in tls)
+    behavior_clusters = {}
+    for fp in fingerprints:
+        behavior_clusters.setdefault(fp["response_hash_banner"], []).append(fp["host"])
+    tls_by_host = {c["host"]: c for c in tls}
+
+    results = []
+    for fp in fingerprints:
+        tls_info = tls_by_host.get(fp["host"])
+        tls_cluster_size = tls_fps.get(tls_info["fingerprint_sha256"], 1) if tls_info else None
+        results.append(score_server(fp, tls_info, tls_cluster_size, behavior_clusters))
+    return results
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def end_to_end_rowwise(root: Path, out: Path):
+    # what `honeypot_score` does with a current store: records as dicts in, dicts out
+    fingerprints = list(iter_stage_records("fingerprints", root=root))
+    tls = list(iter_stage_records("tls_certs", root=root))
+    write_scores(score_rowwise(fingerprints, tls), out)
+
+
+def end_to_end_vectorized(root: Path, out: Path):
+    # what `honeypot_score --vectorized` does: store columns in, result columns out
+    scored = score_tables(load_table("fingerprints", FINGERPRINT_COLUMNS, root=root),
+                          load_table("tls_certs", TLS_COLUMNS, root=root))
+    write_score_columns(scored, out)
+
+
+def same_files(a: Path, b: Path) -> bool:
+    return all(filecmp.cmp(x, y, shallow=False) for x, y in ((a, b), (ndjson_path(a), ndjson_path(b))))
+
+
+def main():
+    p = argparse.ArgumentParser(description="Row-wise vs vectorized honeypot scoring on synthetic data")
+    p.add_argument("--records", type=int, default=1_000_000)
+    p.add_argument("--seed", type=int, default=1)
+    args = p.parse_args()
+
+    print(f"[+] Generating {args.records} synthetic fingerprints...")
+    fingerprints, tls = synthetic(args.records, args.seed)
+    print(f"[+] {len(tls)} certificates")
+
+    rowwise, t_rows = timed(score_rowwise, fingerprints, tls)
+
+    tls_cols, t_tls_cols = timed(tls_columns, tls)
+    fp_cols, t_fp_cols = timed(fingerprint_columns, fingerprints, tls_cols)
+    (scores, masks, _, _), t_score = timed(score_columns, fp_cols, tls_cols)
+
+    vectorized, t_full = timed(score_records, fingerprints, tls)
+
+    same = rowwise == vectorized
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        print("[+] Writing the synthetic scan to a columnar store...")
+        write_columnar("fingerprints", fingerprints, root=tmp / "columnar")
+        write_columnar("tls_certs", tls, root=tmp / "columnar")
+
+        _, t_e2e_rows = timed(end_to_end_rowwise, tmp / "columnar", tmp / "rowwise.json")
+        _, t_e2e_vec = timed(end_to_end_vectorized, tmp / "columnar", tmp / "vectorized.json")
+        same_output = same_files(tmp / "rowwise.json", tmp / "vectorized.json")
+
+    print("\n==============================")
+    print("   HONEYPOT SCORING BENCHMARK")
+    print("==============================\n")
+    print(f"records:                 {args.records}")
+    print(f"row-wise:                {t_rows:8.3f}s")
+    print(f"columns (build once):    {t_fp_cols + t_tls_cols:8.3f}s")
+    print(f"vectorized scoring:      {t_score:8.3f}s  ({t_rows / t_score:.1f}x)")
+    print(f"vectorized + result dicts: {t_full:6.3f}s  ({t_rows / t_full:.1f}x)")
+    print(f"high risk servers:       {int((scores >= 70).sum())}")
+    print(f"results identical:       {same}\n")
+    print("end to end, store to honeypot_scores.json/.ndjson:")
+    print(f"row-wise:                {t_e2e_rows:8.3f}s")
+    print(f"vectorized:              {t_e2e_vec:8.3f}s  ({t_e2e_rows / t_e2e_vec:.1f}x)")
+    print(f"files identical:         {same_output}\n")
+
+    if not same:
+        raise SystemExit("[✗] vectorized scores differ from the row-wise path")
+    if not same_output:
+        raise SystemExit("[✗] vectorized output files differ from the row-wise path")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,381 @@
+import argparse
+import asyncio
+import json
+import random
+import resource
+import shutil
+import ssl
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+MANIFEST_PATH = Path("data/benchmarks/mock_fleet.json")
+
+SSL_PORT = 50002
+TCP_PORT = 50001
+
+SOFTWARE = ["ElectrumX 1.16.0", "ElectrumX 1.18.0", "Fulcrum 1.9.8", "Fulcrum 1.11.1", "electrs/0.10.5"]
+BANNERS = [
+    "Welcome to {name}! ElectrumX {version}",
+    "{name}\nFulcrum {version} - an Electrum server\nDonations: bc1q...",
+    "Welcome to {name} (electrs {version})",
+]
+
+# one fleet-wide "stock" banner the honeypot-like servers all return
+HONEYPOT_BANNER = "Welcome to Electrum server!"
+
+
+def self_signed_cert(directory: Path, name: str, cn: str, days: int) -> Tuple[Path, Path]:
+    cert = directory / f"{name}.pem"
+    key = directory / f"{name}.key"
+
+    try:
+        import datetime
+        from cryptography import x509
+        from cryptography.hazmat.primitives import hashes, serialization
+        from cryptography.hazmat.primitives.asymmetric import ec
+        from cryptography.x509.oid import NameOID
+    except ImportError:
+        if shutil.which("openssl") is None:
+            raise RuntimeError("mock certificates need cryptography (pip install cryptography) or openssl")
+        subprocess.run(
+            ["openssl", "req", "-x509", "-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:prime256v1",
+             "-nodes", "-keyout", str(key), "-out", str(cert), "-days", str(days), "-subj", f"/CN={cn}"],
+            check=True, capture_output=True,
+        )
+        return cert, key
+
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, cn)])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(subject)
+        .issuer_name(subject)
+        .public_key(private_key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now)
+        .not_valid_after(now + datetime.timedelta(days=days))
+        .sign(private_key, hashes.SHA256())
+    )
+    cert.write_bytes(certificate.public_bytes(serialization.Encoding.PEM))
+    key.write_bytes(private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.TraditionalOpenSSL,
+        serialization.NoEncryption(),
+    ))
+    return cert, key
+
+
+def server_context(cert: Path, key: Path) -> ssl.SSLContext:
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ctx.load_cert_chain(cert, key)
+    return ctx
+
+
+def raise_fd_limit():
+    # two listeners per server plus the scanner's connections
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+
+class MockServer:
+    """One fake Electrum server: a loopback address with SSL and TCP
+    listeners and a behavior profile."""
+
+    def __init__(self, index: int, rng: random.Random, honeypot: bool, offline: bool,
+                 latency: Tuple[float, float], drop_rate: float, timeout_rate: float, blackhole: bool = False):
+        self.index = index
+        # every server gets its own 127.0.0.0/8 address, so scanners see
+        # distinct hosts on the standard Electrum ports
+        self.host = f"127.77.{(index + 1) >> 8 & 255}.{(index + 1) & 255}"
+        self.hostname = f"mock-{index:05d}.electrum.test"
+        self.honeypot = honeypot
+        self.offline = offline
+        self.blackhole = blackhole
+        self.drop_rate = drop_rate
+        self.timeout_rate = timeout_rate
+        self.peers: List[List] = []
+        self.cert: Optional[str] = None
+
+        if honeypot:
+            # instant replies, stock banner, no history and no taproot
+            self.latency = (0.0, 2.0)
+            self.software = "ElectrumX 1.16.0"
+            self.banner = HONEYPOT_BANNER
+            self.serves_history = False
+            self.serves_taproot = False
+        else:
+            self.latency = latency
+            self.software = rng.choice(SOFTWARE)
+            self.banner = rng.choice(BANNERS).format(name=self.hostname, version=self.software.split()[-1])
+            self.serves_history = rng.random() > 0.05
+            self.serves_taproot = rng.random() > 0.3
+
+        self.rng = random.Random(rng.getrandbits(32))
+
+    def peer_entry(self) -> List:
+        return [self.host, self.hostname, ["v1.4", f"s{SSL_PORT}", f"t{TCP_PORT}"]]
+
+    def peer_record(self) -> Dict:
+        # the shape of discovery's peers.json, for stages started without a crawl
+        return {"host": self.host, "ssl": SSL_PORT, "tcp": TCP_PORT, "raw": self.peer_entry()}
+
+    def result(self, method: str, params: List):
+        if method == "server.version":
+            return [self.software, "1.4"], None
+        if method == "server.banner":
+            return self.banner, None
+        if method == "server.ping":
+            return None, None
+        if method == "server.peers.subscribe":
+            return self.peers, None
+        if method in ("blockchain.address.get_history", "blockchain.scripthash.get_history"):
+            address = params[0] if params else ""
+            if not self.serves_history:
+                return None, {"code": -32600, "message": "history too large"}
+            if address.startswith("bc1p") and not self.serves_taproot:
+                return None, {"code": 1, "message": f"{address} is not a valid address"}
+            return [{"tx_hash": f"{self.rng.getrandbits(256):064x}", "height": 800000}], None
+        return None, {"code": -32601, "message": f"unknown method \"{method}\""}
+
+    def reply(self, request: Dict) -> Dict:
+        result, error = self.result(request.get("method"), request.get("params") or [])
+        message = {"jsonrpc": "2.0", "id": request.get("id")}
+        if error is not None:
+            message["error"] = error
+        else:
+            message["result"] = result
+        return message
+
+    async def respond(self, line: bytes, writer: asyncio.StreamWriter):
+        roll = self.rng.random()
+        if roll < self.drop_rate:
+            writer.close()
+            return
+        if roll < self.drop_rate + self.timeout_rate:
+            # accept the request and never answer it
+            return
+
+        await asyncio.sleep(self.rng.uniform(*self.latency) / 1000)
+
+        try:
+            request = json.loads(line)
+        except ValueError:
+            writer.write(b'{"jsonrpc": "2.0", "error": {"code": -32700, "message": "parse error"}, "id": null}\n')
+            return
+
+        if isinstance(request, list):
+            payload = [self.reply(r) for r in request if isinstance(r, dict)]
+        else:
+            payload = self.reply(request)
+
+        if not writer.is_closing():
+            writer.write((json.dumps(payload) + "\n").encode())
+
+    async def swallow(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # a filtered port as the scanner sees it: the TLS handshake never completes
+        try:
+            while await reader.read(4096):
+                pass
+        except (OSError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # pipelined requests are answered concurrently, each after its own delay
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.create_task(self.respond(line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks, return_exceptions=True)
+        except (OSError, asyncio.CancelledError):
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+
+class MockFleet:
+    """Thousands of mock Electrum servers on loopback addresses.
+
+    Each online server listens for SSL on 50002 and plain TCP on 50001 of
+    its own 127.77.x.y address and answers the RPCs the scanner sends:
+    server.version, server.banner, server.ping, server.peers.subscribe
+    (a random sample of the fleet) and get_history. Latency, dropped
+    connections and requests that never get an answer are drawn per
+    request from a seeded RNG. A fraction of the fleet behaves like a
+    honeypot (shared long-lived localhost certificate, stock banner,
+    instant replies, no history). A fraction is advertised but offline
+    (connections refused) and a fraction is black-holed: the SSL port
+    accepts and stays silent and the TCP port refuses, which costs a
+    scanner its full connect timeout like a filtered host.
+    """
+
+    def __init__(self, size: int = 1000, seed: int = 1, honeypot_rate: float = 0.1, offline_rate: float = 0.05,
+                 latency: Tuple[float, float] = (20, 200), drop_rate: float = 0.01, timeout_rate: float = 0.01,
+                 peers_per_server: int = 20, cert_pool: int = 16, blackhole_rate: float = 0.0):
+        if size > 65000:
+            raise ValueError("the fleet addresses at most 65000 servers")
+
+        rng = random.Random(seed)
+        self.servers = [
+            MockServer(i, rng, rng.random() < honeypot_rate, rng.random() < offline_rate,
+                       latency, drop_rate, timeout_rate, rng.random() < blackhole_rate)
+            for i in range(size)
+        ]
+        self.seed = seed
+        self.cert_pool = cert_pool
+        self._rng = rng
+        self._listeners: List[asyncio.AbstractServer] = []
+        self._certdir: Optional[tempfile.TemporaryDirectory] = None
+
+        entries = [s.peer_entry() for s in self.servers]
+        for s in self.servers:
+            s.peers = rng.sample(entries, min(peers_per_server, len(entries)))
+
+    @property
+    def online(self) -> List[MockServer]:
+        return [s for s in self.servers if not s.offline and not s.blackhole]
+
+    def _contexts(self) -> Tuple[List[ssl.SSLContext], ssl.SSLContext]:
+        self._certdir = tempfile.TemporaryDirectory(prefix="mock_fleet_")
+        directory = Path(self._certdir.name)
+
+        pool = []
+        for i in range(self.cert_pool):
+            cert, key = self_signed_cert(directory, f"pool{i}", f"electrum{i}.mock.test", 90)
+            pool.append(server_context(cert, key))
+
+        cert, key = self_signed_cert(directory, "honeypot", "localhost", 9000)
+        return pool, server_context(cert, key)
+
+    async def start(self, backlog: int = 128, shard: int = 0, shards: int = 1):
+        # with shards > 1 this process serves every shards-th server, so
+        # several processes can share a fleet too large for one core
+        pool, honeypot_ctx = self._contexts()
+
+        for s in self.servers:
+            if s.blackhole and not s.offline and s.index % shards == shard:
+                self._listeners.append(await asyncio.start_server(s.swallow, s.host, SSL_PORT, backlog=backlog))
+
+        for s in self.online:
+            # certificates are assigned fleet-wide, so every shard agrees on the manifest
+            if s.honeypot:
+                ctx = honeypot_ctx
+                s.cert = "honeypot"
+            else:
+                n = self._rng.randrange(len(pool))
+                ctx = pool[n]
+                s.cert = f"pool{n}"
+
+            if s.index % shards != shard:
+                continue
+            self._listeners.append(await asyncio.start_server(s.handle, s.host, SSL_PORT, ssl=ctx, backlog=backlog))
+            self._listeners.append(await asyncio.start_server(s.handle, s.host, TCP_PORT, backlog=backlog))
+
+    async def stop(self):
+        for listener in self._listeners:
+            listener.close()
+        await asyncio.gather(*(l.wait_closed() for l in self._listeners), return_exceptions=True)
+        self._listeners = []
+        if self._certdir is not None:
+            self._certdir.cleanup()
+
+    def manifest(self) -> Dict:
+        seed = self.online[0]
+        return {
+            "seed": {"host": seed.host, "port": SSL_PORT},
+            "size": len(self.servers),
+            "online": len(self.online),
+            "honeypots": sum(s.honeypot for s in self.online),
+            "blackholed": sum(s.blackhole and not s.offline for s in self.servers),
+            "servers": [
+                {"host": s.host, "hostname": s.hostname, "online": not s.offline and not s.blackhole,
+                 "honeypot": s.honeypot, "cert": s.cert}
+                for s in self.servers
+            ],
+            "peers": [s.peer_record() for s in self.servers],
+        }
+
+
+def add_fleet_args(p):
+    p.add_argument("--servers", type=int, default=1000, help="fleet size")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--honeypot-rate", type=float, default=0.1)
+    p.add_argument("--offline-rate", type=float, default=0.05,
+                   help="share of advertised servers that don't listen")
+    p.add_argument("--blackhole-rate", type=float, default=0.0,
+                   help="share of advertised servers whose SSL port accepts but never answers")
+    p.add_argument("--latency", type=float, nargs=2, default=[20, 200], metavar=("MIN_MS", "MAX_MS"))
+    p.add_argument("--drop-rate", type=float, default=0.01, help="chance a request closes the connection")
+    p.add_argument("--timeout-rate", type=float, default=0.01, help="chance a request is never answered")
+    p.add_argument("--peers-per-server", type=int, default=20)
+    p.add_argument("--cert-pool", type=int, default=16, help="distinct certificates among regular servers")
+
+
+def fleet_from_args(args) -> MockFleet:
+    return MockFleet(
+        size=args.servers,
+        seed=args.seed,
+        honeypot_rate=args.honeypot_rate,
+        offline_rate=args.offline_rate,
+        latency=tuple(args.latency),
+        drop_rate=args.drop_rate,
+        timeout_rate=args.timeout_rate,
+        peers_per_server=args.peers_per_server,
+        cert_pool=args.cert_pool,
+        blackhole_rate=args.blackhole_rate,
+    )
+
+
+async def main():
+    p = argparse.ArgumentParser(description="Serve a fleet of mock Electrum servers on loopback addresses")
+    add_fleet_args(p)
+    p.add_argument("--manifest", type=Path, default=MANIFEST_PATH,
+                   help="where to write the fleet's addresses and peer records")
+    p.add_argument("--shard", default="0/1", metavar="I/N",
+                   help="serve only every N-th server, starting at I (one of N fleet processes)")
+    args = p.parse_args()
+    shard, shards = map(int, args.shard.split("/"))
+
+    limit = raise_fd_limit()
+    if limit < 2 * args.servers + 1024:
+        print(f"[!] Open file limit {limit} is low for {args.servers} servers")
+
+    fleet = fleet_from_args(args)
+    await fleet.start(shard=shard, shards=shards)
+
+    # every shard builds the same fleet; one of them writes it down
+    if shard == 0:
+        args.manifest.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.manifest, "w") as f:
+            json.dump(fleet.manifest(), f, indent=2)
+        print(f"[✓] Manifest saved to {args.manifest}", flush=True)
+
+    print(f"[✓] Fleet ready: {len(fleet.online)}/{len(fleet.servers)} servers online, "
+          f"seed {fleet.online[0].host}:{SSL_PORT}" + (f" (shard {shard}/{shards})" if shards > 1 else ""),
+          flush=True)
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await fleet.stop()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,204 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from benchmarks.mock_fleet import MANIFEST_PATH, SSL_PORT, add_fleet_args, raise_fd_limit
+
+
+STAGES = ("discovery", "validator", "tls", "fingerprint")
+OUTPUT_PATH = Path("data/benchmarks/scanner_throughput.json")
+
+
+def percentile(values: List[float], q: float):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(q * len(values)))], 2)
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def timed(func, latencies: List[float]):
+    # wall time of every per-host probe the stage makes
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            latencies.append((time.perf_counter() - started) * 1000)
+    return wrapper
+
+
+async def run_stage(stage: str, manifest: Dict, concurrency: int, timeout: float, depth: int,
+                    adaptive: bool = False) -> Dict:
+    from scanner.adaptive import AdaptiveController
+    from scanner.executor import BoundedExecutor
+
+    controller = AdaptiveController(timeout=timeout, concurrency=concurrency) if adaptive else None
+    workers = controller.max_concurrency if controller else concurrency
+
+    targets = [{"host": p["host"], "port": SSL_PORT} for p in manifest["peers"]]
+    latencies: List[float] = []
+
+    if stage == "discovery":
+        from scanner.discovery import ElectrumDiscovery
+        crawler = ElectrumDiscovery(timeout=timeout, max_concurrent=concurrency, max_depth=depth,
+                                    stats_interval=3600, adaptive=controller)
+        crawler.connect_and_request = timed(crawler.connect_and_request, latencies)
+        run = crawler.crawl_network(manifest["seed"]["host"], manifest["seed"]["port"])
+        count = lambda results: crawler.hosts_responded
+
+    elif stage == "validator":
+        from scanner.validator import ElectrumValidator
+        validator = ElectrumValidator(timeout=timeout, max_concurrent=concurrency,
+                                      executor=BoundedExecutor(concurrency=workers), adaptive=controller)
+        validator.probe = timed(validator.probe, latencies)
+        run = validator.validate_all(manifest["peers"])
+        count = len
+
+    elif stage == "tls":
+        from scanner.tls_analyzer import TLSAnalyzer
+        analyzer = TLSAnalyzer(timeout=timeout, max_concurrent=concurrency,
+                               executor=BoundedExecutor(concurrency=workers), adaptive=controller)
+        analyzer.fetch_cert = timed(analyzer.fetch_cert, latencies)
+        run = analyzer.analyze_all(targets)
+        count = len
+
+    elif stage == "fingerprint":
+        from scanner.fingerprint import ElectrumFingerprint
+        fp = ElectrumFingerprint(timeout=timeout, max_concurrent=concurrency,
+                                 executor=BoundedExecutor(concurrency=workers), adaptive=controller)
+        fp.fingerprint_server = timed(fp.fingerprint_server, latencies)
+        run = fp.fingerprint_all(targets)
+        count = lambda results: sum(r["error_version"] == "ok" for r in results)
+
+    else:
+        raise ValueError(f"Unknown stage: {stage}")
+
+    rss_before = peak_rss_mb()
+    started = time.perf_counter()
+    # the stages log every connection; only the summary is wanted here
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        results = await run
+    elapsed = time.perf_counter() - started
+
+    return {
+        "stage": stage,
+        "concurrency": concurrency,
+        "adaptive": controller.summary() if controller else None,
+        "probes": len(latencies),
+        "ok": count(results),
+        "elapsed_s": round(elapsed, 3),
+        "hosts_per_sec": round(len(latencies) / elapsed, 1) if elapsed > 0 else 0.0,
+        "p50_ms": percentile(latencies, 0.50),
+        "p99_ms": percentile(latencies, 0.99),
+        "rss_start_mb": rss_before,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def start_fleet(args, shard: str = "0/1") -> subprocess.Popen:
+    cmd = [
+        sys.executable, "-m", "benchmarks.mock_fleet",
+        "--servers", str(args.servers),
+        "--seed", str(args.seed),
+        "--honeypot-rate", str(args.honeypot_rate),
+        "--offline-rate", str(args.offline_rate),
+        "--blackhole-rate", str(args.blackhole_rate),
+        "--latency", *map(str, args.latency),
+        "--drop-rate", str(args.drop_rate),
+        "--timeout-rate", str(args.timeout_rate),
+        "--peers-per-server", str(args.peers_per_server),
+        "--cert-pool", str(args.cert_pool),
+        "--manifest", str(args.manifest),
+        "--shard", shard,
+    ]
+    fleet = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+
+    for line in fleet.stdout:
+        print(line.rstrip())
+        if line.startswith("[✓] Fleet ready"):
+            return fleet
+
+    raise RuntimeError("the mock fleet exited before it was ready")
+
+
+def run_child(stage: str, concurrency: int, args) -> Dict:
+    # a fresh process per stage, so peak RSS belongs to that stage alone
+    cmd = [
+        sys.executable, "-m", "benchmarks.scanner_throughput",
+        "--stage", stage,
+        "--concurrency", str(concurrency),
+        "--timeout", str(args.timeout),
+        "--depth", str(args.depth),
+        "--manifest", str(args.manifest),
+    ]
+    if args.adaptive:
+        cmd.append("--adaptive")
+    out = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    p = argparse.ArgumentParser(description="Scanner stage throughput against a local mock Electrum fleet")
+    add_fleet_args(p)
+    p.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    p.add_argument("--concurrency", type=int, nargs="+", default=[200],
+                   help="one run per value, to compare concurrency levels")
+    p.add_argument("--timeout", type=float, default=2.0, help="scanner connect/request timeout")
+    p.add_argument("--depth", type=int, default=10, help="discovery crawl depth")
+    p.add_argument("--adaptive", action="store_true", help="run the stages with the adaptive controller")
+    p.add_argument("--manifest", type=Path, default=MANIFEST_PATH)
+    p.add_argument("--stage", choices=STAGES, help=argparse.SUPPRESS)
+    args = p.parse_args()
+
+    raise_fd_limit()
+
+    if args.stage:
+        with open(args.manifest, "r") as f:
+            manifest = json.load(f)
+        result = asyncio.run(run_stage(args.stage, manifest, args.concurrency[0], args.timeout, args.depth,
+                                       args.adaptive))
+        print(json.dumps(result))
+        return
+
+    fleet = start_fleet(args)
+    results = []
+    try:
+        for concurrency in args.concurrency:
+            for stage in args.stages:
+                print(f"[+] {stage} (concurrency {concurrency})...")
+                results.append(run_child(stage, concurrency, args))
+    finally:
+        fleet.terminate()
+        fleet.wait()
+
+    OUTPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with open(OUTPUT_PATH, "w") as f:
+        json.dump({"fleet": {"servers": args.servers, "seed": args.seed}, "adaptive": args.adaptive,
+                   "results": results}, f, indent=2)
+
+    print("\n==============================")
+    print("   SCANNER THROUGHPUT BENCHMARK")
+    print("==============================\n")
+    print(f"{'stage':12} {'conc':>5} {'probes':>7} {'ok':>6} {'hosts/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'peak RSS':>9}")
+    for r in results:
+        print(f"{r['stage']:12} {r['concurrency']:>5} {r['probes']:>7} {r['ok']:>6} {r['hosts_per_sec']:>9.1f} "
+              f"{r['p50_ms'] or 0:>8.1f} {r['p99_ms'] or 0:>8.1f} {r['peak_rss_mb']:>7.1f}MB")
+
+    print(f"\n[✓] Saved to {OUTPUT_PATH}")
+
+
+if __name__ == "__main__":
+    main()
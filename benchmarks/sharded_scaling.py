@@ -0,0 +1,152 @@
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict
+
+from benchmarks.mock_fleet import MANIFEST_PATH, add_fleet_args, raise_fd_limit
+from benchmarks.scanner_throughput import start_fleet
+
+
+STAGES = {
+    # stage: (factory, iterator, input)
+    "validator": ("scanner.validator:build_validator", "iter_validate", "peers"),
+    "tls": ("scanner.tls_analyzer:build_analyzer", "iter_analyze", "online"),
+    "fingerprint": ("scanner.fingerprint:build_fingerprint", "iter_fingerprint", "online"),
+}
+INPUT_DIR = Path("data/benchmarks/sharded_input")
+OUTPUT_PATH = Path("data/benchmarks/sharded_scaling.json")
+
+
+def stage_args(concurrency: int, workers: int, uvloop: bool) -> argparse.Namespace:
+    # the options the stage factories read, at their CLI defaults
+    from scanner.adaptive import add_adaptive_args
+    from scanner.canonical import add_hash_args
+    from scanner.executor import add_executor_args
+    from scanner.sharding import add_shard_args
+    from scanner.transport import DEFAULT_POLICY
+
+    p = argparse.ArgumentParser()
+    add_executor_args(p)
+    add_shard_args(p)
+    add_adaptive_args(p)
+    add_hash_args(p)
+    args = p.parse_args([])
+
+    args.max_concurrent = concurrency
+    args.workers = workers
+    args.uvloop = uvloop
+    args.connect_policy = DEFAULT_POLICY
+    args.mode = "session"
+    args.batch = False
+    return args
+
+
+def write_inputs(manifest: Dict, concurrency: int, workers: int, uvloop: bool) -> Dict[str, Path]:
+    INPUT_DIR.mkdir(parents=True, exist_ok=True)
+    inputs = {"peers": INPUT_DIR / "peers.json", "online": INPUT_DIR / "online_peers.json"}
+
+    with open(inputs["peers"], "w") as f:
+        json.dump(manifest["peers"], f)
+
+    # as in the real pipeline, tls and fingerprint only see the servers the
+    # validator found online, so their runs aren't dominated by dead hosts
+    from scanner.sharding import run_sharded
+
+    print("[+] Finding online servers with the validator...")
+    online = []
+    run_sharded(STAGES["validator"][0], STAGES["validator"][1], stage_args(concurrency, workers, uvloop),
+                inputs["peers"], on_result=online.append)
+    print(f"[+] {len(online)} of {len(manifest['peers'])} servers online")
+
+    with open(inputs["online"], "w") as f:
+        json.dump(online, f)
+    return inputs
+
+
+def run_stage(stage: str, inputs: Dict[str, Path], concurrency: int, workers: int, uvloop: bool) -> Dict:
+    from scanner.sharding import run_sharded
+
+    factory, method, source = STAGES[stage]
+    ok = 0
+
+    def count(_):
+        nonlocal ok
+        ok += 1
+
+    started = time.perf_counter()
+    stats = run_sharded(factory, method, stage_args(concurrency, workers, uvloop), inputs[source], on_result=count)
+    elapsed = time.perf_counter() - started
+
+    probed = stats["completed"] - stats["duplicates"]
+    return {
+        "stage": stage,
+        "workers": workers,
+        "uvloop": uvloop,
+        "concurrency": concurrency,
+        "probes": probed,
+        "ok": ok,
+        "elapsed_s": round(elapsed, 3),
+        # wall time includes starting the worker processes
+        "hosts_per_sec": round(probed / elapsed, 1) if elapsed > 0 else 0.0,
+        "shard_elapsed_s": [s["elapsed_s"] for s in stats["shards"]],
+    }
+
+
+def main():
+    p = argparse.ArgumentParser(description="Sharded scanner stages: hosts/sec by worker process count")
+    add_fleet_args(p)
+    p.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="one run per worker count")
+    p.add_argument("--concurrency", type=int, default=400, help="total probes in flight, split across workers")
+    p.add_argument("--fleet-processes", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                   help="processes serving the mock fleet, so it isn't the bottleneck")
+    p.add_argument("--uvloop", action="store_true", help="run the workers' event loops on uvloop")
+    p.add_argument("--manifest", type=Path, default=MANIFEST_PATH)
+    args = p.parse_args()
+
+    if args.uvloop:
+        from scanner.sharding import require_uvloop
+        require_uvloop()
+
+    raise_fd_limit()
+    n = args.fleet_processes
+    fleet = [start_fleet(args, f"{i}/{n}") for i in range(n)]
+
+    results = []
+    try:
+        with open(args.manifest, "r") as f:
+            inputs = write_inputs(json.load(f), args.concurrency, max(args.workers), args.uvloop)
+
+        for stage in args.stages:
+            for workers in args.workers:
+                print(f"[+] {stage} with {workers} worker(s)...")
+                results.append(run_stage(stage, inputs, args.concurrency, workers, args.uvloop))
+    finally:
+        for proc in fleet:
+            proc.terminate()
+            proc.wait()
+
+    OUTPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with open(OUTPUT_PATH, "w") as f:
+        json.dump({"fleet": {"servers": args.servers, "seed": args.seed, "processes": n},
+                   "cpu_count": os.cpu_count(), "results": results}, f, indent=2)
+
+    print("\n==============================")
+    print("    SHARDED SCANNING SCALING")
+    print("==============================\n")
+    print(f"[*] {os.cpu_count()} CPUs, fleet served by {n} process(es)\n")
+    print(f"{'stage':12} {'workers':>7} {'probes':>7} {'ok':>6} {'time s':>8} {'hosts/s':>9} {'speedup':>8}")
+    base = {}
+    for r in results:
+        base.setdefault(r["stage"], r["hosts_per_sec"])
+        speedup = r["hosts_per_sec"] / base[r["stage"]] if base[r["stage"]] else 0.0
+        print(f"{r['stage']:12} {r['workers']:>7} {r['probes']:>7} {r['ok']:>6} {r['elapsed_s']:>8.2f} "
+              f"{r['hosts_per_sec']:>9.1f} {speedup:>7.2f}x")
+
+    print(f"\n[✓] Saved to {OUTPUT_PATH}")
+
+
+if __name__ == "__main__":
+    main()
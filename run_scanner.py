@@ -3,12 +3,20 @@
   python run_scanner.py --flow network
   python run_scanner.py --flow analysis
   python run_scanner.py  # runs both flows (network then analysis)
+  python run_scanner.py --flow network --pipelined  # network flow in one process
+  python run_scanner.py --resume  # continue an interrupted run
+  python run_scanner.py --columnar  # also fill the Parquet scan store (needs pyarrow)
+  python run_scanner.py --history  # append every stage to the scan history database
+  python run_scanner.py --adaptive  # RTT-based timeouts and AIMD concurrency for the probing stages
 
 """
 import argparse
 import subprocess
 import sys
 from pathlib import Path
+from typing import Optional
+
+from scanner.columnar import new_scan_ts
 
 
 FLOWS = {
@@ -16,22 +24,73 @@ FLOWS = {
         Path("scanner/discovery.py"),
         Path("scanner/validator.py"),
         Path("scanner/tls_analyzer.py"),
+        Path("scanner/geoip.py"),
+    ],
+    # discovery -> validation -> TLS capture in one process, the certificate
+    # read off the validation connection; writes the same files as "network"
+    "network-pipelined": [
+        Path("scanner/pipeline.py"),
+        Path("scanner/geoip.py"),
     ],
     "analysis": [
         Path("scanner/fingerprint.py"),
+        Path("analysis/similarity.py"),
         Path("analysis/tls_clusters.py"),
+        Path("analysis/operator_clusters.py"),
         Path("analysis/honeypot_score.py"),
     ],
 }
 
 
-def run_script(path: Path) -> None:
+# stages that keep a checkpoint journal and accept --resume
+RESUMABLE = {
+    Path("scanner/validator.py"),
+    Path("scanner/tls_analyzer.py"),
+    Path("scanner/fingerprint.py"),
+}
+
+# stages that can also write their results to the columnar scan store
+# and append them to the scan history database
+COLUMNAR = RESUMABLE | {
+    Path("scanner/discovery.py"),
+    Path("scanner/pipeline.py"),
+}
+
+# stages that open connections and accept --adaptive
+ADAPTIVE = COLUMNAR
+
+# stages that can split their targets across worker processes
+SHARDABLE = RESUMABLE
+
+
+def run_script(path: Path, resume: bool = False, columnar: bool = False, history: bool = False,
+               scan_id: Optional[str] = None, adaptive: bool = False, workers: int = 1,
+               uvloop: bool = False) -> None:
     if not path.exists():
         print(f"[!] Script not found: {path}")
         raise SystemExit(1)
 
+    # run as a module so the stages can import the shared scanner package
+    module = ".".join(path.with_suffix("").parts)
+
     print(f"\n--- Running: {path} ---")
-    cmd = [sys.executable, str(path)]
+    cmd = [sys.executable, "-m", module]
+    if resume and path in RESUMABLE:
+        cmd.append("--resume")
+    if path in COLUMNAR:
+        if columnar:
+            cmd.append("--columnar")
+        if history:
+            cmd.append("--history")
+        if scan_id:
+            cmd += ["--scan-id", scan_id]
+    if adaptive and path in ADAPTIVE:
+        cmd.append("--adaptive")
+    if path in SHARDABLE:
+        if workers > 1:
+            cmd += ["--workers", str(workers)]
+        if uvloop:
+            cmd.append("--uvloop")
     try:
         subprocess.run(cmd, check=True)
     except subprocess.CalledProcessError as e:
@@ -39,26 +98,45 @@ def run_script(path: Path) -> None:
         raise
 
 
-def run_flow(name: str) -> None:
+def run_flow(name: str, resume: bool = False, columnar: bool = False, history: bool = False,
+             scan_id: Optional[str] = None, adaptive: bool = False, workers: int = 1, uvloop: bool = False) -> None:
     scripts = FLOWS.get(name)
     if not scripts:
         print(f"Unknown flow: {name}")
         raise SystemExit(1)
 
     for s in scripts:
-        run_script(s)
+        run_script(s, resume, columnar, history, scan_id, adaptive, workers, uvloop)
 
 
 def main():
     p = argparse.ArgumentParser(description="Run scanner workflows in order")
     p.add_argument("--flow", choices=["network", "analysis", "all"], default="all")
+    p.add_argument("--pipelined", action="store_true",
+                   help="run the network flow as a single in-process pipeline")
+    p.add_argument("--resume", action="store_true",
+                   help="skip work finished by an interrupted run and merge with its partial results")
+    p.add_argument("--columnar", action="store_true",
+                   help="also write stage results to the Parquet scan store under data/columnar")
+    p.add_argument("--history", action="store_true",
+                   help="append stage results to the scan history database under one scan id")
+    p.add_argument("--adaptive", action="store_true",
+                   help="derive timeouts from observed RTTs and adjust concurrency while probing")
+    p.add_argument("--workers", type=int, default=1,
+                   help="worker processes for the validator, TLS and fingerprint stages")
+    p.add_argument("--uvloop", action="store_true", help="run those stages' event loops on uvloop")
     args = p.parse_args()
 
+    # every stage of this run stores its results under the same scan id
+    scan_id = new_scan_ts() if args.columnar or args.history else None
+
     if args.flow in ("network", "all"):
-        run_flow("network")
+        run_flow("network-pipelined" if args.pipelined else "network", args.resume, args.columnar, args.history,
+                 scan_id, args.adaptive, args.workers, args.uvloop)
 
     if args.flow in ("analysis", "all"):
-        run_flow("analysis")
+        run_flow("analysis", args.resume, args.columnar, args.history, scan_id, args.adaptive, args.workers,
+                 args.uvloop)
 
     print("\n[✓] Run complete.")
 
@@ -0,0 +1,303 @@
+import asyncio
+import ipaddress
+from collections import deque
+from typing import Deque, Dict, Iterable, Optional, Tuple
+
+from scanner.geoip import load_geo_cache
+from scanner.transport import DEFAULT_POLICY, ConnectError, ElectrumConnection, Reply
+
+
+# below this many samples an estimate is not trusted yet
+MIN_SAMPLES = 3
+
+
+class RTTEstimate:
+    """Smoothed RTT and variance, updated like TCP's retransmission timer
+    (RFC 6298): timeout = srtt + 4 * rttvar."""
+
+    __slots__ = ("srtt", "rttvar", "samples")
+
+    def __init__(self):
+        self.srtt: Optional[float] = None
+        self.rttvar = 0.0
+        self.samples = 0
+
+    def update(self, rtt_ms: float):
+        if self.srtt is None:
+            self.srtt = rtt_ms
+            self.rttvar = rtt_ms / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt_ms)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt_ms
+        self.samples += 1
+
+    def timeout_ms(self) -> float:
+        return self.srtt + 4 * self.rttvar
+
+
+def host_group(host: str) -> Optional[str]:
+    # /24 or /48 of an address; hostnames have no group until resolved
+    try:
+        ip = ipaddress.ip_address(host)
+    except ValueError:
+        return None
+    bits = 24 if ip.version == 4 else 48
+    return str(ipaddress.ip_network(f"{ip}/{bits}", strict=False))
+
+
+class AdaptiveLimiter:
+    """Semaphore whose capacity can change while tasks hold it."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    async def __aenter__(self):
+        while self.active >= self.limit:
+            fut = asyncio.get_running_loop().create_future()
+            self._waiters.append(fut)
+            try:
+                await fut
+            finally:
+                if fut in self._waiters:
+                    self._waiters.remove(fut)
+        self.active += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        self.active -= 1
+        self._wake()
+
+    def resize(self, limit: int):
+        self.limit = limit
+        self._wake()
+
+    def _wake(self):
+        free = self.limit - self.active
+        while free > 0 and self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                free -= 1
+
+
+class AdaptiveController:
+    """Timeouts from observed RTTs and AIMD concurrency for one scan.
+
+    Connect timeouts come from a running estimate of connect times for
+    the host, then its network group (an ASN when `groups` maps hosts
+    to one, otherwise the /24 or /48), so a dead host in a known network
+    costs less than the fixed timeout. A group estimate alone never goes
+    below half the fixed timeout, and a host with neither gets the full
+    timeout, so a slow server seen for the first time isn't marked
+    offline. Request timeouts likewise stay at the fixed timeout until
+    the host has answered a few times.
+
+    Concurrency grows by `increase` after every window of outcomes and
+    is cut by `decrease` when the window's failure rate jumps above the
+    scan's running failure rate. Dead hosts fail at any concurrency and
+    only raise the baseline; a spike means the scanner is overloading
+    the network or the event loop.
+    """
+
+    def __init__(self, timeout: float = 4, min_timeout: float = 0.5, max_timeout: float = 10,
+                 concurrency: int = 200, min_concurrency: int = 10, max_concurrency: int = 1000,
+                 window: int = 50, increase: int = 10, decrease: float = 0.7, tolerance: float = 0.1,
+                 groups: Optional[Dict[str, str]] = None):
+        self.timeout = timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.window = window
+        self.increase = increase
+        self.decrease = decrease
+        self.tolerance = tolerance
+        self.groups = groups or {}
+
+        self.limiter = AdaptiveLimiter(concurrency)
+
+        self.connect_rtt: Dict[Optional[Tuple[str, str]], RTTEstimate] = {}
+        self.reply_rtt: Dict[str, RTTEstimate] = {}
+
+        self._outcomes = 0
+        self._failures = 0
+        self.baseline: Optional[float] = None
+        self.outcomes = {"ok": 0, "timeout": 0, "error": 0}
+        self.adjustments = {"increase": 0, "decrease": 0}
+        self.peak_concurrency = concurrency
+
+    @property
+    def concurrency(self) -> int:
+        return self.limiter.limit
+
+    def group(self, host: str) -> Optional[str]:
+        return self.groups.get(host) or host_group(host)
+
+    def _estimate(self, table: Dict, key) -> RTTEstimate:
+        est = table.get(key)
+        if est is None:
+            est = table[key] = RTTEstimate()
+        return est
+
+    def _clamp(self, ms: float) -> float:
+        return min(self.max_timeout, max(self.min_timeout, ms / 1000))
+
+
+    def _keys(self, host: str):
+        keys = [("host", host)]
+        group = self.group(host)
+        if group is not None:
+            keys.append(("group", group))
+        return keys
+
+    def connect_timeout(self, host: str) -> float:
+        est = self.connect_rtt.get(("host", host))
+        if est is not None and est.samples >= MIN_SAMPLES:
+            return self._clamp(est.timeout_ms())
+
+        # a fast ASN doesn't make an unseen host on it fast, so the group
+        # estimate never cuts below half the fixed timeout
+        group = self.group(host)
+        est = self.connect_rtt.get(("group", group)) if group is not None else None
+        if est is not None and est.samples >= MIN_SAMPLES:
+            return max(self._clamp(est.timeout_ms()), self.timeout / 2)
+
+        # nothing known about this host; the scan-wide estimate says
+        # nothing about how slow it may be
+        return self.timeout
+
+    def request_timeout(self, host: str) -> float:
+        est = self.reply_rtt.get(host)
+        if est is not None and est.samples >= MIN_SAMPLES:
+            # a server that answered before gets twice its usual reply time
+            return self._clamp(2 * est.timeout_ms())
+        return self.timeout
+
+    def observe_connect(self, host: str, ms: Optional[float]):
+        if ms is None:
+            return
+        for key in self._keys(host) + [None]:
+            self._estimate(self.connect_rtt, key).update(ms)
+
+    def observe_reply(self, host: str, ms: Optional[float]):
+        if ms is not None:
+            self._estimate(self.reply_rtt, host).update(ms)
+
+
+    def record(self, outcome: str):
+        self.outcomes[outcome] += 1
+        self._outcomes += 1
+        if outcome != "ok":
+            self._failures += 1
+
+        if self._outcomes < self.window:
+            return
+
+        rate = self._failures / self._outcomes
+        self._outcomes = self._failures = 0
+
+        if self.baseline is None:
+            self.baseline = rate
+            return
+
+        if rate > self.baseline + self.tolerance:
+            limit = max(self.min_concurrency, int(self.limiter.limit * self.decrease))
+            self.adjustments["decrease"] += 1
+        else:
+            limit = min(self.max_concurrency, self.limiter.limit + self.increase)
+            self.adjustments["increase"] += 1
+
+        # the baseline follows slowly, so a steady share of dead hosts is absorbed
+        self.baseline = 0.8 * self.baseline + 0.2 * rate
+        self.peak_concurrency = max(self.peak_concurrency, limit)
+        self.limiter.resize(limit)
+
+    def record_replies(self, host: str, replies: Iterable[Reply]):
+        outcome = "ok"
+        for r in replies:
+            if r.ok:
+                self.observe_reply(host, r.latency_ms)
+            elif r.error == "timeout":
+                outcome = "timeout"
+        self.record(outcome)
+
+    def record_connect_error(self, e: ConnectError):
+        errors = (e.ssl_error, e.tcp_error)
+        timed_out = any(isinstance(err, asyncio.TimeoutError) for err in errors)
+        self.record("timeout" if timed_out else "error")
+
+    async def open(self, host: str, port: int, policy: str = DEFAULT_POLICY,
+                   tcp_port: int = 50001) -> ElectrumConnection:
+        try:
+            conn = await ElectrumConnection.open(host, port, timeout=self.connect_timeout(host), tcp_port=tcp_port,
+                                                 policy=policy, request_timeout=self.request_timeout(host))
+        except ConnectError as e:
+            self.record_connect_error(e)
+            raise
+        self.observe_connect(host, conn.connect_ms)
+        return conn
+
+
+    def summary(self) -> Dict:
+        est = self.connect_rtt.get(None)
+        return {
+            "concurrency": self.concurrency,
+            "peak_concurrency": self.peak_concurrency,
+            "adjustments": dict(self.adjustments),
+            "outcomes": dict(self.outcomes),
+            "connect_timeout_s": round(self._clamp(est.timeout_ms()), 3) if est and est.samples else None,
+            "hosts_with_reply_estimate": sum(e.samples >= MIN_SAMPLES for e in self.reply_rtt.values()),
+        }
+
+    def print_summary(self):
+        print_adaptive_summary(self.summary())
+
+
+def print_adaptive_summary(s: Dict, label: str = "Adaptive control"):
+    print(f"[✓] {label}: concurrency {s['concurrency']} (peak {s['peak_concurrency']}, "
+          f"+{s['adjustments']['increase']}/-{s['adjustments']['decrease']}), "
+          f"connect timeout {s['connect_timeout_s']}s, outcomes {s['outcomes']}")
+
+
+def add_adaptive_args(p):
+    p.add_argument("--adaptive", action="store_true",
+                   help="derive timeouts from observed RTTs and adjust concurrency (AIMD)")
+    p.add_argument("--min-timeout", type=float, default=0.5, help="adaptive timeout floor (s)")
+    p.add_argument("--max-timeout", type=float, default=10.0,
+                   help="adaptive timeout ceiling (s) for hosts with RTT samples; others get the fixed timeout")
+    p.add_argument("--max-concurrency", type=int, default=1000,
+                   help="ceiling the adaptive controller may raise concurrency to")
+
+
+def load_asn_groups() -> Dict[str, str]:
+    # ip-api style geo cache: {"1.2.3.4": {"as": "AS14061 DigitalOcean, LLC", ...}}
+    groups = {}
+    for host, info in load_geo_cache().items():
+        asn = ((info or {}).get("as") or "").split(" ", 1)[0]
+        if asn:
+            groups[host] = asn
+    return groups
+
+
+def adaptive_from_args(args, timeout: float = 4, concurrency: int = 200) -> Optional[AdaptiveController]:
+    if not args.adaptive:
+        return None
+    concurrency = getattr(args, "max_concurrent", concurrency)
+    return AdaptiveController(
+        timeout=timeout,
+        min_timeout=args.min_timeout,
+        max_timeout=args.max_timeout,
+        concurrency=concurrency,
+        max_concurrency=max(args.max_concurrency, concurrency),
+        groups=load_asn_groups(),
+    )
+
+
+async def open_connection(adaptive: Optional[AdaptiveController], host: str, port: int, timeout: float,
+                          policy: str = DEFAULT_POLICY, tcp_port: int = 50001) -> ElectrumConnection:
+    # stages call this in place of ElectrumConnection.open; fixed timeouts without a controller
+    if adaptive is None:
+        return await ElectrumConnection.open(host, port, timeout=timeout, tcp_port=tcp_port, policy=policy)
+    return await adaptive.open(host, port, policy, tcp_port)
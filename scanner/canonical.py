@@ -0,0 +1,80 @@
+import hashlib
+import json
+from typing import Any, Dict, Optional
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+
+HASH_ALGORITHMS = ("sha256", "blake2b", "xxh3")
+# sha256 keeps new hashes comparable with stored fingerprints; the 64-bit
+# digests are opt-in
+DEFAULT_HASH = "sha256"
+
+# envelope fields that change per request, not per server
+ENVELOPE_FIELDS = ("id", "jsonrpc")
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        # padding, trailing newlines and CRLF vs LF say nothing about the server
+        return " ".join(value.split())
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def canonical_bytes(response: Optional[Dict]) -> Optional[bytes]:
+    """One byte form per logical reply: no id/jsonrpc, sorted keys,
+    compact separators and collapsed whitespace inside strings."""
+    if response is None:
+        return None
+    if isinstance(response, dict):
+        response = {k: v for k, v in response.items() if k not in ENVELOPE_FIELDS}
+    return json.dumps(_normalize(response), sort_keys=True, separators=(",", ":"),
+                      ensure_ascii=False).encode()
+
+
+def canonical_raw(raw: Optional[str]) -> Optional[bytes]:
+    # for stored *_raw text; replies that aren't JSON fall back to their whitespace-collapsed text
+    if not raw:
+        return None
+    try:
+        return canonical_bytes(json.loads(raw))
+    except ValueError:
+        return " ".join(raw.split()).encode()
+
+
+def stable_hash(data: Optional[bytes], algorithm: str = DEFAULT_HASH) -> Optional[str]:
+    """64-bit blake2b or xxh3 digests for clustering, sha256 when a
+    collision-resistant digest is wanted. Prefixed unless sha256, so
+    hashes of different algorithms never compare equal."""
+    if data is None:
+        return None
+    if algorithm == "blake2b":
+        return "b2:" + hashlib.blake2b(data, digest_size=8).hexdigest()
+    if algorithm == "xxh3":
+        if xxhash is None:
+            raise RuntimeError("xxh3 hashing needs xxhash (pip install xxhash)")
+        return "xx3:" + xxhash.xxh3_64_hexdigest(data)
+    if algorithm == "sha256":
+        return hashlib.sha256(data).hexdigest()
+    raise ValueError(f"Unknown hash algorithm: {algorithm}")
+
+
+def response_hash(response: Optional[Dict], algorithm: str = DEFAULT_HASH) -> Optional[str]:
+    return stable_hash(canonical_bytes(response), algorithm)
+
+
+def raw_hash(raw: Optional[str], algorithm: str = DEFAULT_HASH) -> Optional[str]:
+    return stable_hash(canonical_raw(raw), algorithm)
+
+
+def add_hash_args(p):
+    p.add_argument("--hash", choices=HASH_ALGORITHMS, default=DEFAULT_HASH, dest="hash_algorithm",
+                   help="digest for canonical response hashes (default sha256; blake2b/xxh3: faster "
+                        "64-bit digests for clustering, not comparable with sha256 data)")
@@ -0,0 +1,394 @@
+import argparse
+import json
+import ssl
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.fs as pafs
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+from scanner.canonical import raw_hash
+from scanner.peers import PeerRecord
+from scanner.records import PathLike, iter_records, ndjson_path
+from scanner.timing import PHASES
+
+
+COLUMNAR_DIR = Path("data/columnar")
+SCAN_TS_FORMAT = "%Y%m%dT%H%M%SZ"
+
+# stage table -> JSON output it mirrors
+STAGE_OUTPUTS = {
+    "peers": "data/peers/peers.json",
+    "online_peers": "data/online_peers/online_peers.json",
+    "fingerprints": "data/fingerprints/fingerprints.json",
+    "tls_certs": "data/tls_certs/tls_certs.json",
+}
+
+PROBE_NAMES = ("version", "banner", "ping", "history")
+
+
+def require_pyarrow():
+    if pa is None:
+        raise RuntimeError("the columnar store needs pyarrow (pip install pyarrow)")
+
+
+def _schemas() -> Dict[str, "pa.Schema"]:
+    hashes = [(f"response_hash_{n}", pa.string()) for n in PROBE_NAMES]
+    errors = [(f"error_{n}", pa.string()) for n in PROBE_NAMES]
+    latencies = [(f"latency_{n}", pa.float64()) for n in PROBE_NAMES]
+    phases = [(phase, pa.float64()) for phase in PHASES]
+
+    return {
+        "peers": pa.schema([
+            ("host", pa.string()),
+            ("ip", pa.string()),
+            ("hostname", pa.string()),
+            ("ssl_port", pa.int32()),
+            ("tcp_port", pa.int32()),
+            ("version", pa.string()),
+            ("pruning", pa.int64()),
+            ("features", pa.list_(pa.string())),
+        ]),
+        "online_peers": pa.schema([
+            ("host", pa.string()),
+            ("port", pa.int32()),
+            ("tcp_port", pa.int32()),
+            ("protocol", pa.string()),
+            ("connect_ms", pa.float64()),
+            ("latency_ms", pa.float64()),
+            *phases,
+            ("server_software", pa.string()),
+            ("protocol_version", pa.string()),
+            ("banner", pa.string()),
+            ("version_raw", pa.string()),
+            ("banner_raw", pa.string()),
+            ("version_hash", pa.string()),
+            ("banner_hash", pa.string()),
+        ]),
+        "fingerprints": pa.schema([
+            ("host", pa.string()),
+            ("port", pa.int32()),
+            ("protocol", pa.string()),
+            ("connect_ms", pa.float64()),
+            *latencies,
+            *phases,
+            ("supports_p2pkh", pa.bool_()),
+            ("supports_p2wpkh", pa.bool_()),
+            ("supports_p2tr", pa.bool_()),
+            *errors,
+            *hashes,
+            ("hash_algorithm", pa.string()),
+            ("canonical_version", pa.string()),
+            ("canonical_banner", pa.string()),
+            ("canonical_ping", pa.string()),
+        ]),
+        "tls_certs": pa.schema([
+            ("host", pa.string()),
+            ("port", pa.int32()),
+            ("fingerprint_sha256", pa.string()),
+            ("subject_cn", pa.string()),
+            ("issuer_cn", pa.string()),
+            ("subject", pa.string()),
+            ("issuer", pa.string()),
+            ("san", pa.list_(pa.string())),
+            ("not_before", pa.timestamp("s", tz="UTC")),
+            ("not_after", pa.timestamp("s", tz="UTC")),
+            *phases,
+        ]),
+    }
+
+
+_SCHEMAS = None
+
+def schema(table: str) -> "pa.Schema":
+    global _SCHEMAS
+    require_pyarrow()
+    if _SCHEMAS is None:
+        _SCHEMAS = _schemas()
+    return _SCHEMAS[table]
+
+
+# raw reply parsing, done once here instead of in every notebook
+def _rpc_result(raw: Optional[str]):
+    if not raw:
+        return None
+    try:
+        return json.loads(raw).get("result")
+    except (ValueError, AttributeError):
+        return None
+
+
+def compact_raw(raw: Optional[str]) -> Optional[str]:
+    # some servers pad replies with hundreds of spaces
+    if raw is None:
+        return None
+    try:
+        return json.dumps(json.loads(raw), separators=(",", ":"))
+    except ValueError:
+        return raw.strip()
+
+
+def parse_version(version_raw: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    result = _rpc_result(version_raw)
+    if isinstance(result, list) and len(result) >= 2:
+        return str(result[0]), str(result[1])
+    return None, None
+
+
+def parse_banner(banner_raw: Optional[str]) -> Optional[str]:
+    result = _rpc_result(banner_raw)
+    return result.strip() if isinstance(result, str) else None
+
+
+def parse_cert_time(value: Optional[str]) -> Optional[datetime]:
+    # tls_analyzer writes ISO dates; older records may carry the OpenSSL form
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value)
+        return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt
+    except ValueError:
+        pass
+    try:
+        return datetime.fromtimestamp(ssl.cert_time_to_seconds(value), tz=timezone.utc)
+    except ValueError:
+        return None
+
+
+def _peer_row(r: Dict) -> Dict:
+    # older peers.json files carry wrong ports; they are re-parsed from "raw"
+    peer = PeerRecord.from_record(r)
+    raw = peer.raw
+    features = raw[2] if len(raw) > 2 and isinstance(raw[2], list) else []
+    return {
+        "host": peer.host,
+        "ip": raw[0] if len(raw) > 0 else None,
+        "hostname": raw[1] if len(raw) > 1 else None,
+        "ssl_port": peer.ssl,
+        "tcp_port": peer.tcp,
+        "version": peer.version,
+        "pruning": peer.pruning,
+        "features": [str(f) for f in features],
+    }
+
+
+def _online_row(r: Dict) -> Dict:
+    software, protocol_version = parse_version(r.get("version_raw"))
+    return {
+        **r,
+        "server_software": software,
+        "protocol_version": protocol_version,
+        "banner": parse_banner(r.get("banner_raw")),
+        "version_raw": compact_raw(r.get("version_raw")),
+        "banner_raw": compact_raw(r.get("banner_raw")),
+        # records from before canonical hashing get theirs from the stored text
+        "version_hash": r.get("version_hash") or raw_hash(r.get("version_raw")),
+        "banner_hash": r.get("banner_hash") or raw_hash(r.get("banner_raw")),
+    }
+
+
+def _cert_row(r: Dict) -> Dict:
+    return {
+        **r,
+        "not_before": parse_cert_time(r.get("not_before")),
+        "not_after": parse_cert_time(r.get("not_after")),
+    }
+
+
+ROW_BUILDERS = {
+    "peers": _peer_row,
+    "online_peers": _online_row,
+    "fingerprints": dict,
+    "tls_certs": _cert_row,
+}
+
+
+def new_scan_ts() -> str:
+    return datetime.now(timezone.utc).strftime(SCAN_TS_FORMAT)
+
+
+class ColumnarWriter:
+    """Writes one stage's records to a Parquet partition of the scan store.
+
+    Each run becomes data/columnar/<table>/scan_ts=<timestamp>/part-0.parquet,
+    so runs accumulate side by side and readers select one or all of them.
+    Records are buffered and written as row groups of `batch_size` rows.
+    """
+
+    def __init__(self, table: str, scan_ts: Optional[str] = None,
+                 root: PathLike = COLUMNAR_DIR, batch_size: int = 10000):
+        self.table = table
+        self.schema = schema(table)
+        self.scan_ts = scan_ts or new_scan_ts()
+        self.path = Path(root) / table / f"scan_ts={self.scan_ts}" / "part-0.parquet"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+        self.count = 0
+
+        self._row = ROW_BUILDERS[table]
+        self._rows: List[Dict] = []
+        self._writer = pq.ParquetWriter(self.path, self.schema, compression="zstd")
+
+    def write(self, record: Dict):
+        self._rows.append(self._row(record))
+        self.count += 1
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def write_many(self, records: Iterable[Dict]):
+        for r in records:
+            self.write(r)
+
+    def flush(self):
+        if self._rows:
+            self._writer.write_table(pa.Table.from_pylist(self._rows, schema=self.schema))
+            self._rows = []
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_columnar(table: str, records: Iterable[Dict], scan_ts: Optional[str] = None,
+                   root: PathLike = COLUMNAR_DIR) -> Path:
+    with ColumnarWriter(table, scan_ts=scan_ts, root=root) as out:
+        out.write_many(records)
+    print(f"[✓] {table}: {out.count} rows → {out.path}")
+    return out.path
+
+
+def add_columnar_args(p):
+    p.add_argument("--columnar", action="store_true",
+                   help="also write the results to the columnar scan store (needs pyarrow)")
+
+
+def scan_dataset(table: str, root: PathLike = COLUMNAR_DIR) -> "ds.Dataset":
+    require_pyarrow()
+    return ds.dataset(
+        str(Path(root) / table),
+        schema=schema(table).append(pa.field("scan_ts", pa.string())),
+        format="parquet",
+        partitioning="hive",
+        filesystem=pafs.LocalFileSystem(use_mmap=True),
+    )
+
+
+def list_scans(table: str, root: PathLike = COLUMNAR_DIR) -> List[str]:
+    base = Path(root) / table
+    if not base.exists():
+        return []
+    return sorted(p.name.split("=", 1)[1] for p in base.glob("scan_ts=*") if p.is_dir())
+
+
+def load_table(table: str, columns: Optional[Sequence[str]] = None, scan: Optional[str] = "latest",
+               root: PathLike = COLUMNAR_DIR) -> "pa.Table":
+    """Load a stage table from the store, reading only the given columns.
+
+    scan="latest" reads the newest run, a timestamp selects one run and
+    None reads every run, with the scan_ts column telling them apart.
+    The files are memory-mapped; .to_pandas() on the result gives a
+    DataFrame for the notebooks.
+    """
+    dataset = scan_dataset(table, root)
+
+    if scan == "latest":
+        scans = list_scans(table, root)
+        if not scans:
+            return dataset.schema.empty_table().select(list(columns) if columns else dataset.schema.names)
+        scan = scans[-1]
+
+    flt = ds.field("scan_ts") == scan if scan is not None else None
+    return dataset.to_table(columns=list(columns) if columns else None, filter=flt)
+
+
+def store_is_current(table: str, root: PathLike = COLUMNAR_DIR) -> bool:
+    """True when the newest scan in the store is at least as recent as the
+    stage's JSON/NDJSON output. The store is only written with --columnar,
+    so it can lag behind."""
+    if pa is None:
+        return False
+    scans = list_scans(table, root)
+    if not scans:
+        return False
+
+    parts = (Path(root) / table / f"scan_ts={scans[-1]}").glob("*.parquet")
+    written = max((p.stat().st_mtime for p in parts), default=0)
+    outputs = (Path(STAGE_OUTPUTS[table]), ndjson_path(STAGE_OUTPUTS[table]))
+    return all(written >= p.stat().st_mtime for p in outputs if p.exists())
+
+
+def _json_value(value):
+    # timestamps go back to the ISO strings the JSON outputs carry
+    return value.astimezone(timezone.utc).replace(tzinfo=None).isoformat() if isinstance(value, datetime) else value
+
+
+def iter_stage_records(table: str, columns: Optional[Sequence[str]] = None,
+                       root: PathLike = COLUMNAR_DIR) -> Iterator[Dict]:
+    """A stage's records as dicts, read from the newest columnar scan when
+    it is current and from the JSON/NDJSON output otherwise."""
+    if not store_is_current(table, root):
+        yield from iter_records(STAGE_OUTPUTS[table])
+        return
+
+    for batch in load_table(table, columns or schema(table).names, root=root).to_batches():
+        for row in batch.to_pylist():
+            yield {k: _json_value(v) for k, v in row.items()}
+
+
+def load_frame(table: str, columns: Optional[Sequence[str]] = None, root: PathLike = COLUMNAR_DIR):
+    """A stage's records as a pandas DataFrame, straight from the newest
+    columnar scan when it is current, otherwise built from the JSON output."""
+    if store_is_current(table, root):
+        return load_table(table, columns or schema(table).names, root=root).to_pandas()
+
+    import pandas as pd
+    frame = pd.DataFrame(list(iter_records(STAGE_OUTPUTS[table])))
+    return frame[list(columns)] if columns else frame
+
+
+def convert_outputs(tables: Iterable[str], scan_ts: Optional[str] = None,
+                    root: PathLike = COLUMNAR_DIR) -> Dict[str, int]:
+    # imports existing JSON/NDJSON stage outputs as one scan
+    scan_ts = scan_ts or new_scan_ts()
+    counts = {}
+    for table in tables:
+        source = STAGE_OUTPUTS[table]
+        if not Path(source).exists():
+            print(f"[!] {source} not found, skipping {table}")
+            continue
+        records = iter_records(source)
+        with ColumnarWriter(table, scan_ts=scan_ts, root=root) as out:
+            out.write_many(records)
+        counts[table] = out.count
+        print(f"[✓] {table}: {out.count} rows → {out.path}")
+    return counts
+
+
+def main():
+    p = argparse.ArgumentParser(description="Convert stage JSON outputs into the columnar scan store")
+    p.add_argument("tables", nargs="*", help=f"tables to convert (default: all of {', '.join(STAGE_OUTPUTS)})")
+    p.add_argument("--scan-ts", default=None, help=f"partition timestamp ({SCAN_TS_FORMAT}), defaults to now")
+    args = p.parse_args()
+
+    unknown = set(args.tables) - set(STAGE_OUTPUTS)
+    if unknown:
+        p.error(f"unknown tables: {', '.join(sorted(unknown))}")
+
+    require_pyarrow()
+    convert_outputs(args.tables or list(STAGE_OUTPUTS), scan_ts=args.scan_ts)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,177 +1,266 @@
+import argparse
 import asyncio
-import ssl
 import json
+import time
 from pathlib import Path
-from typing import List, Dict
-from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from scanner.adaptive import AdaptiveController, adaptive_from_args, add_adaptive_args, open_connection
+from scanner.columnar import add_columnar_args, require_pyarrow, write_columnar
+from scanner.history import add_history_args, record_history
+from scanner.peers import DEFAULT_TCP_PORT, PeerRecord, parse_peers
+from scanner.records import NDJSONWriter, ndjson_path
+from scanner.resolver import EndpointSet, dns_summary, get_resolver
+from scanner.tls_context import handshake_summary
+from scanner.transport import DEFAULT_POLICY, POLICIES, TCP_ONLY, ConnectError
 
 
 class ElectrumDiscovery:
 
-    def __init__(self, timeout: int = 4, max_concurrent: int = 200, max_depth: int = 2):
+    def __init__(self, timeout: int = 4, max_concurrent: int = 200, max_depth: int = 2,
+                 stats_interval: float = 5.0, connect_policy: str = DEFAULT_POLICY,
+                 on_peers: Optional[Callable[[List[Dict]], Awaitable[None]]] = None,
+                 adaptive: Optional[AdaptiveController] = None):
         self.timeout = timeout
+        self.on_peers = on_peers
+        self.connect_policy = connect_policy
         self.max_concurrent = max_concurrent
         self.max_depth = max_depth
+        self.stats_interval = stats_interval
         self.seen_hosts = set()
+        self.seen_endpoints = set()
+        self.endpoints = EndpointSet()
         self.discovered_peers = []
-        self.sem = asyncio.Semaphore(max_concurrent)
+        self.adaptive = adaptive
+        self.sem = adaptive.limiter if adaptive else asyncio.Semaphore(max_concurrent)
+
+        # crawl progress
+        self.in_flight = 0
+        self.hosts_visited = 0
+        self.hosts_responded = 0
+        self.frontier_samples = []
+        self.crawl_stats = {}
+        self._seq = 0
+
 
+    async def connect_and_request(self, host: str, port: int = 50002, tcp_port: int = DEFAULT_TCP_PORT):
+        # peers without an SSL port are crawled over plain TCP on their advertised port
+        policy = TCP_ONLY if port == tcp_port else self.connect_policy
 
-    async def connect_and_request(self, host: str, port: int = 50002):
         async with self.sem:
             print(f"\n[+] Connecting to {host}:{port}")
 
-            ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
-            ctx.check_hostname = False
-            ctx.verify_mode = ssl.CERT_NONE
-            ctx.set_ciphers("DEFAULT:@SECLEVEL=1")
-
             try:
-                reader, writer = await asyncio.wait_for(
-                    asyncio.open_connection(
-                        host,
-                        port,
-                        ssl=ctx,
-                        server_hostname=host
-                    ),
-                    timeout=self.timeout
-                )
-
-                print(f"[✓] SSL connection succeeded: {host}")
+                conn = await open_connection(self.adaptive, host, port, self.timeout, policy, tcp_port)
 
-            except Exception as ssl_error:
-                print(f"[!] SSL failed on {host}:{port} ({ssl_error})")
-                print("[*] Trying TCP fallback on port 50001...")
-
-                try:
-                    reader, writer = await asyncio.wait_for(
-                        asyncio.open_connection(host, 50001),
-                        timeout=self.timeout
-                    )
-                    print(f"[✓] TCP connection succeeded: {host}:50001")
-
-                except Exception as tcp_error:
-                    print(f"[✗] TCP also failed: {host} ({tcp_error})")
-                    return None
+            except ConnectError as e:
+                if e.ssl_error is not None:
+                    print(f"[!] SSL failed on {host}:{port} ({e.ssl_error})")
+                if e.tcp_error is not None:
+                    print(f"[✗] TCP on port {tcp_port} failed: {host} ({e.tcp_error})")
+                return None
 
+            if conn.protocol == "ssl":
+                print(f"[✓] SSL connection succeeded: {host} ({conn.connect_ms} ms)")
+            else:
+                print(f"[✓] TCP connection succeeded: {host}:{tcp_port} ({conn.connect_ms} ms)")
 
 
             # SEND REQUEST
-            try:
-                request = {
-                    "id": 0,
-                    "method": "server.peers.subscribe",
-                    "params": []
-                }
+            async with conn:
+                reply = await conn.call("server.peers.subscribe", [])
+            if self.adaptive:
+                self.adaptive.record_replies(host, [reply])
 
-                writer.write((json.dumps(request) + "\n").encode())
-                await writer.drain()
-
-                raw = await asyncio.wait_for(
-                    reader.readline(),
-                    timeout=self.timeout
-                )
+            if reply.error == "connection_closed":
+                print("[!] Empty response received")
+                return None
 
-                writer.close()
-                await writer.wait_closed()
-                response = raw.decode().strip()
+            if not reply.ok:
+                print(f"[!] Error during communication with {host}: {reply.error}")
+                return None
 
-                if not response:
-                    print("[!] Empty response received")
-                    return None
+            return reply.response.get("result")
 
-                data = json.loads(response)
-                return data.get("result")
 
-            except Exception as e:
-                print(f"[!] Error during communication with {host}: {e}")
-                return None
+    # PARSE PEERS
+    def parse_peers(self, raw_peers: List) -> List[PeerRecord]:
+        return parse_peers(raw_peers)
+
+    def _aliases(self, peer: PeerRecord) -> List[str]:
+        # raw peer entries carry both the IP and the advertised hostname
+        aliases = [peer.host]
+        if peer.hostname and peer.hostname not in aliases:
+            aliases.append(peer.hostname)
+        return aliases
+
+    async def _claim(self, host: str, port: int, aliases: List[str]) -> bool:
+        if (host, port) in self.seen_endpoints:
+            return False
+        if any(a in self.seen_hosts for a in aliases):
+            return False
+
+        self.seen_endpoints.add((host, port))
+        self.seen_hosts.update(aliases)
+        # other names for an address already queued only show up once resolved
+        return await self.endpoints.claim(host, port)
+
+    async def _crawl_worker(self, frontier: asyncio.PriorityQueue):
+        while True:
+            depth, _, host, port, tcp_port = await frontier.get()
+            self.in_flight += 1
 
+            try:
+                raw = await self.connect_and_request(host, port, tcp_port)
+                self.hosts_visited += 1
+                if raw is None:
+                    continue
+
+                self.hosts_responded += 1
+                peers = self.parse_peers(raw)
+                records = [p.to_dict() for p in peers]
+                self.discovered_peers.extend(records)
+
+                resolver = get_resolver()
+                for p in peers:
+                    resolver.add_peer(p.raw)
+
+                # lets an in-process pipeline start on peers while the crawl goes on
+                if self.on_peers is not None:
+                    await self.on_peers(records)
+
+                if depth + 1 > self.max_depth:
+                    continue
+
+                # the next frontier is resolved in bulk while this worker claims it
+                resolver.prefetch(p.host for p in peers)
+                for p in peers:
+                    if await self._claim(p.host, p.port, self._aliases(p)):
+                        self._seq += 1
+                        frontier.put_nowait((depth + 1, self._seq, p.host, p.port, p.tcp_port))
 
-    # PARSE PEERS
-    def parse_peers(self, raw_peers: List) -> List[Dict]:
-        parsed = []
-
-        for entry in raw_peers:
-            if len(entry) < 2:
-                continue
-
-            host = entry[0]
-            features = entry[1]
-
-            ssl_port = None
-            tcp_port = None
-
-            for f in features:
-                if f.startswith("s"):
-                    try:
-                        ssl_port = int(f[1:])
-                    except:
-                        ssl_port = 50002
-
-                elif f.startswith("t"):
-                    tcp_port = 50001
-
-            parsed.append({
-                "host": host,
-                "ssl": ssl_port,
-                "tcp": tcp_port,
-                "raw": entry
+            except Exception as e:
+                print(f"[!] Crawl worker error on {host}: {e}")
+
+            finally:
+                self.in_flight -= 1
+                frontier.task_done()
+
+    async def _crawl_monitor(self, frontier: asyncio.PriorityQueue, started: float):
+        while True:
+            await asyncio.sleep(self.stats_interval)
+
+            elapsed = time.perf_counter() - started
+            rate = self.hosts_visited / elapsed if elapsed > 0 else 0.0
+            self.frontier_samples.append({
+                "t": round(elapsed, 2),
+                "frontier": frontier.qsize(),
+                "in_flight": self.in_flight,
+                "visited": self.hosts_visited,
+                "hosts_per_sec": round(rate, 2),
             })
 
-        return parsed
-    
+            print(f"[*] {elapsed:.0f}s: visited={self.hosts_visited} "
+                  f"frontier={frontier.qsize()} in_flight={self.in_flight} "
+                  f"({rate:.1f} hosts/s)")
+
 
     # electrum network recursive discovery crawler.
+    # up to max_concurrent hosts are in flight at once. the frontier is
+    # ordered by depth, so shallower hosts are always dequeued first and
+    # every host keeps the depth at which it was first reached.
     async def crawl_network(self, seed_host: str = "electrum.blockstream.info", seed_port: int = 50002) -> List[Dict]:
-        queue = deque([(seed_host, seed_port, 0)])
-
-        while queue:
-            host, port, depth = queue.popleft()
-
-            if host in self.seen_hosts:
-                continue
-
-            if depth > self.max_depth:
-                continue
-
-            self.seen_hosts.add(host)
-
-            raw = await self.connect_and_request(host, port)
-            if raw is None:
-                continue
-
-            peers = self.parse_peers(raw)
-            self.discovered_peers.extend(peers)
-
-            for p in peers:
-                if p["ssl"]:
-                    queue.append((p["host"], p["ssl"], depth + 1))
+        frontier = asyncio.PriorityQueue()
+        started = time.perf_counter()
+
+        if await self._claim(seed_host, seed_port, [seed_host]):
+            self._seq += 1
+            frontier.put_nowait((0, self._seq, seed_host, seed_port, DEFAULT_TCP_PORT))
+
+        # the adaptive limiter decides how many of the workers may connect at once
+        workers = [
+            asyncio.create_task(self._crawl_worker(frontier))
+            for _ in range(self.adaptive.max_concurrency if self.adaptive else self.max_concurrent)
+        ]
+        monitor = asyncio.create_task(self._crawl_monitor(frontier, started))
+
+        try:
+            await frontier.join()
+        finally:
+            for task in workers + [monitor]:
+                task.cancel()
+            await asyncio.gather(*workers, monitor, return_exceptions=True)
+
+        elapsed = time.perf_counter() - started
+        self.crawl_stats = {
+            "elapsed_s": round(elapsed, 2),
+            "hosts_visited": self.hosts_visited,
+            "hosts_responded": self.hosts_responded,
+            "hosts_per_sec": round(self.hosts_visited / elapsed, 2) if elapsed > 0 else 0.0,
+            "frontier_samples": self.frontier_samples,
+        }
 
         return self.discovered_peers
 
 
 
 async def main():
-    crawler = ElectrumDiscovery()
-    results = await crawler.crawl_network(
-        seed_host="electrum3.bluewallet.io",
-        seed_port=50002
-    )
+    p = argparse.ArgumentParser(description="Crawl the Electrum peer network from a seed server")
+    p.add_argument("--connect-policy", choices=POLICIES, default=DEFAULT_POLICY,
+                   help="ssl-only, prefer-ssl (TCP after SSL fails) or race (SSL and TCP staggered)")
+    add_adaptive_args(p)
+    add_columnar_args(p)
+    add_history_args(p)
+    args = p.parse_args()
+
+    if args.columnar:
+        require_pyarrow()
 
     output_dir = Path("data/peers")
     output_dir.mkdir(parents=True, exist_ok=True)
     output_path = output_dir / "peers.json"
-    
+
+    out = NDJSONWriter(ndjson_path(output_path))
+
+    async def stream_peers(peers):
+        out.write_many(peers)
+
+    crawler = ElectrumDiscovery(connect_policy=args.connect_policy, on_peers=stream_peers,
+                                adaptive=adaptive_from_args(args))
+    try:
+        results = await crawler.crawl_network(
+            seed_host="electrum3.bluewallet.io",
+            seed_port=50002
+        )
+    finally:
+        out.close()
+
     with open(output_path, "w") as f:
         json.dump(results, f, indent=2)
 
+    with open(output_dir / "crawl_stats.json", "w") as f:
+        json.dump(crawler.crawl_stats, f, indent=2)
+
+    if args.columnar:
+        write_columnar("peers", results, args.scan_id)
+
+    if args.history:
+        record_history("peers", results, args.scan_id)
+
     print("\n==========================")
     print("   DISCOVERED PEERS")
     print("==========================\n")
 
     print(f"Total peers: {len(results)}")
-    print(f"Saved to: {output_path}")
+    print(f"Hosts crawled: {crawler.crawl_stats['hosts_visited']} "
+          f"({crawler.crawl_stats['hosts_responded']} responded)")
+    print(f"Crawl time: {crawler.crawl_stats['elapsed_s']}s "
+          f"({crawler.crawl_stats['hosts_per_sec']} hosts/s)")
+    print(f"TLS handshakes: {handshake_summary()}")
+    print(f"DNS: {dns_summary()}")
+    if crawler.adaptive:
+        crawler.adaptive.print_summary()
+    print(f"Saved to: {output_path}, {ndjson_path(output_path)}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,106 @@
+import asyncio
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, Optional
+
+
+_DONE = object()
+
+
+class BoundedExecutor:
+    """Runs a coroutine function over a (possibly huge) iterable of items.
+
+    Items are pulled from the iterator only when a worker is free, so at
+    most `concurrency` coroutines exist at any time regardless of how many
+    peers there are. Results are yielded as they complete; at most
+    `max_pending` finished results wait for the consumer before workers
+    stop taking new items. `per_host_rate` caps how many probes per second
+    start against the same host.
+    """
+
+    def __init__(self, concurrency: int = 200, per_host_rate: Optional[float] = None,
+                 max_pending: int = 1000):
+        self.concurrency = concurrency
+        self.per_host_rate = per_host_rate
+        self.max_pending = max_pending
+
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self._next_slot: Dict[str, float] = {}
+
+    async def _throttle(self, host: Optional[str]):
+        if not self.per_host_rate or host is None:
+            return
+
+        now = time.monotonic()
+        slot = max(now, self._next_slot.get(host, now))
+        self._next_slot[host] = slot + 1.0 / self.per_host_rate
+
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def _worker(self, func, items, key, results: asyncio.Queue):
+        for item in items:
+            await self._throttle(key(item) if key else None)
+            self.started += 1
+
+            try:
+                result = await func(item)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                print(f"[!] Task failed: {e}")
+                result = None
+
+            self.completed += 1
+            await results.put(result)
+
+        await results.put(_DONE)
+
+    async def map(self, func: Callable[..., Awaitable], items: Iterable,
+                  key: Optional[Callable] = None) -> AsyncIterator:
+        # all workers share one iterator; next() never awaits, so each item
+        # is handed to exactly one worker
+        items = iter(items)
+        results = asyncio.Queue(maxsize=self.max_pending)
+        workers = [
+            asyncio.create_task(self._worker(func, items, key, results))
+            for _ in range(self.concurrency)
+        ]
+
+        remaining = len(workers)
+        try:
+            while remaining:
+                result = await results.get()
+                if result is _DONE:
+                    remaining -= 1
+                    continue
+                yield result
+        finally:
+            for w in workers:
+                w.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+
+def add_executor_args(p, concurrency: int = 200):
+    p.add_argument("--max-concurrent", type=int, default=concurrency,
+                   help="probes running at the same time")
+    p.add_argument("--per-host-rate", type=float, default=None,
+                   help="max probes per second started against one host")
+    p.add_argument("--max-pending", type=int, default=1000,
+                   help="finished results buffered before new probes are held back")
+
+
+def executor_from_args(args) -> BoundedExecutor:
+    # with --adaptive the controller's limiter caps active probes, so the
+    # executor keeps enough workers for the highest limit it may set
+    concurrency = args.max_concurrent
+    if getattr(args, "adaptive", False):
+        concurrency = max(concurrency, args.max_concurrency)
+
+    return BoundedExecutor(
+        concurrency=concurrency,
+        per_host_rate=args.per_host_rate,
+        max_pending=args.max_pending,
+    )
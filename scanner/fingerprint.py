@@ -1,78 +1,146 @@
+import argparse
 import asyncio
-import ssl
 import json
 import time
-import hashlib
 from pathlib import Path
-from typing import Dict, List
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional
+
+from scanner.adaptive import AdaptiveController, adaptive_from_args, add_adaptive_args, open_connection
+from scanner.canonical import DEFAULT_HASH, add_hash_args, canonical_bytes, stable_hash
+from scanner.columnar import add_columnar_args, require_pyarrow, write_columnar
+from scanner.executor import BoundedExecutor, add_executor_args, executor_from_args
+from scanner.history import add_history_args, record_history
+from scanner.journal import ScanJournal, skip_done
+from scanner.peers import DEFAULT_TCP_PORT
+from scanner.records import NDJSONWriter, iter_ndjson, iter_records, merge_records, ndjson_path, streamed
+from scanner.resolver import EndpointSet, dns_summary
+from scanner.sharding import add_shard_args, print_shards, require_uvloop, scan_sharded, sharded, stage_stats
+from scanner.timing import PhaseHistogram, elapsed_ms, now_ns
+from scanner.tls_context import handshake_summary
+from scanner.transport import DEFAULT_POLICY, POLICIES, TCP_ONLY, ConnectError
+
+
+ADDR_P2PKH = "1BoatSLRHtKNngkdXEeobR76b53LETtpyT"
+ADDR_P2WPKH = "bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kg3g4ty"
+ADDR_P2TR = "bc1p5cyxnuxmeuwuvkwfem96l0hax0u4qxgmfxj0gd0k9u3x3jz7xk7q4lk7t7"
+
+# (name, method, params) in the order they are sent
+PROBES = [
+    ("version", "server.version", ["Electrum 4.4.5", "1.4"]),
+    ("banner", "server.banner", []),
+    ("ping", "server.ping", []),
+    ("history", "blockchain.address.get_history", [ADDR_P2PKH]),
+    ("p2wpkh", "blockchain.address.get_history", [ADDR_P2WPKH]),
+    ("p2tr", "blockchain.address.get_history", [ADDR_P2TR]),
+]
+
+MODES = ("session", "per-call")
 
 
 class ElectrumFingerprint:
 
-    def __init__(self, timeout: int = 4, max_concurrent: int = 200):
-        self.timeout = timeout
-        self.sem = asyncio.Semaphore(max_concurrent)
+    def __init__(self, timeout: int = 4, max_concurrent: int = 200, mode: str = "session", batch: bool = False,
+                 connect_policy: str = DEFAULT_POLICY, executor: Optional[BoundedExecutor] = None,
+                 hash_algorithm: str = DEFAULT_HASH, adaptive: Optional[AdaptiveController] = None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown probe mode: {mode}")
 
-    async def electrum_call(self, host: str, port: int, method: str, params: List):
+        self.timeout = timeout
+        self.adaptive = adaptive
+        self.sem = adaptive.limiter if adaptive else asyncio.Semaphore(max_concurrent)
+        self.mode = mode
+        self.batch = batch
+        self.connect_policy = connect_policy
+        self.hash_algorithm = hash_algorithm
+        self.executor = executor or BoundedExecutor(concurrency=max_concurrent)
+        self.endpoints = EndpointSet()
+        self.connections = 0
+
+    async def _open(self, host: str, port: int, info: Optional[Dict] = None, tcp_port: int = DEFAULT_TCP_PORT):
+        # peers that advertise no SSL port are probed over plain TCP only
+        policy = TCP_ONLY if port == tcp_port else self.connect_policy
+        try:
+            conn = await open_connection(self.adaptive, host, port, self.timeout, policy, tcp_port)
+        except ConnectError:
+            return None
+
+        self.connections += 1
+
+        # the first connection to a host is the one recorded
+        if info is not None and "protocol" not in info:
+            info["protocol"] = conn.protocol
+            info["connect_ms"] = conn.connect_ms
+            info["conn"] = conn
+        return conn
+
+    # one connection per call (legacy mode)
+    async def electrum_call(self, host: str, port: int, method: str, params: List, info: Optional[Dict] = None,
+                            tcp_port: int = DEFAULT_TCP_PORT):
         async with self.sem:
-            ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
-            ctx.check_hostname = False
-            ctx.verify_mode = ssl.CERT_NONE
-            ctx.set_ciphers("DEFAULT:@SECLEVEL=1")
-
-            try:
-                reader, writer = await asyncio.wait_for(
-                    asyncio.open_connection(
-                        host, port,
-                        ssl=ctx,
-                        server_hostname=host
-                    ),
-                    timeout=self.timeout
-                )
-                proto = "ssl"
-            except:
-                try:
-                    reader, writer = await asyncio.wait_for(
-                        asyncio.open_connection(host, 50001),
-                        timeout=self.timeout
-                    )
-                    proto = "tcp"
-                except:
-                    return None, "connection_failed", None
-
-            request = {
-                "id": 0,
-                "method": method,
-                "params": params
-            }
-
-            start = time.time()
-            try:
-                writer.write((json.dumps(request) + "\n").encode())
-                await writer.drain()
-
-                raw = await asyncio.wait_for(reader.readline(), timeout=self.timeout)
-                latency = (time.time() - start) * 1000
-
-                writer.close()
-                await writer.wait_closed()
-
-                try:
-                    response = json.loads(raw.decode().strip())
-                except:
-                    return None, "invalid_json", latency
-
-                return response, "ok", latency
-
-            except Exception as e:
-                return None, str(e), None
-
-
-    async def fingerprint_server(self, host: str, port: int):
+            conn = await self._open(host, port, info, tcp_port)
+            if conn is None:
+                return None, "connection_failed", None
+
+            async with conn:
+                reply = await conn.call(method, params)
+            if self.adaptive:
+                self.adaptive.record_replies(host, [reply])
+            return reply.response, reply.error, reply.latency_ms
+
+    # one connection per host. server.version leads and the remaining probes
+    # follow on the same stream, pipelined (one write, ~1 RTT) or as a batch.
+    async def session_calls(self, host: str, port: int, calls: List, info: Optional[Dict] = None,
+                            tcp_port: int = DEFAULT_TCP_PORT):
+        async with self.sem:
+            conn = await self._open(host, port, info, tcp_port)
+            if conn is None:
+                return [(None, "connection_failed", None)] * len(calls)
+
+            async with conn:
+                if self.batch:
+                    replies = [await conn.call(*calls[0])]
+                    replies += await conn.batch(calls[1:])
+                else:
+                    replies = await conn.pipeline(calls)
+
+            # the server dropped us mid-session: retry what was lost once,
+            # on a fresh stream that repeats the version handshake
+            lost = [i for i, r in enumerate(replies) if r.error == "connection_closed"]
+            if lost:
+                conn = await self._open(host, port, tcp_port=tcp_port)
+                if conn is not None:
+                    retry = [i for i in lost if i > 0]
+                    async with conn:
+                        retried = await conn.pipeline([calls[0]] + [calls[i] for i in retry])
+                    if lost[0] == 0:
+                        replies[0] = retried[0]
+                    for i, reply in zip(retry, retried[1:]):
+                        replies[i] = reply
+
+            if self.adaptive:
+                self.adaptive.record_replies(host, replies)
+
+        return [(r.response, r.error, r.latency_ms) for r in replies]
+
+    async def run_probes(self, host: str, port: int, info: Optional[Dict] = None, tcp_port: int = DEFAULT_TCP_PORT):
+        calls = [(method, params) for _, method, params in PROBES]
+
+        if self.mode == "session":
+            results = await self.session_calls(host, port, calls, info, tcp_port)
+        else:
+            results = []
+            for method, params in calls:
+                results.append(await self.electrum_call(host, port, method, params, info, tcp_port))
+
+        return {name: r for (name, _, _), r in zip(PROBES, results)}
+
+
+    async def fingerprint_server(self, host: str, port: int, tcp_port: int = DEFAULT_TCP_PORT):
         fp = {
             "host": host,
             "port": port,
             "protocol": None,
+            "connect_ms": None,
             "latency_version": None,
             "latency_banner": None,
             "latency_ping": None,
@@ -88,98 +156,170 @@ class ElectrumFingerprint:
             "response_hash_banner": None,
             "response_hash_ping": None,
             "response_hash_history": None,
+            "hash_algorithm": self.hash_algorithm,
+            "canonical_version": None,
+            "canonical_banner": None,
+            "canonical_ping": None,
+            "dns_ms": None,
+            "tcp_ms": None,
+            "tls_ms": None,
+            "ttfb_ms": None,
+            "total_ms": None,
         }
 
-        # Test 1 — server.version
-        res, err, lat = await self.electrum_call(
-            host, port, "server.version",
-            ["Electrum 4.4.5", "1.4"]
-        )
-        fp["latency_version"] = lat
-        fp["error_version"] = err
-        fp["response_hash_version"] = hashlib.sha256(str(res).encode()).hexdigest() if res else None
-
-        # Detect protocol
-        fp["protocol"] = "ssl" if port == 50002 else "tcp"
-
-        # Test 2 — server.banner
-        res, err, lat = await self.electrum_call(host, port, "server.banner", [])
-        fp["latency_banner"] = lat
-        fp["error_banner"] = err
-        fp["response_hash_banner"] = hashlib.sha256(str(res).encode()).hexdigest() if res else None
-
-        # Test 3 — server.ping
-        res, err, lat = await self.electrum_call(host, port, "server.ping", [])
-        fp["latency_ping"] = lat
-        fp["error_ping"] = err
-        fp["response_hash_ping"] = hashlib.sha256(str(res).encode()).hexdigest() if res else None
-
-        # Test 4 — blockchain.address.get_history (P2PKH)
-        addr_p2pkh = "1BoatSLRHtKNngkdXEeobR76b53LETtpyT"
-        res, err, lat = await self.electrum_call(
-            host, port,
-            "blockchain.address.get_history",
-            [addr_p2pkh]
-        )
-        fp["latency_history"] = lat
-        fp["error_history"] = err
-        fp["supports_p2pkh"] = (err == "ok")
-        fp["response_hash_history"] = hashlib.sha256(str(res).encode()).hexdigest() if res else None
-
-        # TEST — P2WPKH / Bech32
-        addr_p2wpkh = "bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kg3g4ty"
-        res, err, lat = await self.electrum_call(
-            host, port,
-            "blockchain.address.get_history",
-            [addr_p2wpkh]
-        )
-        fp["supports_p2wpkh"] = (err == "ok")
-
-        # TEST — Taproot
-        addr_p2tr = "bc1p5cyxnuxmeuwuvkwfem96l0hax0u4qxgmfxj0gd0k9u3x3jz7xk7q4lk7t7"
-        res, err, lat = await self.electrum_call(
-            host, port,
-            "blockchain.address.get_history",
-            [addr_p2tr]
-        )
-        fp["supports_p2tr"] = (err == "ok")
+        conn_info = {}
+        started = now_ns()
+        probes = await self.run_probes(host, port, conn_info, tcp_port)
+        fp["total_ms"] = elapsed_ms(started)
+
+        # phases of the first connection; ttfb is its first write to first byte back
+        if "conn" in conn_info:
+            fp.update(conn_info["conn"].timing())
+
+        # server.version, server.banner, server.ping, get_history (P2PKH)
+        for name in ("version", "banner", "ping", "history"):
+            res, err, lat = probes[name]
+            fp[f"latency_{name}"] = lat
+            fp[f"error_{name}"] = err
+            if not res:
+                continue
+            data = canonical_bytes(res)
+            fp[f"response_hash_{name}"] = stable_hash(data, self.hash_algorithm)
+            # kept so the hashes can be recomputed with another algorithm without
+            # reprobing; the history reply is left out, it can run to megabytes
+            if name != "history":
+                fp[f"canonical_{name}"] = data.decode()
+
+        # Detect protocol, guessed from the port if no connection came up
+        fp["protocol"] = conn_info.get("protocol") or ("ssl" if port == 50002 and port != tcp_port else "tcp")
+        fp["connect_ms"] = conn_info.get("connect_ms")
+
+        fp["supports_p2pkh"] = (probes["history"][1] == "ok")
+        fp["supports_p2wpkh"] = (probes["p2wpkh"][1] == "ok")
+        fp["supports_p2tr"] = (probes["p2tr"][1] == "ok")
 
         return fp
 
 
-    async def fingerprint_all(self, peers: List[Dict]):
-        tasks = []
+    # peers are pulled lazily and results yielded as they complete
+    async def iter_fingerprint(self, peers: Iterable[Dict], on_result: Optional[Callable[[Dict], None]] = None,
+                               journal: Optional[ScanJournal] = None) -> AsyncIterator[Dict]:
+        def targets():
+            for p in peers:
+                host = p["host"]
+                port = p["port"]
+                # the TCP port the validator was given; older records don't have it
+                tcp_port = p.get("tcp_port") or DEFAULT_TCP_PORT
+                if not skip_done(journal, host, port):
+                    yield host, port, tcp_port
 
-        for p in peers:
-            host = p["host"]
-            port = p["port"]
-            tasks.append(self.fingerprint_server(host, port))
+        async def run(target):
+            host, port, tcp_port = target
+            if not await self.endpoints.claim(host, port):
+                return None
+            return await streamed(self.fingerprint_server(host, port, tcp_port), on_result, journal, host, port)
 
-        results = await asyncio.gather(*tasks)
-        return results
+        async for r in self.executor.map(run, targets(), key=lambda t: t[0]):
+            if r:
+                yield r
 
+    async def fingerprint_all(self, peers: Iterable[Dict], on_result: Optional[Callable[[Dict], None]] = None,
+                              journal: Optional[ScanJournal] = None):
+        return [r async for r in self.iter_fingerprint(peers, on_result, journal)]
 
-async def main():
-    with open("data/online_peers/online_peers.json", "r") as f:
-        peers = json.load(f)
 
-    print(f"[+] Fingerprinting {len(peers)} servers...")
+ONLINE_PATH = Path("data/online_peers/online_peers.json")
 
-    fp = ElectrumFingerprint()
-    results = await fp.fingerprint_all(peers)
+
+def build_fingerprint(args) -> ElectrumFingerprint:
+    return ElectrumFingerprint(
+        max_concurrent=args.max_concurrent,
+        mode=args.mode,
+        batch=args.batch,
+        connect_policy=args.connect_policy,
+        executor=executor_from_args(args),
+        hash_algorithm=args.hash_algorithm,
+        adaptive=adaptive_from_args(args),
+    )
+
+
+async def main():
+    p = argparse.ArgumentParser(description="Behavioral fingerprinting of online Electrum servers")
+    p.add_argument("--mode", choices=MODES, default="session",
+                   help="session: one connection per server; per-call: one connection per RPC")
+    p.add_argument("--batch", action="store_true",
+                   help="in session mode, send the probes after server.version as a JSON-RPC batch")
+    p.add_argument("--connect-policy", choices=POLICIES, default=DEFAULT_POLICY,
+                   help="ssl-only, prefer-ssl (TCP after SSL fails) or race (SSL and TCP staggered)")
+    p.add_argument("--resume", action="store_true",
+                   help="skip targets finished by an interrupted run and merge with its results")
+    add_hash_args(p)
+    add_executor_args(p)
+    add_shard_args(p)
+    add_adaptive_args(p)
+    add_columnar_args(p)
+    add_history_args(p)
+    args = p.parse_args()
+
+    if args.columnar:
+        require_pyarrow()
+    if args.uvloop:
+        require_uvloop()
+
+    print(f"[+] Fingerprinting servers ({args.mode} mode)...")
+
+    fp = build_fingerprint(args)
 
     output_dir = Path("data/fingerprints")
     output_dir.mkdir(parents=True, exist_ok=True)
     output_path = output_dir / "fingerprints.json"
-    
+
+    started = time.perf_counter()
+    with ScanJournal("fingerprint", resume=args.resume) as journal, \
+         NDJSONWriter(ndjson_path(output_path), append=args.resume) as out:
+        if journal.resumed:
+            print(f"[*] Resuming: {journal.resumed} targets already done")
+        if sharded(args):
+            stats = await scan_sharded("scanner.fingerprint:build_fingerprint", "iter_fingerprint", args, ONLINE_PATH,
+                                       on_result=out.write, journal=journal)
+        else:
+            async for _ in fp.iter_fingerprint(iter_records(ONLINE_PATH), on_result=out.write, journal=journal):
+                pass
+            stats = stage_stats(fp)
+    elapsed = time.perf_counter() - started
+
+    # the streamed NDJSON holds every result, including a resumed run's
+    results = merge_records(iter_ndjson(ndjson_path(output_path))) if args.resume \
+        else list(iter_ndjson(ndjson_path(output_path)))
+
     with open(output_path, "w") as f:
         json.dump(results, f, indent=2)
 
+    if args.columnar:
+        write_columnar("fingerprints", results, args.scan_id)
+
+    if args.history:
+        record_history("fingerprints", results, args.scan_id)
+
+    timing = PhaseHistogram().add_all(results)
+    timing.save(output_dir / "timing_summary.json")
+
     print("\n==============================")
     print("      FINGERPRINT DONE")
     print("==============================\n")
     print(f"[✓] Servers fingerprinted: {len(results)}")
-    print(f"[✓] Files saved: {output_path}\n")
+    print(f"[✓] Probe mode: {args.mode}")
+    print(f"[✓] Response hash: {args.hash_algorithm}")
+    print(f"[✓] Connections opened: {stats['connections']}")
+    print(f"[✓] TLS handshakes: {handshake_summary(stats['handshakes'])}")
+    print(f"[✓] DNS: {dns_summary(stats['dns'])}")
+    print(f"[✓] Run time: {elapsed:.2f}s")
+    if sharded(args):
+        print_shards(stats)
+    elif fp.adaptive:
+        fp.adaptive.print_summary()
+    print(f"[✓] Files saved: {output_path}, {ndjson_path(output_path)}, {output_dir / 'timing_summary.json'}\n")
+    timing.print_summary()
 
 
 if __name__ == "__main__":
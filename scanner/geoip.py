@@ -0,0 +1,363 @@
+import argparse
+import ipaddress
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+try:
+    import geoip2.database
+    import geoip2.errors
+except ImportError:
+    geoip2 = None
+
+from scanner.records import PathLike, iter_records
+
+
+GEOIP_DIR = Path("data/geoip")
+CITY_DB = GEOIP_DIR / "GeoLite2-City.mmdb"
+ASN_DB = GEOIP_DIR / "GeoLite2-ASN.mmdb"
+CACHE_PATH = GEOIP_DIR / "geo_cache.sqlite"
+OUTPUT_PATH = GEOIP_DIR / "geo.json"
+
+# ip-api shaped export read by operator_clusters and the adaptive controller,
+# on top of the global network notebook's own (tracked) lookup cache
+GEO_CACHE_JSON = GEOIP_DIR / "geo_cache.json"
+NOTEBOOK_GEO_CACHE = Path("data/global_network/geo_cache.json")
+
+DEFAULT_TTL_DAYS = 30
+
+FIELDS = ("country", "country_code", "city", "lat", "lon", "asn", "as_org", "prefix")
+
+
+def require_geoip2():
+    if geoip2 is None:
+        raise RuntimeError("GeoIP enrichment needs geoip2 (pip install geoip2)")
+
+
+def _ip(host: str) -> Optional[str]:
+    try:
+        return str(ipaddress.ip_address(host))
+    except ValueError:
+        return None
+
+
+class MaxMindSource:
+    """Local GeoLite2/GeoIP2 City (or Country) and ASN databases, memory-mapped."""
+
+    def __init__(self, city_db: PathLike = CITY_DB, asn_db: PathLike = ASN_DB):
+        require_geoip2()
+        from maxminddb import MODE_MMAP
+
+        city_db, asn_db = Path(city_db), Path(asn_db)
+        self.city = geoip2.database.Reader(str(city_db), mode=MODE_MMAP) if city_db.exists() else None
+        self.asn = geoip2.database.Reader(str(asn_db), mode=MODE_MMAP) if asn_db.exists() else None
+        if self.city is None and self.asn is None:
+            raise FileNotFoundError(f"no GeoIP database at {city_db} or {asn_db}")
+
+        # cached lookups from an older database build are looked up again
+        self.build = ":".join(
+            str(r.metadata().build_epoch) if r else "-" for r in (self.city, self.asn)
+        )
+
+    def _city(self, ip: str):
+        # a Country database answers through the same reader
+        db_type = self.city.metadata().database_type
+        try:
+            return self.city.city(ip) if "City" in db_type else self.city.country(ip)
+        except geoip2.errors.AddressNotFoundError:
+            return None
+
+    def lookup(self, ip: str) -> Optional[Dict]:
+        record = dict.fromkeys(FIELDS)
+        found = False
+
+        if self.city is not None:
+            r = self._city(ip)
+            if r is not None:
+                found = True
+                record["country"] = r.country.name
+                record["country_code"] = r.country.iso_code
+                if hasattr(r, "city"):
+                    record["city"] = r.city.name
+                    record["lat"] = r.location.latitude
+                    record["lon"] = r.location.longitude
+                record["prefix"] = str(r.traits.network) if r.traits.network else None
+
+        if self.asn is not None:
+            try:
+                r = self.asn.asn(ip)
+            except geoip2.errors.AddressNotFoundError:
+                r = None
+            if r is not None:
+                found = True
+                record["asn"] = r.autonomous_system_number
+                record["as_org"] = r.autonomous_system_organization
+                # the ASN database's network is the announced prefix
+                record["prefix"] = str(r.network) if r.network else record["prefix"]
+
+        return record if found else None
+
+    def close(self):
+        for reader in (self.city, self.asn):
+            if reader is not None:
+                reader.close()
+
+
+class FixtureSource:
+    """CIDR -> record JSON standing in for the MaxMind databases, for
+    offline runs and tests:
+
+        {"203.0.113.0/24": {"country": "Testland", "country_code": "TL", "asn": 64500, ...}}
+    """
+
+    def __init__(self, path: PathLike):
+        path = Path(path)
+        with open(path, "r") as f:
+            data = json.load(f)
+
+        self.networks: Dict[int, Dict] = {}
+        for cidr, fields in data.items():
+            net = ipaddress.ip_network(cidr, strict=False)
+            record = {**dict.fromkeys(FIELDS), **fields, "prefix": str(net)}
+            self.networks.setdefault(net.prefixlen, {})[net] = record
+
+        # longest prefix first
+        self.prefixlens = sorted(self.networks, reverse=True)
+        self.build = f"fixture:{int(path.stat().st_mtime)}"
+
+    def lookup(self, ip: str) -> Optional[Dict]:
+        addr = ipaddress.ip_address(ip)
+        for plen in self.prefixlens:
+            if plen > addr.max_prefixlen:
+                continue
+            net = ipaddress.ip_network(f"{addr}/{plen}", strict=False)
+            record = self.networks[plen].get(net)
+            if record is not None:
+                return dict(record)
+        return None
+
+    def close(self):
+        pass
+
+
+class GeoCache:
+    """Persistent lookup cache. Entries older than the TTL, or made with
+    another database build, are looked up again; expired rows are
+    evicted on open. Misses (reserved ranges, unknown addresses) are
+    cached too."""
+
+    def __init__(self, path: PathLike = CACHE_PATH, ttl_days: float = DEFAULT_TTL_DAYS):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl_days * 86400
+        self.db = sqlite3.connect(self.path)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS geo (
+                ip TEXT PRIMARY KEY,
+                build TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                record TEXT
+            )
+        """)
+        self.evicted = self.db.execute("DELETE FROM geo WHERE fetched_at < ?", (time.time() - self.ttl,)).rowcount
+        self.db.commit()
+
+    def get_many(self, ips: List[str], build: str) -> Dict[str, Optional[Dict]]:
+        found = {}
+        cutoff = time.time() - self.ttl
+        # stay below SQLite's bound-parameter limit
+        for i in range(0, len(ips), 500):
+            chunk = ips[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            rows = self.db.execute(
+                f"SELECT ip, record FROM geo WHERE ip IN ({marks}) AND build = ? AND fetched_at >= ?",
+                (*chunk, build, cutoff),
+            )
+            for ip, record in rows:
+                found[ip] = json.loads(record) if record else None
+        return found
+
+    def put_many(self, records: Dict[str, Optional[Dict]], build: str):
+        now = time.time()
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO geo (ip, build, fetched_at, record) VALUES (?, ?, ?, ?)",
+                [(ip, build, now, json.dumps(r) if r else None) for ip, r in records.items()],
+            )
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class GeoEnricher:
+    """Bulk IP -> country, ASN and prefix lookups.
+
+    An in-memory LRU answers repeated addresses, the persistent cache
+    answers addresses seen by earlier runs, and only the rest go to the
+    local database, in one batch per call.
+    """
+
+    def __init__(self, source, cache: Optional[GeoCache] = None, lru_size: int = 65536):
+        self.source = source
+        self.cache = cache
+        self.lru_size = lru_size
+        self._lru: "OrderedDict[str, Optional[Dict]]" = OrderedDict()
+        self.stats = {"lru": 0, "cache": 0, "db": 0, "not_ip": 0}
+
+    def _remember(self, ip: str, record: Optional[Dict]):
+        self._lru[ip] = record
+        self._lru.move_to_end(ip)
+        if len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def enrich(self, hosts: Iterable[str]) -> Dict[str, Optional[Dict]]:
+        out = {}
+        todo = []
+
+        for host in dict.fromkeys(hosts):
+            ip = _ip(host)
+            if ip is None:
+                # hostnames need resolving first
+                self.stats["not_ip"] += 1
+                out[host] = None
+            elif ip in self._lru:
+                self._lru.move_to_end(ip)
+                self.stats["lru"] += 1
+                out[host] = self._lru[ip]
+            else:
+                todo.append((host, ip))
+
+        cached = self.cache.get_many([ip for _, ip in todo], self.source.build) if self.cache and todo else {}
+
+        fresh = {}
+        for host, ip in todo:
+            if ip in cached:
+                self.stats["cache"] += 1
+                record = cached[ip]
+            else:
+                self.stats["db"] += 1
+                record = fresh[ip] = self.source.lookup(ip)
+            self._remember(ip, record)
+            out[host] = record
+
+        if self.cache and fresh:
+            self.cache.put_many(fresh, self.source.build)
+        return out
+
+    def lookup(self, host: str) -> Optional[Dict]:
+        return self.enrich([host])[host]
+
+
+def to_ip_api(host: str, record: Optional[Dict]) -> Dict:
+    # the shape the old ip-api batch lookups left in geo_cache.json
+    if record is None:
+        return {"status": "fail", "message": "not found", "query": host}
+    org = record.get("as_org")
+    return {
+        "status": "success",
+        "country": record.get("country"),
+        "countryCode": record.get("country_code"),
+        "city": record.get("city"),
+        "lat": record.get("lat"),
+        "lon": record.get("lon"),
+        "isp": org,
+        "org": org,
+        "as": f"AS{record['asn']} {org or ''}".strip() if record.get("asn") else "",
+        "prefix": record.get("prefix"),
+        "query": host,
+    }
+
+
+def load_geo_cache(paths: Iterable[PathLike] = (NOTEBOOK_GEO_CACHE, GEO_CACHE_JSON)) -> Dict[str, Dict]:
+    """ip-api shaped records by host; later files win, so enrichment runs
+    override the notebook's older lookups."""
+    geo = {}
+    for path in map(Path, paths):
+        if path.exists():
+            with open(path, "r") as f:
+                geo.update(json.load(f))
+    return geo
+
+
+def open_source(args):
+    if args.fixture:
+        return FixtureSource(args.fixture)
+    return MaxMindSource(args.city_db, args.asn_db)
+
+
+def stage_hosts() -> List[str]:
+    hosts = [p["host"] for p in iter_records("data/peers/peers.json") if p.get("host")]
+    hosts += [p["host"] for p in iter_records("data/online_peers/online_peers.json") if p.get("host")]
+    return list(dict.fromkeys(hosts))
+
+
+def main():
+    p = argparse.ArgumentParser(description="Country, ASN and prefix for every scanned host from a local GeoIP database")
+    p.add_argument("--city-db", type=Path, default=CITY_DB, help="GeoLite2/GeoIP2 City or Country database")
+    p.add_argument("--asn-db", type=Path, default=ASN_DB, help="GeoLite2/GeoIP2 ASN database")
+    p.add_argument("--fixture", type=Path, default=None,
+                   help="CIDR -> record JSON used instead of the MaxMind databases")
+    p.add_argument("--ttl-days", type=float, default=DEFAULT_TTL_DAYS,
+                   help="persistent cache entries older than this are looked up again")
+    p.add_argument("--no-cache", action="store_true", help="skip the persistent cache")
+    args = p.parse_args()
+
+    # geo data is optional for the rest of the flow, so a missing database skips the stage
+    try:
+        source = open_source(args)
+    except (RuntimeError, FileNotFoundError) as e:
+        print(f"[!] GeoIP enrichment skipped: {e}")
+        return
+
+    hosts = stage_hosts()
+    print(f"[+] Enriching {len(hosts)} hosts...")
+
+    cache = None if args.no_cache else GeoCache(ttl_days=args.ttl_days)
+    try:
+        enricher = GeoEnricher(source, cache)
+        started = time.perf_counter()
+        records = enricher.enrich(hosts)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+    finally:
+        source.close()
+        if cache is not None:
+            cache.close()
+
+    results = [{"host": h, **(r or dict.fromkeys(FIELDS))} for h, r in records.items()]
+    OUTPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with open(OUTPUT_PATH, "w") as f:
+        json.dump(results, f, indent=2)
+
+    # keep the ip-api shaped export current for its readers, without dropping older hosts
+    geo_cache = load_geo_cache([GEO_CACHE_JSON])
+    geo_cache.update({h: to_ip_api(h, r) for h, r in records.items() if r is not None})
+    with open(GEO_CACHE_JSON, "w") as f:
+        json.dump(geo_cache, f, indent=2)
+
+    located = sum(r is not None for r in records.values())
+    countries = len({r["country_code"] for r in records.values() if r and r.get("country_code")})
+    asns = len({r["asn"] for r in records.values() if r and r.get("asn")})
+
+    print("\n==============================")
+    print("       GEOIP ENRICHMENT")
+    print("==============================\n")
+    print(f"[✓] Hosts located: {located}/{len(records)} ({countries} countries, {asns} ASNs)")
+    print(f"[✓] Lookups: {enricher.stats['db']} database, {enricher.stats['cache']} cached, "
+          f"{enricher.stats['lru']} in memory, {enricher.stats['not_ip']} hostnames skipped")
+    if cache is not None and cache.evicted:
+        print(f"[✓] Expired cache entries evicted: {cache.evicted}")
+    print(f"[✓] Enrichment time: {elapsed_ms:.1f} ms")
+    print(f"[✓] Saved to {OUTPUT_PATH} and {GEO_CACHE_JSON}\n")
+
+
+if __name__ == "__main__":
+    main()
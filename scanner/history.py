@@ -0,0 +1,327 @@
+import argparse
+import json
+import sqlite3
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from scanner.columnar import STAGE_OUTPUTS, new_scan_ts, parse_version
+from scanner.peers import PeerRecord
+from scanner.records import PathLike, iter_records
+
+
+HISTORY_PATH = Path("data/history/scan_history.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    seq        INTEGER PRIMARY KEY AUTOINCREMENT,
+    scan_id    TEXT UNIQUE NOT NULL,
+    started_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS peers (
+    scan_id  TEXT NOT NULL,
+    host     TEXT NOT NULL,
+    ssl_port INTEGER,
+    tcp_port INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS online_peers (
+    scan_id          TEXT NOT NULL,
+    host             TEXT NOT NULL,
+    port             INTEGER NOT NULL,
+    protocol         TEXT,
+    connect_ms       REAL,
+    latency_ms       REAL,
+    server_software  TEXT,
+    protocol_version TEXT
+);
+
+CREATE TABLE IF NOT EXISTS fingerprints (
+    scan_id              TEXT NOT NULL,
+    host                 TEXT NOT NULL,
+    port                 INTEGER NOT NULL,
+    protocol             TEXT,
+    latency_ping         REAL,
+    error_history        TEXT,
+    response_hash_banner TEXT,
+    record               TEXT
+);
+
+CREATE TABLE IF NOT EXISTS tls_certs (
+    scan_id            TEXT NOT NULL,
+    host               TEXT NOT NULL,
+    port               INTEGER NOT NULL,
+    fingerprint_sha256 TEXT,
+    subject_cn         TEXT,
+    issuer_cn          TEXT,
+    not_before         TEXT,
+    not_after          TEXT
+);
+
+CREATE INDEX IF NOT EXISTS peers_host       ON peers (host, scan_id);
+CREATE INDEX IF NOT EXISTS peers_scan       ON peers (scan_id);
+CREATE INDEX IF NOT EXISTS online_host      ON online_peers (host, scan_id);
+CREATE INDEX IF NOT EXISTS online_scan      ON online_peers (scan_id);
+CREATE INDEX IF NOT EXISTS fingerprints_host ON fingerprints (host, scan_id);
+CREATE INDEX IF NOT EXISTS certs_host       ON tls_certs (host, scan_id);
+CREATE INDEX IF NOT EXISTS certs_scan       ON tls_certs (scan_id);
+CREATE INDEX IF NOT EXISTS certs_fp         ON tls_certs (fingerprint_sha256);
+"""
+
+
+def _peer_row(scan_id: str, r: Dict):
+    peer = PeerRecord.from_record(r)
+    return (scan_id, peer.host, peer.ssl, peer.tcp)
+
+
+def _online_row(scan_id: str, r: Dict):
+    software, protocol_version = parse_version(r.get("version_raw"))
+    return (scan_id, r["host"], r["port"], r.get("protocol"), r.get("connect_ms"),
+            r.get("latency_ms"), software, protocol_version)
+
+
+def _fingerprint_row(scan_id: str, r: Dict):
+    return (scan_id, r["host"], r["port"], r.get("protocol"), r.get("latency_ping"),
+            r.get("error_history"), r.get("response_hash_banner"), json.dumps(r))
+
+
+def _cert_row(scan_id: str, r: Dict):
+    return (scan_id, r["host"], r["port"], r.get("fingerprint_sha256"), r.get("subject_cn"),
+            r.get("issuer_cn"), r.get("not_before"), r.get("not_after"))
+
+
+# stage table -> (row builder, placeholder count)
+ROW_BUILDERS = {
+    "peers": (_peer_row, 4),
+    "online_peers": (_online_row, 8),
+    "fingerprints": (_fingerprint_row, 8),
+    "tls_certs": (_cert_row, 8),
+}
+
+
+class ScanHistory:
+    """Append-only SQLite history of every scan, keyed by scan id.
+
+    Stages append their results under the id of the run they belong to;
+    the query methods answer per-host and scan-to-scan questions through
+    the (host, scan_id) and fingerprint indexes instead of diffing files.
+    """
+
+    def __init__(self, path: PathLike = HISTORY_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+    def ensure_scan(self, scan_id: str):
+        self.db.execute(
+            "INSERT OR IGNORE INTO scans (scan_id, started_at) VALUES (?, ?)",
+            (scan_id, datetime.now(timezone.utc).isoformat(timespec="seconds")),
+        )
+
+    def append(self, table: str, scan_id: str, records: Iterable[Dict]) -> int:
+        build, n = ROW_BUILDERS[table]
+        sql = f"INSERT INTO {table} VALUES ({', '.join('?' * n)})"
+
+        with self.db:
+            self.ensure_scan(scan_id)
+            # a stage rerun under the same scan id replaces its earlier rows
+            self.db.execute(f"DELETE FROM {table} WHERE scan_id = ?", (scan_id,))
+            cur = self.db.executemany(sql, (build(scan_id, r) for r in records))
+        return cur.rowcount
+
+
+    def scans(self) -> List[Dict]:
+        rows = self.db.execute("SELECT scan_id, started_at FROM scans ORDER BY seq")
+        return [dict(r) for r in rows]
+
+    def host_history(self, host: str) -> List[Dict]:
+        # the host's online records per scan, with the certificates captured in that scan
+        rows = self.db.execute("""
+            SELECT s.scan_id, s.started_at, o.port, o.protocol, o.connect_ms, o.latency_ms,
+                   o.server_software, o.protocol_version,
+                   (SELECT GROUP_CONCAT(DISTINCT c.fingerprint_sha256) FROM tls_certs c
+                    WHERE c.scan_id = o.scan_id AND c.host = o.host AND c.port = o.port) AS certificates
+            FROM online_peers o
+            JOIN scans s ON s.scan_id = o.scan_id
+            WHERE o.host = ?
+            ORDER BY s.seq, o.port
+        """, (host,))
+        return [dict(r) for r in rows]
+
+    def seen_range(self, host: str) -> Optional[Dict]:
+        row = self.db.execute("""
+            SELECT MIN(s.seq) AS first_seq, MAX(s.seq) AS last_seq, COUNT(DISTINCT s.seq) AS scans
+            FROM online_peers o JOIN scans s ON s.scan_id = o.scan_id
+            WHERE o.host = ?
+        """, (host,)).fetchone()
+
+        if row["scans"] == 0:
+            return None
+
+        def scan_at(seq):
+            return dict(self.db.execute(
+                "SELECT scan_id, started_at FROM scans WHERE seq = ?", (seq,)).fetchone())
+
+        return {"host": host, "first_seen": scan_at(row["first_seq"]),
+                "last_seen": scan_at(row["last_seq"]), "scans_online": row["scans"]}
+
+    def cert_changes(self, host: str) -> List[Dict]:
+        # scans where the host presented different certificates than the time before;
+        # a scan can hold several records per port, so whole sets are compared
+        rows = self.db.execute("""
+            SELECT s.seq, s.scan_id, s.started_at, c.port, c.fingerprint_sha256
+            FROM tls_certs c JOIN scans s ON s.scan_id = c.scan_id
+            WHERE c.host = ?
+            ORDER BY c.port, s.seq
+        """, (host,))
+
+        per_scan = {}
+        for r in rows:
+            key = (r["port"], r["seq"])
+            if key not in per_scan:
+                per_scan[key] = {"scan_id": r["scan_id"], "started_at": r["started_at"],
+                                 "port": r["port"], "fingerprints": set()}
+            per_scan[key]["fingerprints"].add(r["fingerprint_sha256"])
+
+        changes = []
+        last = {}
+        for (port, _), entry in per_scan.items():
+            prev = last.get(port)
+            if prev is not None and prev != entry["fingerprints"]:
+                changes.append({**entry, "fingerprints": sorted(entry["fingerprints"]),
+                                "previous": sorted(prev)})
+            last[port] = entry["fingerprints"]
+        return changes
+
+    def latency_trend(self, host: str, since: Optional[str] = None) -> List[Dict]:
+        # since is an ISO date/time compared against the scan start
+        rows = self.db.execute("""
+            SELECT s.started_at, o.port, o.latency_ms, o.connect_ms
+            FROM online_peers o JOIN scans s ON s.scan_id = o.scan_id
+            WHERE o.host = ? AND s.started_at >= ?
+            ORDER BY s.seq
+        """, (host, since or ""))
+        return [dict(r) for r in rows]
+
+    def hosts_with_cert(self, fingerprint_sha256: str) -> List[Dict]:
+        rows = self.db.execute("""
+            SELECT c.host, c.port, MIN(s.started_at) AS first_seen, MAX(s.started_at) AS last_seen
+            FROM tls_certs c JOIN scans s ON s.scan_id = c.scan_id
+            WHERE c.fingerprint_sha256 = ?
+            GROUP BY c.host, c.port
+            ORDER BY first_seen
+        """, (fingerprint_sha256,))
+        return [dict(r) for r in rows]
+
+    def churn(self, scan_a: str, scan_b: str) -> Dict[str, List]:
+        """Servers that came online, went offline or changed certificate
+        between two scans."""
+        def online(scan_id):
+            rows = self.db.execute(
+                "SELECT DISTINCT host, port FROM online_peers WHERE scan_id = ?", (scan_id,))
+            return {(r["host"], r["port"]) for r in rows}
+
+        def certs(scan_id):
+            rows = self.db.execute(
+                "SELECT host, port, fingerprint_sha256 FROM tls_certs WHERE scan_id = ?", (scan_id,))
+            found = {}
+            for r in rows:
+                found.setdefault((r["host"], r["port"]), set()).add(r["fingerprint_sha256"])
+            return found
+
+        before, after = online(scan_a), online(scan_b)
+        certs_a, certs_b = certs(scan_a), certs(scan_b)
+
+        changed = []
+        for host, port in sorted(certs_a.keys() & certs_b.keys()):
+            a, b = certs_a[(host, port)], certs_b[(host, port)]
+            if a != b:
+                changed.append({"host": host, "port": port, "before": sorted(a), "after": sorted(b)})
+
+        return {
+            "appeared": sorted(after - before),
+            "disappeared": sorted(before - after),
+            "cert_changed": changed,
+        }
+
+
+def add_history_args(p):
+    p.add_argument("--history", action="store_true",
+                   help="also append the results to the scan history database")
+    p.add_argument("--scan-id", default=None,
+                   help="scan the results belong to (default: a new id from the current time)")
+
+
+def record_history(table: str, records: Iterable[Dict], scan_id: Optional[str] = None,
+                   path: PathLike = HISTORY_PATH) -> str:
+    scan_id = scan_id or new_scan_ts()
+    with ScanHistory(path) as history:
+        n = history.append(table, scan_id, records)
+    print(f"[✓] History: {n} {table} rows under scan {scan_id}")
+    return scan_id
+
+
+def main():
+    p = argparse.ArgumentParser(description="Query or fill the scan history database")
+    p.add_argument("--db", default=str(HISTORY_PATH))
+    sub = p.add_subparsers(dest="command", required=True)
+
+    imp = sub.add_parser("import", help="append the current stage outputs as one scan")
+    imp.add_argument("--scan-id", default=None)
+
+    sub.add_parser("scans", help="list recorded scans")
+
+    host = sub.add_parser("host", help="history, first/last seen and cert changes of a host")
+    host.add_argument("host")
+
+    cert = sub.add_parser("cert", help="hosts that presented a certificate")
+    cert.add_argument("fingerprint")
+
+    churn = sub.add_parser("churn", help="differences between two scans")
+    churn.add_argument("scan_a")
+    churn.add_argument("scan_b")
+
+    args = p.parse_args()
+
+    if args.command == "import":
+        scan_id = args.scan_id or new_scan_ts()
+        for table, source in STAGE_OUTPUTS.items():
+            if not Path(source).exists():
+                print(f"[!] {source} not found, skipping {table}")
+                continue
+            record_history(table, iter_records(source), scan_id, args.db)
+        return
+
+    with ScanHistory(args.db) as history:
+        if args.command == "scans":
+            result = history.scans()
+        elif args.command == "host":
+            result = {
+                "seen": history.seen_range(args.host),
+                "cert_changes": history.cert_changes(args.host),
+                "history": history.host_history(args.host),
+            }
+        elif args.command == "cert":
+            result = history.hosts_with_cert(args.fingerprint)
+        else:
+            result = history.churn(args.scan_a, args.scan_b)
+
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
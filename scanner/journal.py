@@ -0,0 +1,54 @@
+import json
+from pathlib import Path
+from typing import Optional, Set, Tuple
+
+from scanner.records import iter_ndjson
+
+
+JOURNAL_DIR = Path("data/journal")
+
+
+class ScanJournal:
+    """Append-only log of the (host, port) targets a stage has finished.
+
+    Every completed probe is recorded, including failures, so a resumed
+    run skips dead hosts as well as the ones that produced a result.
+    """
+
+    def __init__(self, stage: str, resume: bool = False, directory: Path = JOURNAL_DIR):
+        self.stage = stage
+        self.path = Path(directory) / f"{stage}.ndjson"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.done: Set[Tuple[str, int]] = set()
+
+        if resume and self.path.exists():
+            for entry in iter_ndjson(self.path):
+                self.done.add((entry["host"], entry["port"]))
+
+        self.resumed = len(self.done)
+        self._f = open(self.path, "a" if resume else "w")
+
+    def is_done(self, host: str, port: int) -> bool:
+        return (host, port) in self.done
+
+    def mark_done(self, host: str, port: int, ok: bool):
+        if (host, port) in self.done:
+            return
+
+        self.done.add((host, port))
+        entry = {"stage": self.stage, "host": host, "port": port, "ok": ok}
+        self._f.write(json.dumps(entry) + "\n")
+        self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def skip_done(journal: Optional[ScanJournal], host: str, port: int) -> bool:
+    return journal is not None and journal.is_done(host, port)
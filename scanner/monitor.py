@@ -0,0 +1,382 @@
+import argparse
+import asyncio
+import heapq
+import json
+import random
+import signal
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from scanner.adaptive import AdaptiveController, adaptive_from_args, add_adaptive_args
+from scanner.canonical import DEFAULT_HASH, add_hash_args
+from scanner.discovery import ElectrumDiscovery
+from scanner.peers import DEFAULT_SSL_PORT, DEFAULT_TCP_PORT, PeerRecord, canonical_host
+from scanner.records import NDJSONWriter, iter_records
+from scanner.resolver import dns_summary
+from scanner.tls_analyzer import require_cryptography
+from scanner.transport import DEFAULT_POLICY, POLICIES
+from scanner.validator import ElectrumValidator
+
+
+MONITOR_DIR = Path("data/monitor")
+STATE_PATH = MONITOR_DIR / "state.json"
+EVENTS_PATH = MONITOR_DIR / "events.ndjson"
+SCORES_PATH = Path("data/honeypot_score/honeypot_scores.json")
+
+DEFAULT_SEEDS = [
+    "electrum3.bluewallet.io:50002",
+    "electrum.blockstream.info:50002",
+    "electrum.emzy.de:50002",
+]
+
+# a host at honeypot score 100 comes due three times as often
+SCORE_WEIGHT = 2.0
+# hosts that changed within this many seconds are rescanned twice as often
+RECENT_CHANGE_S = 24 * 3600
+# hosts that are down are retried at a quarter of the rate
+DOWN_WEIGHT = 0.25
+
+
+def parse_seed(seed: str) -> Tuple[str, int]:
+    host, _, port = seed.rpartition(":")
+    if not host or not port.isdigit():
+        return seed, DEFAULT_SSL_PORT
+    return host, int(port)
+
+
+def utc_iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat(timespec="seconds")
+
+
+@dataclass(slots=True)
+class HostState:
+    host: str
+    port: int
+    tcp_port: int = DEFAULT_TCP_PORT
+    first_seen: float = 0.0
+    last_probe: Optional[float] = None
+    last_online: Optional[float] = None
+    # None until the first probe settles it
+    online: Optional[bool] = None
+    failures: int = 0
+    cert: Optional[str] = None
+    version_hash: Optional[str] = None
+    banner_hash: Optional[str] = None
+    changed_at: Optional[float] = None
+    honeypot_score: float = 0.0
+
+    @property
+    def key(self) -> Tuple[str, int]:
+        return self.host, self.port
+
+    def priority(self, now: float, interval: float) -> float:
+        # cycles since the last probe, scaled up for suspicious and
+        # recently changed hosts and down for dead ones
+        if self.last_probe is None:
+            return float("inf")
+
+        p = (now - self.last_probe) / interval
+        p *= 1 + SCORE_WEIGHT * self.honeypot_score / 100
+        if self.changed_at is not None and now - self.changed_at < RECENT_CHANGE_S:
+            p *= 2
+        if self.online is False:
+            p *= DOWN_WEIGHT
+        return p
+
+
+class NetworkMonitor:
+    """Long-running rescans of the known Electrum servers.
+
+    Every cycle the `budget` most overdue hosts are probed once each
+    (version, banner and certificate over one connection). Every
+    `discover_every` cycles the seeds and a few known servers are asked
+    for their peer lists to pick up new hosts. Differences from the
+    last probe are written as events:
+
+        new_host, host_disappeared, host_returned, cert_rotated,
+        version_changed, banner_changed
+
+    State survives restarts in `state_path`.
+    """
+
+    def __init__(self, seeds: List[Tuple[str, int]], interval: float = 300, budget: int = 500,
+                 discover_every: int = 6, gossip: int = 5, down_after: int = 2, timeout: float = 4,
+                 max_concurrent: int = 200, connect_policy: str = DEFAULT_POLICY,
+                 hash_algorithm: str = DEFAULT_HASH, adaptive: Optional[AdaptiveController] = None,
+                 state_path: Path = STATE_PATH, events_path: Path = EVENTS_PATH):
+        self.seeds = seeds
+        self.interval = interval
+        self.budget = budget
+        self.discover_every = discover_every
+        self.gossip = gossip
+        self.down_after = down_after
+        self.hash_algorithm = hash_algorithm
+        self.adaptive = adaptive
+        self.state_path = Path(state_path)
+        self.events_path = Path(events_path)
+
+        self.validator = ElectrumValidator(timeout=timeout, max_concurrent=max_concurrent,
+                                           connect_policy=connect_policy, hash_algorithm=hash_algorithm,
+                                           adaptive=adaptive)
+        self.discovery = ElectrumDiscovery(timeout=timeout, max_concurrent=max_concurrent,
+                                           connect_policy=connect_policy, adaptive=adaptive)
+
+        self.hosts: Dict[Tuple[str, int], HostState] = {}
+        self.cycle = 0
+        self.events: Optional[NDJSONWriter] = None
+        self.cycle_events = 0
+        self.scores: Dict[str, float] = {}
+        self._scores_mtime = None
+        self._stop: Optional[asyncio.Event] = None
+
+
+    def load(self):
+        if self.state_path.exists():
+            with open(self.state_path, "r") as f:
+                state = json.load(f)
+            self.cycle = state["cycle"]
+            for h in state["hosts"]:
+                s = HostState(**h)
+                # hashes from another algorithm would all look changed
+                if state.get("hash_algorithm") != self.hash_algorithm:
+                    s.version_hash = s.banner_hash = None
+                self.hosts[s.key] = s
+            print(f"[*] Resumed monitor state: {len(self.hosts)} hosts, cycle {self.cycle}")
+            return
+
+        self.bootstrap()
+
+    def bootstrap(self):
+        # the last one-shot scan is the baseline, so its hosts raise no new_host events
+        now = time.time()
+        peers_path = Path("data/peers/peers.json")
+        for r in iter_records(peers_path) if peers_path.exists() else ():
+            peer = PeerRecord.from_record(r)
+            if peer.port is not None and peer.key not in self.hosts:
+                self.hosts[peer.key] = HostState(peer.host, peer.port, peer.tcp_port, first_seen=now)
+
+        certs = {}
+        if Path("data/tls_certs/tls_certs.json").exists():
+            certs = {canonical_host(c["host"]): c["fingerprint_sha256"]
+                     for c in iter_records("data/tls_certs/tls_certs.json")}
+        for s in self.hosts.values():
+            s.cert = certs.get(s.host)
+
+        print(f"[*] Bootstrapped {len(self.hosts)} hosts from the last scan")
+
+    def save(self):
+        state = {
+            "cycle": self.cycle,
+            "hash_algorithm": self.hash_algorithm,
+            "hosts": [asdict(s) for s in self.hosts.values()],
+        }
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.state_path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        tmp.replace(self.state_path)
+
+    def refresh_scores(self):
+        # picked up whenever honeypot_score.py has written a new file
+        if not SCORES_PATH.exists():
+            return
+        mtime = SCORES_PATH.stat().st_mtime
+        if mtime == self._scores_mtime:
+            return
+        self._scores_mtime = mtime
+
+        self.scores = {}
+        with open(SCORES_PATH, "r") as f:
+            for r in json.load(f):
+                host = canonical_host(r["host"])
+                self.scores[host] = max(self.scores.get(host, 0), r.get("honeypot_score") or 0)
+        for s in self.hosts.values():
+            s.honeypot_score = self.scores.get(s.host, 0)
+
+
+    def emit(self, event: str, s: HostState, now: float, **details):
+        record = {"ts": utc_iso(now), "cycle": self.cycle, "event": event, "host": s.host, "port": s.port,
+                  **details}
+        self.events.write(record)
+        self.cycle_events += 1
+
+        marker = "[✗]" if event == "host_disappeared" else "[!]" if event in ("cert_rotated", "version_changed") \
+            else "[+]"
+        extra = " ".join(f"{k}={v}" for k, v in details.items())
+        print(f"{marker} {event}: {s.host}:{s.port} {extra}".rstrip())
+
+    def add_peers(self, peers: Iterable[PeerRecord], source: str, now: float) -> int:
+        added = 0
+        for peer in peers:
+            if peer.port is None or peer.key in self.hosts:
+                continue
+            s = self.hosts[peer.key] = HostState(peer.host, peer.port, peer.tcp_port, first_seen=now,
+                                                 honeypot_score=self.scores.get(peer.host, 0))
+            self.emit("new_host", s, now, source=source)
+            added += 1
+        return added
+
+    async def discover(self, now: float) -> int:
+        # the seeds plus a few random known servers, one peers.subscribe each
+        online = [s for s in self.hosts.values() if s.online]
+        sources = list(self.seeds) + [s.key for s in random.sample(online, min(self.gossip, len(online)))]
+
+        async def ask(host, port):
+            raw = await self.discovery.connect_and_request(host, port)
+            return self.discovery.parse_peers(raw) if raw else []
+
+        replies = await asyncio.gather(*(ask(h, p) for h, p in sources), return_exceptions=True)
+
+        added = 0
+        for (host, port), peers in zip(sources, replies):
+            if isinstance(peers, BaseException):
+                print(f"[!] Peer list from {host}:{port} failed: {peers}")
+                continue
+            added += self.add_peers(peers, f"{host}:{port}", now)
+        return added
+
+    def select(self, now: float) -> List[HostState]:
+        return heapq.nlargest(self.budget, self.hosts.values(), key=lambda s: s.priority(now, self.interval))
+
+    async def probe(self, s: HostState):
+        try:
+            record, cert = await self.validator.probe(s.host, s.port, capture_cert=True, tcp_port=s.tcp_port)
+        except Exception as e:
+            print(f"[!] Probe error on {s.host}:{s.port}: {e}")
+            record, cert = None, None
+        self.update(s, record, cert, time.time())
+
+    def update(self, s: HostState, record: Optional[Dict], cert: Optional[Dict], now: float):
+        s.last_probe = now
+
+        if record is None:
+            s.failures += 1
+            if s.failures >= self.down_after and s.online is not False:
+                if s.online:
+                    self.emit("host_disappeared", s, now, last_online=utc_iso(s.last_online))
+                    s.changed_at = now
+                s.online = False
+            return
+
+        if s.online is False:
+            self.emit("host_returned", s, now)
+            s.changed_at = now
+        s.online = True
+        s.failures = 0
+        s.last_online = now
+
+        fp = cert["fingerprint_sha256"] if cert else None
+        if fp and s.cert and fp != s.cert:
+            self.emit("cert_rotated", s, now, old=s.cert, new=fp)
+            s.changed_at = now
+        s.cert = fp or s.cert
+
+        for attr, event in (("version_hash", "version_changed"), ("banner_hash", "banner_changed")):
+            new, old = record.get(attr), getattr(s, attr)
+            if new and old and new != old:
+                self.emit(event, s, now, old=old, new=new)
+                s.changed_at = now
+            setattr(s, attr, new or old)
+
+
+    async def run_cycle(self):
+        self.cycle += 1
+        self.cycle_events = 0
+        started = time.time()
+        self.refresh_scores()
+
+        added = 0
+        if (self.cycle - 1) % self.discover_every == 0:
+            added = await self.discover(started)
+
+        batch = self.select(started)
+        await asyncio.gather(*(self.probe(s) for s in batch))
+        self.save()
+
+        online = sum(1 for s in self.hosts.values() if s.online)
+        print(f"\n[✓] Cycle {self.cycle}: probed {len(batch)}/{len(self.hosts)} hosts, {online} online, "
+              f"{added} new, {self.cycle_events} events ({time.time() - started:.1f}s)")
+        print(f"[✓] DNS: {dns_summary()}")
+        if self.adaptive:
+            self.adaptive.print_summary()
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+
+    async def run(self, cycles: Optional[int] = None):
+        self._stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        self.load()
+        with NDJSONWriter(self.events_path, append=True) as events:
+            self.events = events
+            done = 0
+            while not self._stop.is_set():
+                started = time.monotonic()
+                await self.run_cycle()
+                done += 1
+                if cycles is not None and done >= cycles:
+                    break
+
+                # the next cycle starts `interval` after this one started
+                try:
+                    await asyncio.wait_for(self._stop.wait(), timeout=max(0, self.interval - (time.monotonic() - started)))
+                except asyncio.TimeoutError:
+                    pass
+
+        print(f"[✓] Monitor stopped after cycle {self.cycle}; state saved to {self.state_path}")
+
+
+async def main():
+    p = argparse.ArgumentParser(description="Continuously rescan known Electrum servers and report changes")
+    p.add_argument("--seeds", nargs="+", default=DEFAULT_SEEDS, help="host:port servers asked for peer lists")
+    p.add_argument("--interval", type=float, default=300, help="seconds between cycle starts")
+    p.add_argument("--budget", type=int, default=500, help="hosts probed per cycle")
+    p.add_argument("--discover-every", type=int, default=6, help="ask the seeds for peers every N cycles")
+    p.add_argument("--gossip", type=int, default=5, help="known servers also asked for peers on discovery cycles")
+    p.add_argument("--down-after", type=int, default=2, help="failed probes in a row before a host is down")
+    p.add_argument("--cycles", type=int, default=None, help="stop after N cycles (default: run until stopped)")
+    p.add_argument("--max-concurrent", type=int, default=200, help="probes running at the same time")
+    p.add_argument("--timeout", type=float, default=4, help="connect/request timeout (s)")
+    p.add_argument("--connect-policy", choices=POLICIES, default=DEFAULT_POLICY,
+                   help="ssl-only, prefer-ssl (TCP after SSL fails) or race (SSL and TCP staggered)")
+    p.add_argument("--state", type=Path, default=STATE_PATH)
+    p.add_argument("--events", type=Path, default=EVENTS_PATH)
+    add_hash_args(p)
+    add_adaptive_args(p)
+    args = p.parse_args()
+
+    require_cryptography()
+
+    monitor = NetworkMonitor(
+        seeds=[parse_seed(s) for s in args.seeds],
+        interval=args.interval,
+        budget=args.budget,
+        discover_every=args.discover_every,
+        gossip=args.gossip,
+        down_after=args.down_after,
+        timeout=args.timeout,
+        max_concurrent=args.max_concurrent,
+        connect_policy=args.connect_policy,
+        hash_algorithm=args.hash_algorithm,
+        adaptive=adaptive_from_args(args, timeout=args.timeout),
+        state_path=args.state,
+        events_path=args.events,
+    )
+
+    print(f"[+] Monitoring from {len(monitor.seeds)} seeds, {args.budget} probes every {args.interval:.0f}s")
+    await monitor.run(args.cycles)
+    print(f"[✓] Events written to {args.events}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
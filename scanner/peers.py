@@ -0,0 +1,117 @@
+import ipaddress
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+DEFAULT_SSL_PORT = 50002
+DEFAULT_TCP_PORT = 50001
+
+
+# every server shows up once per peer that reports it, so the same few
+# hundred hosts are parsed over and over
+@lru_cache(maxsize=65536)
+def canonical_host(host: str) -> str:
+    # one spelling per address ("::FFFF:1.2.3.4" is 1.2.3.4); names lowercased
+    try:
+        ip = ipaddress.ip_address(host)
+    except ValueError:
+        return host.lower().rstrip(".")
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return str(ip)
+
+
+def _port(value: str, default: int) -> Optional[int]:
+    # a bare "s" or "t" means the protocol's default port
+    if not value:
+        return default
+    return int(value) if value.isdigit() and 0 < int(value) < 65536 else None
+
+
+def parse_features(features: Iterable) -> Tuple[Optional[str], Optional[int], Optional[int], Optional[int]]:
+    """(version, pruning, ssl port, tcp port) from a peer's feature list,
+    e.g. ["v1.4.2", "p10000", "s50002", "t50001"]."""
+    version = pruning = ssl = tcp = None
+
+    for f in features:
+        if not isinstance(f, str) or not f:
+            continue
+        kind, value = f[0], f[1:]
+        if kind == "s":
+            ssl = _port(value, DEFAULT_SSL_PORT)
+        elif kind == "t":
+            tcp = _port(value, DEFAULT_TCP_PORT)
+        elif kind == "v":
+            version = value or None
+        elif kind == "p" and value.isdigit():
+            pruning = int(value)
+
+    return version, pruning, ssl, tcp
+
+
+@dataclass(slots=True)
+class PeerRecord:
+    """One entry of a server.peers.subscribe reply: [ip, hostname, features]."""
+
+    host: str
+    hostname: Optional[str]
+    ssl: Optional[int]
+    tcp: Optional[int]
+    version: Optional[str] = None
+    pruning: Optional[int] = None
+    raw: List = field(default_factory=list)
+
+    @classmethod
+    def from_entry(cls, entry) -> Optional["PeerRecord"]:
+        if not isinstance(entry, (list, tuple)) or len(entry) < 3 or not isinstance(entry[0], str):
+            return None
+        features = entry[2] if isinstance(entry[2], (list, tuple)) else []
+        version, pruning, ssl, tcp = parse_features(features)
+        hostname = entry[1] if isinstance(entry[1], str) and entry[1] else None
+        return cls(canonical_host(entry[0]), hostname, ssl, tcp, version, pruning, list(entry))
+
+    @classmethod
+    def from_record(cls, r: Dict) -> "PeerRecord":
+        # records written before the features were parsed correctly are re-read from "raw"
+        peer = cls.from_entry(r.get("raw"))
+        if peer is None:
+            peer = cls(r["host"], None, r.get("ssl"), r.get("tcp"), r.get("version"), r.get("pruning"),
+                       r.get("raw") or [])
+        return peer
+
+    @property
+    def port(self) -> Optional[int]:
+        # SSL when advertised, otherwise plain TCP
+        return self.ssl or self.tcp
+
+    @property
+    def tcp_port(self) -> int:
+        return self.tcp or DEFAULT_TCP_PORT
+
+    @property
+    def key(self) -> Tuple[str, Optional[int]]:
+        return self.host, self.port
+
+    def to_dict(self) -> Dict:
+        return {
+            "host": self.host,
+            "hostname": self.hostname,
+            "ssl": self.ssl,
+            "tcp": self.tcp,
+            "version": self.version,
+            "pruning": self.pruning,
+            "raw": self.raw,
+        }
+
+
+def parse_peers(raw_peers: Iterable) -> List[PeerRecord]:
+    """Typed records for a whole peers.subscribe reply in one pass,
+    one per canonical (ip, port); malformed entries and entries
+    advertising no port are dropped."""
+    peers: Dict[Tuple[str, int], PeerRecord] = {}
+    for entry in raw_peers or ():
+        peer = PeerRecord.from_entry(entry)
+        if peer is not None and peer.port is not None:
+            peers.setdefault(peer.key, peer)
+    return list(peers.values())
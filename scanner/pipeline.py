@@ -0,0 +1,201 @@
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from scanner.adaptive import AdaptiveController, adaptive_from_args, add_adaptive_args
+from scanner.canonical import DEFAULT_HASH, add_hash_args
+from scanner.columnar import add_columnar_args, new_scan_ts, require_pyarrow, write_columnar
+from scanner.discovery import ElectrumDiscovery
+from scanner.history import add_history_args, record_history
+from scanner.records import NDJSONWriter, ndjson_path
+from scanner.resolver import EndpointSet, dns_summary
+from scanner.timing import PhaseHistogram
+from scanner.tls_analyzer import require_cryptography
+from scanner.tls_context import handshake_summary
+from scanner.transport import DEFAULT_POLICY, POLICIES
+from scanner.validator import ElectrumValidator
+
+
+class NetworkPipeline:
+    """Discovery, validation and certificate capture in a single process.
+
+    Peers are validated as soon as the crawler reports them, and the
+    certificate is taken from the validation connection itself, so the
+    separate tls_analyzer handshake is saved: each online server costs
+    two connections per run (crawl and validation) instead of three.
+    """
+
+    def __init__(self, timeout: int = 4, max_concurrent: int = 200, max_depth: int = 2,
+                 connect_policy: str = DEFAULT_POLICY, queue_size: int = 1000,
+                 hash_algorithm: str = DEFAULT_HASH, adaptive: Optional[AdaptiveController] = None):
+        self.discovery = ElectrumDiscovery(
+            timeout=timeout,
+            max_concurrent=max_concurrent,
+            max_depth=max_depth,
+            connect_policy=connect_policy,
+            on_peers=self._enqueue_peers,
+            adaptive=adaptive,
+        )
+        self.validator = ElectrumValidator(
+            timeout=timeout,
+            max_concurrent=max_concurrent,
+            connect_policy=connect_policy,
+            hash_algorithm=hash_algorithm,
+            adaptive=adaptive,
+        )
+        # crawl and validation share one controller, so both back off together
+        self.adaptive = adaptive
+        self.workers = adaptive.max_concurrency if adaptive else max_concurrent
+
+        # bounded, so a fast crawl waits for validation instead of piling up
+        self.peer_queue = asyncio.Queue(maxsize=queue_size)
+        self.result_queue = asyncio.Queue(maxsize=queue_size)
+
+        # one validation per physical server, whichever name it was reported under
+        self.queued = EndpointSet()
+        self.online_peers: List[Dict] = []
+        self.tls_certs: List[Dict] = []
+
+        # optional per-record sinks, called as results stream through
+        self.peer_sink: Optional[Callable[[Dict], None]] = None
+        self.online_sink: Optional[Callable[[Dict], None]] = None
+        self.cert_sink: Optional[Callable[[Dict], None]] = None
+
+
+    async def _enqueue_peers(self, peers: List[Dict]):
+        for p in peers:
+            if self.peer_sink is not None:
+                self.peer_sink(p)
+
+            host, port, tcp_port = self.validator.target(p)
+            if not await self.queued.claim(host, port):
+                continue
+
+            await self.peer_queue.put((host, port, tcp_port))
+
+    async def _validate_worker(self):
+        while True:
+            host, port, tcp_port = await self.peer_queue.get()
+            try:
+                record, cert = await self.validator.probe(host, port, capture_cert=True, tcp_port=tcp_port)
+                if record is not None:
+                    await self.result_queue.put((record, cert))
+            except Exception as e:
+                print(f"[!] Validation error on {host}:{port}: {e}")
+            finally:
+                self.peer_queue.task_done()
+
+    async def _collect(self):
+        while True:
+            record, cert = await self.result_queue.get()
+            try:
+                self.online_peers.append(record)
+                if self.online_sink is not None:
+                    self.online_sink(record)
+
+                if cert is not None:
+                    self.tls_certs.append(cert)
+                    if self.cert_sink is not None:
+                        self.cert_sink(cert)
+            finally:
+                self.result_queue.task_done()
+
+
+    async def run(self, seed_host: str, seed_port: int = 50002) -> List[Dict]:
+        tasks = [asyncio.create_task(self._validate_worker()) for _ in range(self.workers)]
+        tasks.append(asyncio.create_task(self._collect()))
+
+        try:
+            peers = await self.discovery.crawl_network(seed_host=seed_host, seed_port=seed_port)
+            await self.peer_queue.join()
+            await self.result_queue.join()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        return peers
+
+
+def write_json(records, path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(records, f, indent=2)
+
+
+async def main():
+    p = argparse.ArgumentParser(description="Discovery, validation and TLS capture in a single pass")
+    p.add_argument("--seed", default="electrum3.bluewallet.io")
+    p.add_argument("--seed-port", type=int, default=50002)
+    p.add_argument("--connect-policy", choices=POLICIES, default=DEFAULT_POLICY,
+                   help="ssl-only, prefer-ssl (TCP after SSL fails) or race (SSL and TCP staggered)")
+    add_hash_args(p)
+    add_adaptive_args(p)
+    add_columnar_args(p)
+    add_history_args(p)
+    args = p.parse_args()
+
+    if args.columnar:
+        require_pyarrow()
+    require_cryptography()
+
+    pipeline = NetworkPipeline(connect_policy=args.connect_policy, hash_algorithm=args.hash_algorithm,
+                               adaptive=adaptive_from_args(args))
+
+    peers_path = Path("data/peers/peers.json")
+    online_path = Path("data/online_peers/online_peers.json")
+    certs_path = Path("data/tls_certs/tls_certs.json")
+
+    with NDJSONWriter(ndjson_path(peers_path)) as peers_out, \
+         NDJSONWriter(ndjson_path(online_path)) as online_out, \
+         NDJSONWriter(ndjson_path(certs_path)) as certs_out:
+
+        pipeline.peer_sink = peers_out.write
+        pipeline.online_sink = online_out.write
+        pipeline.cert_sink = certs_out.write
+
+        started = time.perf_counter()
+        peers = await pipeline.run(args.seed, args.seed_port)
+        elapsed = time.perf_counter() - started
+
+    # same files the three stage scripts produce
+    write_json(peers, peers_path)
+    write_json(pipeline.discovery.crawl_stats, Path("data/peers/crawl_stats.json"))
+    write_json(pipeline.online_peers, online_path)
+    write_json(pipeline.tls_certs, certs_path)
+
+    timing = PhaseHistogram().add_all(pipeline.online_peers)
+    timing.save(Path("data/online_peers/timing_summary.json"))
+
+    # one scan id for all tables of the run
+    scan_id = args.scan_id or new_scan_ts()
+
+    if args.columnar:
+        write_columnar("peers", peers, scan_id)
+        write_columnar("online_peers", pipeline.online_peers, scan_id)
+        write_columnar("tls_certs", pipeline.tls_certs, scan_id)
+
+    if args.history:
+        record_history("peers", peers, scan_id)
+        record_history("online_peers", pipeline.online_peers, scan_id)
+        record_history("tls_certs", pipeline.tls_certs, scan_id)
+
+    print("\n==============================")
+    print("     PIPELINED NETWORK SCAN")
+    print("==============================\n")
+    print(f"[✓] Peers discovered: {len(peers)}")
+    print(f"[✓] Peers online: {len(pipeline.online_peers)}")
+    print(f"[✓] Certificates collected: {len(pipeline.tls_certs)}")
+    print(f"[✓] TLS handshakes: {handshake_summary()}")
+    print(f"[✓] DNS: {dns_summary()}")
+    print(f"[✓] Run time: {elapsed:.2f}s\n")
+    if pipeline.adaptive:
+        pipeline.adaptive.print_summary()
+    timing.print_summary()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+import json
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+
+PathLike = Union[str, Path]
+
+
+def ndjson_path(path: PathLike) -> Path:
+    return Path(path).with_suffix(".ndjson")
+
+
+class NDJSONWriter:
+    """Append-only, one JSON record per line, flushed after every record.
+
+    A crash mid-run leaves every finished record on disk; at worst the
+    last line is truncated, which the readers below skip.
+    """
+
+    def __init__(self, path: PathLike, append: bool = False):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.count = 0
+        self._f = open(self.path, "a" if append else "w")
+
+    def write(self, record: Dict):
+        self._f.write(json.dumps(record) + "\n")
+        self._f.flush()
+        self.count += 1
+
+    def write_many(self, records: Iterable[Dict]):
+        for r in records:
+            self._f.write(json.dumps(r) + "\n")
+            self.count += 1
+        self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_ndjson(path: PathLike) -> Iterator[Dict]:
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # truncated tail of an interrupted run
+                continue
+
+
+def iter_records(path: PathLike) -> Iterator[Dict]:
+    """Stream the records of a stage output.
+
+    `path` may name either format. For a .json path the .ndjson sibling
+    is preferred when it exists, since it is streamed line by line
+    instead of being loaded whole.
+    """
+    path = Path(path)
+
+    if path.suffix == ".ndjson":
+        yield from iter_ndjson(path)
+        return
+
+    nd = ndjson_path(path)
+    if nd.exists():
+        yield from iter_ndjson(nd)
+        return
+
+    with open(path, "r") as f:
+        yield from json.load(f)
+
+
+def merge_records(records: Iterable[Dict], key=("host", "port")) -> List[Dict]:
+    # the last record per key wins, so a resumed run overrides older partials
+    merged = {}
+    for r in records:
+        k = tuple(r.get(f) for f in key)
+        merged.pop(k, None)
+        merged[k] = r
+    return list(merged.values())
+
+
+async def streamed(coro, on_result: Optional[Callable[[Dict], None]], journal=None,
+                   host: Optional[str] = None, port: Optional[int] = None):
+    # hands each finished result to the sink as soon as it completes
+    result = await coro
+    if result and on_result is not None:
+        on_result(result)
+
+    # journaled only once the result is on disk: a crash in between means
+    # the target is probed again, never that it is lost
+    if journal is not None:
+        journal.mark_done(host, port, bool(result))
+    return result
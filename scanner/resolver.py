@@ -0,0 +1,229 @@
+import asyncio
+import ipaddress
+import itertools
+import socket
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+DEFAULT_TTL = 300.0
+NEGATIVE_TTL = 60.0
+MAX_CONCURRENT_LOOKUPS = 64
+
+
+def _ip(host: str) -> Optional[str]:
+    try:
+        return str(ipaddress.ip_address(host))
+    except ValueError:
+        return None
+
+
+def _interleave(infos) -> List[str]:
+    # address families alternate, as RFC 8305 asks
+    by_family: Dict[int, List[str]] = {}
+    for family, _, _, _, sockaddr in infos:
+        addrs = by_family.setdefault(family, [])
+        if sockaddr[0] not in addrs:
+            addrs.append(sockaddr[0])
+
+    interleaved = []
+    for group in itertools.zip_longest(*by_family.values()):
+        interleaved.extend(a for a in group if a is not None)
+    return interleaved
+
+
+def _retrieve(fut: asyncio.Future):
+    # failures are cached, so a lookup nobody waited for is not an error
+    if not fut.cancelled():
+        fut.exception()
+
+
+class DNSResolver:
+    """Resolver shared by every scanner stage.
+
+    Answers are cached for `ttl` seconds and failures for `negative_ttl`,
+    concurrent lookups of one name share a single query, and at most
+    `max_concurrent` queries run at once, so a large frontier doesn't
+    flood the getaddrinfo thread pool.
+
+    It also keeps the alias map: hostnames advertised next to an IP in
+    peer entries, and every address a name resolved to, point at one
+    canonical address, so `endpoint()` gives the same key for every
+    spelling of a physical server.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TTL, negative_ttl: float = NEGATIVE_TTL,
+                 max_concurrent: int = MAX_CONCURRENT_LOOKUPS):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_concurrent = max_concurrent
+
+        # name -> (expires, addresses or the lookup error)
+        self._cache: Dict[str, Tuple[float, object]] = {}
+        self.names: Dict[str, str] = {}
+        self.canonical: Dict[str, str] = {}
+
+        # futures and the semaphore belong to one event loop
+        self._loop = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._prefetching: Set[asyncio.Task] = set()
+
+        self.lookups = 0
+        self.hits = 0
+        self.coalesced = 0
+        self.failures = 0
+
+    def _bind(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._inflight = {}
+            self._sem = asyncio.Semaphore(self.max_concurrent)
+
+    async def _lookup(self, name: str) -> List[str]:
+        async with self._sem:
+            self.lookups += 1
+            try:
+                if name.endswith(".onion"):
+                    raise socket.gaierror(socket.EAI_NONAME, "onion addresses are only reachable over Tor")
+                infos = await asyncio.get_running_loop().getaddrinfo(name, None, type=socket.SOCK_STREAM)
+                addrs = _interleave(infos)
+                self._cache[name] = (time.monotonic() + self.ttl, addrs)
+                self._link(addrs)
+                return addrs
+            except OSError as e:
+                self.failures += 1
+                self._cache[name] = (time.monotonic() + self.negative_ttl, e)
+                raise
+            finally:
+                self._inflight.pop(name, None)
+
+    async def resolve(self, host: str) -> List[str]:
+        """Addresses for `host`; an IP address resolves to itself."""
+        ip = _ip(host)
+        if ip is not None:
+            return [ip]
+
+        name = host.lower().rstrip(".")
+        entry = self._cache.get(name)
+        if entry is not None and entry[0] >= time.monotonic():
+            self.hits += 1
+            if isinstance(entry[1], BaseException):
+                raise entry[1]
+            return entry[1]
+
+        self._bind()
+        fut = self._inflight.get(name)
+        if fut is None:
+            fut = self._inflight[name] = asyncio.ensure_future(self._lookup(name))
+            fut.add_done_callback(_retrieve)
+        else:
+            self.coalesced += 1
+
+        # one caller's timeout must not cancel the query for the others
+        return await asyncio.shield(fut)
+
+    async def resolve_many(self, hosts: Iterable[str]) -> Dict[str, Optional[List[str]]]:
+        hosts = list(dict.fromkeys(hosts))
+        answers = await asyncio.gather(*(self.resolve(h) for h in hosts), return_exceptions=True)
+        return {h: (None if isinstance(a, BaseException) else a) for h, a in zip(hosts, answers)}
+
+    def prefetch(self, hosts: Iterable[str]):
+        """Start resolving `hosts` in the background, ahead of their connects."""
+        self._bind()
+        for host in hosts:
+            name = host.lower().rstrip(".")
+            if _ip(host) is not None or name in self._inflight or name.endswith(".onion"):
+                continue
+            entry = self._cache.get(name)
+            if entry is not None and entry[0] >= time.monotonic():
+                continue
+
+            task = asyncio.ensure_future(self.resolve(host))
+            self._prefetching.add(task)
+            task.add_done_callback(self._prefetching.discard)
+            task.add_done_callback(_retrieve)
+
+
+    def _link(self, addrs: Iterable[str]):
+        addrs = list(addrs)
+        canon = next((self.canonical[a] for a in addrs if a in self.canonical), addrs[0] if addrs else None)
+        for a in addrs:
+            self.canonical.setdefault(a, canon)
+
+    def add_alias(self, name: str, ip: str):
+        ip = _ip(ip)
+        if ip is None or not name or _ip(name) is not None:
+            return
+        self.names.setdefault(name.lower().rstrip("."), ip)
+        self.canonical.setdefault(ip, ip)
+
+    def add_peer(self, raw):
+        # peer entries: [ip, hostname, features]
+        if isinstance(raw, (list, tuple)) and len(raw) >= 2 and isinstance(raw[0], str) \
+                and isinstance(raw[1], str):
+            self.add_alias(raw[1], raw[0])
+
+    async def endpoint(self, host: str, port: int) -> Tuple[str, int]:
+        """Key shared by every name and address of one physical server."""
+        ip = _ip(host)
+        if ip is not None:
+            return self.canonical.setdefault(ip, ip), port
+
+        name = host.lower().rstrip(".")
+        if name in self.names:
+            ip = self.names[name]
+            return self.canonical.setdefault(ip, ip), port
+
+        try:
+            addrs = await self.resolve(name)
+        except OSError:
+            # unresolvable (onion, NXDOMAIN): the name is its own endpoint
+            return name, port
+        if not addrs:
+            return name, port
+        return self.canonical[addrs[0]], port
+
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "lookups": self.lookups,
+            "cache_hits": self.hits,
+            "coalesced": self.coalesced,
+            "failures": self.failures,
+            "aliases": len(self.names),
+        }
+
+
+class EndpointSet:
+    """Physical endpoints one stage has already claimed."""
+
+    def __init__(self, resolver: Optional[DNSResolver] = None):
+        self.resolver = resolver or get_resolver()
+        self.seen: Set[Tuple[str, int]] = set()
+        self.duplicates = 0
+
+    async def claim(self, host: str, port: int) -> bool:
+        key = await self.resolver.endpoint(host, port)
+        if key in self.seen:
+            self.duplicates += 1
+            return False
+        self.seen.add(key)
+        return True
+
+
+_resolver: Optional[DNSResolver] = None
+
+
+def get_resolver() -> DNSResolver:
+    global _resolver
+    if _resolver is None:
+        _resolver = DNSResolver()
+    return _resolver
+
+
+def dns_summary(s: Optional[Dict[str, int]] = None) -> str:
+    s = s or get_resolver().stats()
+    return (f"{s['lookups']} lookups, {s['cache_hits']} cached, {s['coalesced']} shared, "
+            f"{s['failures']} failed, {s['aliases']} aliases")
@@ -0,0 +1,221 @@
+import asyncio
+import copy
+import functools
+import importlib
+import math
+import multiprocessing
+import queue
+import time
+import zlib
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+from scanner.adaptive import print_adaptive_summary
+from scanner.peers import canonical_host
+from scanner.records import PathLike, iter_records
+from scanner.resolver import get_resolver
+from scanner.tls_context import get_ssl_context
+
+
+def require_uvloop():
+    if uvloop is None:
+        raise RuntimeError("--uvloop needs uvloop (pip install uvloop)")
+
+
+def install_uvloop():
+    require_uvloop()
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+
+def shard_of(host: str, shards: int) -> int:
+    # crc32 rather than hash(), which is salted differently in every process
+    return zlib.crc32(canonical_host(host).encode()) % shards
+
+
+async def plan_shards(input_path: PathLike, shards: int) -> Dict[str, int]:
+    """Shard of every host in `input_path`, keyed on its physical endpoint.
+
+    Hosts go through the resolver's alias map and DNS first, so an IP and
+    the hostnames advertised with or resolving to it land in the same
+    worker, whose EndpointSet then scans the server once.
+    """
+    resolver = get_resolver()
+    hosts = []
+    for p in iter_records(input_path):
+        resolver.add_peer(p.get("raw"))
+        hosts.append(p["host"])
+    hosts = list(dict.fromkeys(hosts))
+
+    endpoints = await asyncio.gather(*(resolver.endpoint(h, 0) for h in hosts))
+    return {host: shard_of(endpoint, shards) for host, (endpoint, _) in zip(hosts, endpoints)}
+
+
+def add_shard_args(p):
+    p.add_argument("--workers", type=int, default=1,
+                   help="worker processes, each scanning its own hash(host) shard on its own event loop; "
+                        "--max-concurrent is split between them")
+    p.add_argument("--uvloop", action="store_true", help="run the event loops on uvloop")
+
+
+def sharded(args) -> bool:
+    return args.workers > 1 or args.uvloop
+
+
+def _sum(dicts: List[Dict]) -> Dict:
+    total = {}
+    for d in dicts:
+        for k, v in d.items():
+            total[k] = total.get(k, 0) + v
+    return total
+
+
+def stage_stats(stage, elapsed: Optional[float] = None) -> Dict:
+    """Counters of one stage object, in the shape run_sharded merges."""
+    return {
+        "completed": stage.executor.completed,
+        "duplicates": stage.endpoints.duplicates,
+        "connections": getattr(stage, "connections", 0),
+        "handshakes": get_ssl_context().stats(),
+        "dns": get_resolver().stats(),
+        "adaptive": stage.adaptive.summary() if stage.adaptive else None,
+        "elapsed_s": round(elapsed, 3) if elapsed is not None else None,
+    }
+
+
+def merge_stats(shards: List[Dict]) -> Dict:
+    return {
+        "workers": len(shards),
+        "completed": sum(s["completed"] for s in shards),
+        "duplicates": sum(s["duplicates"] for s in shards),
+        "connections": sum(s["connections"] for s in shards),
+        "handshakes": _sum([s["handshakes"] for s in shards]),
+        "dns": _sum([s["dns"] for s in shards]),
+        "shards": shards,
+    }
+
+
+class ShardJournal:
+    """ScanJournal stand-in for a worker: reads the parent's finished
+    targets and sends completions back to be journaled there."""
+
+    def __init__(self, done: Set[Tuple[str, int]], results):
+        self.done = done
+        self.results = results
+
+    def is_done(self, host: str, port: int) -> bool:
+        return (host, port) in self.done
+
+    def mark_done(self, host: str, port: int, ok: bool):
+        self.results.put(("done", host, port, ok))
+
+
+def _load(factory: str) -> Callable:
+    module, _, name = factory.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+async def _run_shard(factory: str, method: str, args, input_path: PathLike, shard: int, shards: int,
+                     done: Set[Tuple[str, int]], results, assignment: Optional[Dict[str, int]]):
+    stage = _load(factory)(args)
+    if assignment is None:
+        peers = (p for p in iter_records(input_path) if shard_of(p["host"], shards) == shard)
+    else:
+        peers = (p for p in iter_records(input_path) if assignment.get(p["host"]) == shard)
+    journal = ShardJournal(done, results)
+
+    started = time.perf_counter()
+    async for _ in getattr(stage, method)(peers, on_result=lambda r: results.put(("result", r)), journal=journal):
+        pass
+
+    results.put(("exit", shard, {"shard": shard, **stage_stats(stage, time.perf_counter() - started)}))
+
+
+def _worker(factory: str, method: str, args, input_path: PathLike, shard: int, shards: int,
+            done: Set[Tuple[str, int]], results, assignment: Optional[Dict[str, int]]):
+    if args.uvloop:
+        install_uvloop()
+    asyncio.run(_run_shard(factory, method, args, input_path, shard, shards, done, results, assignment))
+
+
+def run_sharded(factory: str, method: str, args, input_path: PathLike,
+                on_result: Optional[Callable[[Dict], None]] = None, journal=None,
+                assignment: Optional[Dict[str, int]] = None) -> Dict:
+    """Run a stage over `input_path` in `args.workers` processes.
+
+    `factory` ("module:function") builds the stage from `args` in each
+    worker and `method` is its iter_* coroutine. Each worker reads the
+    input itself and keeps the hosts of its shard, taken from
+    `assignment` (see plan_shards) or else a hash of the host name, so
+    only results cross the process boundary. Results and journal entries
+    are handed to `on_result` and `journal` here, in the parent, as they
+    stream in.
+
+    Blocks until every worker is done; stages running on an event loop
+    call scan_sharded instead.
+    """
+    workers = args.workers
+    shard_args = copy.copy(args)
+    # the same total concurrency, split across the workers
+    shard_args.max_concurrent = math.ceil(args.max_concurrent / workers)
+    if hasattr(args, "max_concurrency"):
+        shard_args.max_concurrency = math.ceil(args.max_concurrency / workers)
+
+    done = set(journal.done) if journal is not None else set()
+
+    # spawn, not fork: the parent is inside a running event loop
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue(maxsize=10000)
+    procs = [
+        ctx.Process(target=_worker, daemon=True,
+                    args=(factory, method, shard_args, str(input_path), shard, workers, done, results, assignment))
+        for shard in range(workers)
+    ]
+    for proc in procs:
+        proc.start()
+
+    shards: Dict[int, Dict] = {}
+    try:
+        while len(shards) < workers:
+            try:
+                msg = results.get(timeout=1)
+            except queue.Empty:
+                for shard, proc in enumerate(procs):
+                    if shard not in shards and not proc.is_alive():
+                        raise RuntimeError(f"shard worker {shard} exited with code {proc.exitcode}")
+                continue
+
+            kind = msg[0]
+            if kind == "result":
+                if on_result is not None:
+                    on_result(msg[1])
+            elif kind == "done":
+                if journal is not None:
+                    journal.mark_done(*msg[1:])
+            elif kind == "exit":
+                shards[msg[1]] = msg[2]
+    finally:
+        for proc in procs:
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
+
+    return merge_stats([shards[i] for i in range(workers)])
+
+
+async def scan_sharded(factory: str, method: str, args, input_path: PathLike,
+                       on_result: Optional[Callable[[Dict], None]] = None, journal=None) -> Dict:
+    # the blocking wait for the workers runs on a thread, off the stage's loop
+    assignment = await plan_shards(input_path, args.workers)
+    run = functools.partial(run_sharded, factory, method, args, input_path, on_result, journal, assignment)
+    return await asyncio.get_running_loop().run_in_executor(None, run)
+
+
+def print_shards(stats: Dict):
+    for s in stats["shards"]:
+        print(f"[✓] Shard {s['shard']}: {s['completed']} targets in {s['elapsed_s']}s")
+        if s["adaptive"]:
+            print_adaptive_summary(s["adaptive"], label=f"Shard {s['shard']} adaptive control")
@@ -0,0 +1,98 @@
+import json
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+
+# per-probe phases, as exported into the stage records
+PHASES = ("dns_ms", "tcp_ms", "tls_ms", "ttfb_ms", "total_ms")
+
+# upper bucket edges in ms; the honeypot latency signals sit at 10 and 2000
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+def now_ns() -> int:
+    return time.perf_counter_ns()
+
+
+def elapsed_ms(start_ns: Optional[int], end_ns: Optional[int] = None) -> Optional[float]:
+    if start_ns is None:
+        return None
+    return round(((end_ns or time.perf_counter_ns()) - start_ns) / 1e6, 3)
+
+
+def _percentile(values: List[float], q: float) -> float:
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class PhaseHistogram:
+    """Per-run distribution of every timing phase over the stage records."""
+
+    def __init__(self, phases=PHASES, buckets=BUCKETS_MS):
+        self.phases = phases
+        self.buckets = buckets
+        self.values: Dict[str, List[float]] = {p: [] for p in phases}
+
+    def add(self, record: Dict):
+        for phase in self.phases:
+            value = record.get(phase)
+            if value is not None:
+                self.values[phase].append(value)
+
+    def add_all(self, records: Iterable[Dict]) -> "PhaseHistogram":
+        for r in records:
+            self.add(r)
+        return self
+
+    def _bucket_counts(self, values: List[float]) -> Dict[str, int]:
+        counts = {f"<={b}": 0 for b in self.buckets}
+        counts[f">{self.buckets[-1]}"] = 0
+        for v in values:
+            for b in self.buckets:
+                if v <= b:
+                    counts[f"<={b}"] += 1
+                    break
+            else:
+                counts[f">{self.buckets[-1]}"] += 1
+        return counts
+
+    def summary(self) -> Dict[str, Dict]:
+        out = {}
+        for phase, values in self.values.items():
+            values = sorted(values)
+            if not values:
+                out[phase] = {"count": 0}
+                continue
+            out[phase] = {
+                "count": len(values),
+                "min": round(values[0], 3),
+                "p50": round(_percentile(values, 0.50), 3),
+                "p90": round(_percentile(values, 0.90), 3),
+                "p99": round(_percentile(values, 0.99), 3),
+                "max": round(values[-1], 3),
+                "buckets": self._bucket_counts(values),
+            }
+        return out
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def print_summary(self, width: int = 30):
+        print("\n==============================")
+        print("       PROBE TIMING (ms)")
+        print("==============================\n")
+
+        for phase, s in self.summary().items():
+            if not s["count"]:
+                print(f"[*] {phase}: no samples\n")
+                continue
+
+            print(f"[+] {phase}: n={s['count']} p50={s['p50']} p90={s['p90']} p99={s['p99']} max={s['max']}")
+            peak = max(s["buckets"].values())
+            for label, n in s["buckets"].items():
+                if n:
+                    print(f"    {label:>7} {'#' * max(1, round(n / peak * width)):<{width}} {n}")
+            print("")
@@ -1,151 +1,236 @@
+import argparse
 import asyncio
-import ssl
 import json
 import hashlib
 from pathlib import Path
-from typing import List, Dict, Optional
-from datetime import datetime
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional
+
+try:
+    from cryptography import x509
+    from cryptography.x509.oid import NameOID
+except ImportError:
+    x509 = None
+
+from scanner.adaptive import AdaptiveController, adaptive_from_args, add_adaptive_args, open_connection
+from scanner.columnar import add_columnar_args, require_pyarrow, write_columnar
+from scanner.executor import BoundedExecutor, add_executor_args, executor_from_args
+from scanner.history import add_history_args, record_history
+from scanner.journal import ScanJournal, skip_done
+from scanner.records import NDJSONWriter, iter_ndjson, iter_records, merge_records, ndjson_path, streamed
+from scanner.resolver import EndpointSet, dns_summary, get_resolver
+from scanner.sharding import add_shard_args, print_shards, require_uvloop, scan_sharded, sharded, stage_stats
+from scanner.timing import PhaseHistogram, elapsed_ms, now_ns
+from scanner.tls_context import handshake_summary
+from scanner.transport import ConnectError
+
+
+def require_cryptography():
+    if x509 is None:
+        raise RuntimeError("certificate parsing needs cryptography (pip install cryptography)")
+
+
+def _common_name(name) -> Optional[str]:
+    attrs = name.get_attributes_for_oid(NameOID.COMMON_NAME)
+    return str(attrs[0].value) if attrs else None
+
+
+def _iso(dt) -> str:
+    return dt.replace(tzinfo=None).isoformat()
+
+
+def cert_fields(cert_bin: bytes) -> Dict:
+    """Subject, issuer, SANs and validity of a DER certificate; fields
+    that don't parse are left empty rather than dropping the record."""
+    require_cryptography()
+    fields = {
+        "subject_cn": None,
+        "issuer_cn": None,
+        "subject": None,
+        "issuer": None,
+        "san": [],
+        "not_before": None,
+        "not_after": None,
+    }
+
+    try:
+        cert = x509.load_der_x509_certificate(cert_bin)
+        fields["subject_cn"] = _common_name(cert.subject)
+        fields["issuer_cn"] = _common_name(cert.issuer)
+        fields["subject"] = cert.subject.rfc4514_string()
+        fields["issuer"] = cert.issuer.rfc4514_string()
+        fields["not_before"] = _iso(cert.not_valid_before_utc)
+        fields["not_after"] = _iso(cert.not_valid_after_utc)
+    except ValueError:
+        return fields
+
+    try:
+        san = cert.extensions.get_extension_for_class(x509.SubjectAlternativeName).value
+        fields["san"] = [*san.get_values_for_type(x509.DNSName),
+                         *(str(ip) for ip in san.get_values_for_type(x509.IPAddress))]
+    except (x509.ExtensionNotFound, ValueError):
+        pass
+
+    return fields
 
 
 class TLSAnalyzer:
-    def __init__(self, timeout: int = 5, max_concurrent: int = 100):
+    def __init__(self, timeout: int = 5, max_concurrent: int = 100, executor: Optional[BoundedExecutor] = None,
+                 adaptive: Optional[AdaptiveController] = None):
         self.timeout = timeout
-        self.sem = asyncio.Semaphore(max_concurrent)
-
-   
-    def _get_common_name(self, name) -> Optional[str]:
-        if not name:
-            return None
-        
-        try:
-            for rdn in name:      
-                for attr in rdn:
-                    if attr[0].lower() == "commonname":
-                        return attr[1]
-                    
-        except Exception:
-            return None
-        return None
+        self.adaptive = adaptive
+        self.sem = adaptive.limiter if adaptive else asyncio.Semaphore(max_concurrent)
+        self.executor = executor or BoundedExecutor(concurrency=max_concurrent)
+        self.endpoints = EndpointSet()
+
+    # certificate fields from an established TLS connection, so any stage
+    # holding an ssl_object can capture the cert without reconnecting
+    def cert_record(self, host: str, port: int, ssl_obj) -> Dict:
+        # the context doesn't verify, so getpeercert() is empty and the
+        # fields come from the DER itself
+        cert_bin = ssl_obj.getpeercert(binary_form=True)
+
+        return {
+            "host": host,
+            "port": port,
+            "fingerprint_sha256": hashlib.sha256(cert_bin).hexdigest(),
+            **cert_fields(cert_bin),
+        }
 
    
     async def fetch_cert(self, host: str, port: int) -> Optional[Dict]:
         async with self.sem:
-            ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
-            ctx.check_hostname = False
-            ctx.verify_mode = ssl.CERT_NONE
-            ctx.set_ciphers("DEFAULT:@SECLEVEL=1")
+            started = now_ns()
 
+            # the shared transport resolves, races the addresses and times
+            # the dns/tcp/tls phases; SNI still carries the name
             try:
-                reader, writer = await asyncio.wait_for(
-                    asyncio.open_connection(
-                        host,
-                        port,
-                        ssl=ctx,
-                        server_hostname=host,
-                    ),
-                    timeout=self.timeout,
-                )
-            except Exception as e:
-                print(f"[!] TLS connect failed: {host}:{port} ({e})")
+                conn = await open_connection(self.adaptive, host, port, self.timeout, policy="ssl-only")
+            except ConnectError as e:
+                print(f"[!] TLS connect failed: {host}:{port} ({e.ssl_error})")
                 return None
 
-            try:
-                ssl_obj = writer.get_extra_info("ssl_object")
+            if self.adaptive:
+                self.adaptive.record("ok")
+
+            async with conn:
+                ssl_obj = conn.writer.get_extra_info("ssl_object")
                 if ssl_obj is None:
-                    writer.close()
-                    try:
-                        await asyncio.wait_for(writer.wait_closed(), timeout=self.timeout)
-                    except asyncio.TimeoutError:
-                        pass
+                    return None
+                try:
+                    record = self.cert_record(host, port, ssl_obj)
+                except Exception:
                     return None
 
-                cert_info = ssl_obj.getpeercert()
-
-                cert_bin = ssl_obj.getpeercert(binary_form=True)
-
-                fingerprint_sha256 = hashlib.sha256(cert_bin).hexdigest()
-
-                subject_cn = self._get_common_name(cert_info.get("subject"))
-                issuer_cn = self._get_common_name(cert_info.get("issuer"))
-
-                not_before = cert_info.get("notBefore")
-                not_after = cert_info.get("notAfter")
-
-                def parse_cert_time(t):
-                    if not t:
-                        return None
-
-                    try:
-                        dt = datetime.strptime(t, "%b %d %H:%M:%S %Y %Z")
-                        return dt.isoformat()
-                    except Exception:
-                        return t
-
-                not_before_iso = parse_cert_time(not_before)
-                not_after_iso = parse_cert_time(not_after)
+            # no request goes out, so ttfb_ms stays empty
+            return {**record, **conn.timing(), "total_ms": elapsed_ms(started)}
 
-                writer.close()
-                try:
-                    await asyncio.wait_for(writer.wait_closed(), timeout=self.timeout)
-                except asyncio.TimeoutError:
-                    pass
-
-                return {
-                    "host": host,
-                    "port": port,
-                    "fingerprint_sha256": fingerprint_sha256,
-                    "subject_cn": subject_cn,
-                    "issuer_cn": issuer_cn,
-                    "not_before": not_before_iso,
-                    "not_after": not_after_iso,
-                }
-
-            except Exception:
-                writer.close()
-                try:
-                    await asyncio.wait_for(writer.wait_closed(), timeout=self.timeout)
-                except asyncio.TimeoutError:
-                    pass
+   
+    # peers are pulled lazily and results yielded as they complete
+    async def iter_analyze(self, peers: Iterable[Dict],
+                           on_result: Optional[Callable[[Dict], None]] = None,
+                           journal: Optional[ScanJournal] = None) -> AsyncIterator[Dict]:
+        def targets():
+            for p in peers:
+                host = p["host"]
+                port = p["port"]
+
+                if port != 50002 and p.get("protocol") != "ssl":
+                    continue
+
+                if skip_done(journal, host, port):
+                    continue
+
+                yield host, port
+
+        async def run(target):
+            host, port = target
+            if not await self.endpoints.claim(host, port):
                 return None
+            return await streamed(self.fetch_cert(host, port), on_result, journal, host, port)
 
-   
-    async def analyze_all(self, peers: List[Dict]) -> List[Dict]:
-        tasks = []
-        for p in peers:
-            host = p["host"]
-            port = p["port"]
+        async for r in self.executor.map(run, targets(), key=lambda t: t[0]):
+            if r:
+                yield r
 
-            if port != 50002 and p.get("protocol") != "ssl":
-                continue
+    async def analyze_all(self, peers: Iterable[Dict],
+                          on_result: Optional[Callable[[Dict], None]] = None,
+                          journal: Optional[ScanJournal] = None) -> List[Dict]:
+        return [r async for r in self.iter_analyze(peers, on_result, journal)]
 
-            tasks.append(self.fetch_cert(host, port))
 
-        results = await asyncio.gather(*tasks)
-        return [r for r in results if r]
 
+ONLINE_PATH = Path("data/online_peers/online_peers.json")
 
 
-async def main():
-    with open("data/online_peers/online_peers.json", "r") as f:
-        peers = json.load(f)
+def build_analyzer(args) -> TLSAnalyzer:
+    return TLSAnalyzer(max_concurrent=args.max_concurrent, executor=executor_from_args(args),
+                       adaptive=adaptive_from_args(args, timeout=5))
 
-    analyzer = TLSAnalyzer()
-    print(f"[+] Running TLS analysis on {len(peers)} online peers...")
 
-    results = await analyzer.analyze_all(peers)
+async def main():
+    p = argparse.ArgumentParser(description="Collect TLS certificates from online SSL peers")
+    p.add_argument("--resume", action="store_true",
+                   help="skip targets finished by an interrupted run and merge with its results")
+    add_executor_args(p, concurrency=100)
+    add_shard_args(p)
+    add_adaptive_args(p)
+    add_columnar_args(p)
+    add_history_args(p)
+    args = p.parse_args()
+
+    if args.columnar:
+        require_pyarrow()
+    if args.uvloop:
+        require_uvloop()
+    require_cryptography()
+
+    analyzer = build_analyzer(args)
+    print("[+] Running TLS analysis on online peers...")
 
     output_dir = Path("data/tls_certs")
     output_dir.mkdir(parents=True, exist_ok=True)
     output_path = output_dir / "tls_certs.json"
-    
+
+    with ScanJournal("tls_analyzer", resume=args.resume) as journal, \
+         NDJSONWriter(ndjson_path(output_path), append=args.resume) as out:
+        if journal.resumed:
+            print(f"[*] Resuming: {journal.resumed} targets already done")
+        if sharded(args):
+            stats = await scan_sharded("scanner.tls_analyzer:build_analyzer", "iter_analyze", args, ONLINE_PATH,
+                                       on_result=out.write, journal=journal)
+        else:
+            async for _ in analyzer.iter_analyze(iter_records(ONLINE_PATH), on_result=out.write, journal=journal):
+                pass
+            stats = stage_stats(analyzer)
+
+    # the streamed NDJSON holds every result, including a resumed run's
+    results = merge_records(iter_ndjson(ndjson_path(output_path))) if args.resume \
+        else list(iter_ndjson(ndjson_path(output_path)))
+
     with open(output_path, "w") as f:
         json.dump(results, f, indent=2)
 
+    if args.columnar:
+        write_columnar("tls_certs", results, args.scan_id)
+
+    if args.history:
+        record_history("tls_certs", results, args.scan_id)
+
+    timing = PhaseHistogram().add_all(results)
+    timing.save(output_dir / "timing_summary.json")
+
     print("\n==============================")
     print("      TLS ANALYSIS DONE")
     print("==============================\n")
     print(f"[✓] Certificates collected: {len(results)}")
-    print(f"[✓] Files saved: {output_path}\n")
+    print(f"[✓] TLS handshakes: {handshake_summary(stats['handshakes'])}")
+    print(f"[✓] DNS: {dns_summary(stats['dns'])}")
+    if sharded(args):
+        print_shards(stats)
+    elif analyzer.adaptive:
+        analyzer.adaptive.print_summary()
+    print(f"[✓] Files saved: {output_path}, {ndjson_path(output_path)}, {output_dir / 'timing_summary.json'}\n")
+    timing.print_summary()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,81 @@
+import ssl
+import threading
+from typing import Dict, Optional
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """Client context shared by every scanner stage.
+
+    asyncio creates its SSL objects through `wrap_bio`, which is where a
+    cached `SSLSession` for the host is attached, so a later connection to
+    the same server resumes instead of running a full handshake.
+    """
+
+    def __init__(self, protocol=ssl.PROTOCOL_TLS_CLIENT):
+        self.sessions: Dict[str, ssl.SSLSession] = {}
+        self.full_handshakes = 0
+        self.resumed_handshakes = 0
+
+    def wrap_bio(self, incoming, outgoing, server_side=False, server_hostname=None, session=None):
+        if session is None and server_hostname:
+            session = self.sessions.get(server_hostname)
+
+        return super().wrap_bio(
+            incoming, outgoing,
+            server_side=server_side,
+            server_hostname=server_hostname,
+            session=session,
+        )
+
+    def record_handshake(self, ssl_obj: Optional[ssl.SSLObject]):
+        if ssl_obj is None:
+            return
+
+        if ssl_obj.session_reused:
+            self.resumed_handshakes += 1
+        else:
+            self.full_handshakes += 1
+
+    def save_session(self, host: str, ssl_obj: Optional[ssl.SSLObject]):
+        if ssl_obj is None:
+            return
+
+        # TLS 1.3 tickets arrive after the handshake, so this is best called
+        # once some application data has been read
+        session = ssl_obj.session
+        if session is None:
+            return
+
+        if session.has_ticket or host not in self.sessions:
+            self.sessions[host] = session
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "full_handshakes": self.full_handshakes,
+            "resumed_handshakes": self.resumed_handshakes,
+            "cached_sessions": len(self.sessions),
+        }
+
+
+_context: Optional[ResumingSSLContext] = None
+_lock = threading.Lock()
+
+
+def get_ssl_context() -> ResumingSSLContext:
+    global _context
+
+    with _lock:
+        if _context is None:
+            ctx = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+            ctx.check_hostname = False
+            ctx.verify_mode = ssl.CERT_NONE
+            ctx.set_ciphers("DEFAULT:@SECLEVEL=1")
+            _context = ctx
+
+    return _context
+
+
+def handshake_summary(s: Optional[Dict[str, int]] = None) -> str:
+    # `s` is given for counters gathered elsewhere, e.g. summed over shard workers
+    s = s or get_ssl_context().stats()
+    return f"{s['full_handshakes']} full, {s['resumed_handshakes']} resumed"
@@ -0,0 +1,508 @@
+import asyncio
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from scanner.resolver import get_resolver
+from scanner.timing import elapsed_ms, now_ns
+from scanner.tls_context import get_ssl_context
+
+
+# get_history for busy addresses easily exceeds asyncio's 64 KiB line limit
+STREAM_LIMIT = 4 * 1024 * 1024
+
+POLICIES = ("ssl-only", "prefer-ssl", "race")
+DEFAULT_POLICY = "prefer-ssl"
+
+# for peers that advertise no SSL port; chosen per peer, not per stage
+TCP_ONLY = "tcp-only"
+
+# head start given to each attempt before the next one joins the race
+DEFAULT_STAGGER = 0.25
+
+
+class ConnectError(Exception):
+
+    def __init__(self, host: str, ssl_error: Optional[Exception], tcp_error: Optional[Exception]):
+        super().__init__(f"{host}: ssl={ssl_error!r} tcp={tcp_error!r}")
+        self.ssl_error = ssl_error
+        self.tcp_error = tcp_error
+
+
+@dataclass
+class Reply:
+    response: Optional[Dict]
+    error: str
+    latency_ms: Optional[float]
+    raw: bytes = b""
+
+    @property
+    def ok(self) -> bool:
+        return self.error == "ok"
+
+
+@dataclass
+class Stream:
+    reader: asyncio.StreamReader
+    writer: asyncio.StreamWriter
+    protocol: str
+    connect_ms: float
+    # dns_ms, tcp_ms and tls_ms of the attempt that won
+    phases: Dict[str, Optional[float]] = field(default_factory=dict)
+
+
+class TimedStreamReader(asyncio.StreamReader):
+    """StreamReader that notes when the first application byte arrived."""
+
+    first_data_ns: Optional[int] = None
+
+    def feed_data(self, data):
+        if self.first_data_ns is None and data:
+            self.first_data_ns = now_ns()
+        super().feed_data(data)
+
+
+def _close_quietly(stream: Optional[Stream]):
+    if stream is not None:
+        stream.writer.close()
+
+
+async def _race(attempts: List, stagger: float):
+    """Staggered race over zero-argument coroutine factories.
+
+    The next attempt starts when the previous one fails or `stagger`
+    seconds pass, whichever comes first. Returns (index, result) of the
+    first success; losers are cancelled and closed.
+    """
+    attempts = list(attempts)
+    running: Dict[asyncio.Task, int] = {}
+    errors: List[Exception] = []
+    launched = 0
+
+    def launch_next() -> bool:
+        nonlocal launched
+        if launched >= len(attempts):
+            return False
+        running[asyncio.create_task(attempts[launched]())] = launched
+        launched += 1
+        return True
+
+    def discard(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is None:
+            _close_quietly(task.result())
+
+    launch_next()
+    try:
+        while running:
+            wait = stagger if launched < len(attempts) else None
+            done, _ = await asyncio.wait(running, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+
+            if not done:
+                launch_next()
+                continue
+
+            winners = []
+            for task in done:
+                index = running.pop(task)
+                if task.exception() is None:
+                    winners.append((index, task.result()))
+                else:
+                    errors.append(task.exception())
+
+            if winners:
+                winners.sort(key=lambda w: w[0])
+                for _, loser in winners[1:]:
+                    _close_quietly(loser)
+                return winners[0]
+
+            launch_next()
+
+    finally:
+        for task in running:
+            task.cancel()
+            task.add_done_callback(discard)
+
+    raise errors[-1] if errors else OSError("no connection attempts")
+
+
+async def resolve(host: str, port: int) -> List[str]:
+    """Addresses for `host`, address families interleaved (RFC 8305),
+    from the resolver cache shared by all stages."""
+    return await get_resolver().resolve(host)
+
+
+async def _open(host: str, port: int, use_ssl: bool, timeout: float, stagger: float) -> Stream:
+    ctx = get_ssl_context() if use_ssl else None
+    loop = asyncio.get_running_loop()
+
+    # TCP connect and TLS handshake are timed separately where the
+    # handshake can run on an open stream (StreamWriter.start_tls, 3.11+)
+    split_tls = use_ssl and hasattr(asyncio.StreamWriter, "start_tls")
+
+    async def attempt(addr: str) -> Stream:
+        started = now_ns()
+        reader = TimedStreamReader(limit=STREAM_LIMIT, loop=loop)
+        protocol = asyncio.StreamReaderProtocol(reader, loop=loop)
+        transport, _ = await asyncio.wait_for(
+            loop.create_connection(
+                lambda: protocol,
+                addr,
+                port,
+                ssl=ctx if use_ssl and not split_tls else None,
+                server_hostname=host if use_ssl and not split_tls else None,
+            ),
+            timeout=timeout
+        )
+        writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+        connected = now_ns()
+
+        tls_ms = None
+        if split_tls:
+            # the handshake gets what is left of the connect timeout
+            remaining = timeout - (connected - started) / 1e9
+            try:
+                await asyncio.wait_for(writer.start_tls(ctx, server_hostname=host), timeout=remaining)
+            except BaseException:
+                writer.close()
+                raise
+            tls_ms = elapsed_ms(connected)
+
+        phases = {"tcp_ms": elapsed_ms(started, connected), "tls_ms": tls_ms}
+        return Stream(reader, writer, "ssl" if use_ssl else "tcp", elapsed_ms(started), phases)
+
+    # the resolve counts against the same timeout as the connect
+    started = now_ns()
+    addrs = await asyncio.wait_for(resolve(host, port), timeout=timeout)
+    resolve_ms = elapsed_ms(started)
+
+    # several A/AAAA records are raced against each other
+    _, stream = await _race([lambda a=a: attempt(a) for a in addrs], stagger)
+    stream.connect_ms = round(stream.connect_ms + resolve_ms, 2)
+    stream.phases["dns_ms"] = resolve_ms
+
+    if use_ssl:
+        ctx.record_handshake(stream.writer.get_extra_info("ssl_object"))
+    return stream
+
+
+async def connect(host: str, port: int, timeout: float, tcp_port: int = 50001,
+                  policy: str = DEFAULT_POLICY, stagger: float = DEFAULT_STAGGER) -> Stream:
+    """Open an SSL or plain TCP stream according to `policy`.
+
+    ssl-only:   SSL on `port`, no fallback
+    prefer-ssl: SSL on `port`, plain TCP on `tcp_port` once SSL has failed
+    race:       SSL first, TCP joins after `stagger` seconds; SSL is kept
+                when both come up
+    tcp-only:   plain TCP on `tcp_port`
+
+    Raises ConnectError if no attempt succeeds.
+    """
+    if policy not in POLICIES and policy != TCP_ONLY:
+        raise ValueError(f"Unknown connect policy: {policy}")
+
+    if policy == TCP_ONLY:
+        try:
+            return await _open(host, tcp_port, False, timeout, stagger)
+        except Exception as tcp_error:
+            raise ConnectError(host, None, tcp_error)
+
+    try:
+        if policy == "race":
+            return await _race_ssl_tcp(host, port, tcp_port, timeout, stagger)
+        return await _open(host, port, True, timeout, stagger)
+
+    except ConnectError:
+        raise
+
+    except Exception as ssl_error:
+        if policy == "ssl-only":
+            raise ConnectError(host, ssl_error, None)
+
+        try:
+            return await _open(host, tcp_port, False, timeout, stagger)
+        except Exception as tcp_error:
+            raise ConnectError(host, ssl_error, tcp_error)
+
+
+async def _race_ssl_tcp(host: str, port: int, tcp_port: int, timeout: float, stagger: float) -> Stream:
+    ssl_task = asyncio.create_task(_open(host, port, True, timeout, stagger))
+    tcp_task = None
+
+    try:
+        done, _ = await asyncio.wait([ssl_task], timeout=stagger)
+        if ssl_task in done and ssl_task.exception() is None:
+            return ssl_task.result()
+
+        tcp_task = asyncio.create_task(_open(host, tcp_port, False, timeout, stagger))
+        done, _ = await asyncio.wait([ssl_task, tcp_task], return_when=asyncio.FIRST_COMPLETED)
+
+        if ssl_task in done and ssl_task.exception() is None:
+            return ssl_task.result()
+
+        if tcp_task not in done:
+            # SSL failed outright, TCP is all that is left
+            await asyncio.wait([tcp_task])
+
+        if tcp_task.exception() is not None:
+            raise ConnectError(host, ssl_task.exception(), tcp_task.exception())
+
+        # TCP came up first. An SSL handshake costs about one extra RTT on
+        # top of the TCP connect, so SSL still gets that long to win.
+        if not ssl_task.done():
+            grace = max(stagger, 2 * tcp_task.result().connect_ms / 1000)
+            await asyncio.wait([ssl_task], timeout=grace)
+            if ssl_task.done() and ssl_task.exception() is None:
+                _close_quietly(tcp_task.result())
+                return ssl_task.result()
+
+        return tcp_task.result()
+
+    finally:
+        for task in (ssl_task, tcp_task):
+            if task is not None and not task.done():
+                task.cancel()
+                task.add_done_callback(
+                    lambda t: t.cancelled() or t.exception() is not None or _close_quietly(t.result())
+                )
+
+
+class ElectrumConnection:
+    """One JSON-RPC stream to an Electrum server.
+
+    Requests carry distinct ids and responses are matched back by id, so
+    several requests can be in flight at once (pipelined) or sent as a
+    single JSON-RPC batch array.
+    """
+
+    def __init__(self, reader, writer, host: str, port: int, protocol: str, timeout: float = 4,
+                 connect_ms: Optional[float] = None, phases: Optional[Dict[str, Optional[float]]] = None):
+        self.reader = reader
+        self.writer = writer
+        self.host = host
+        self.port = port
+        self.protocol = protocol
+        self.timeout = timeout
+        self.connect_ms = connect_ms
+        self.phases = phases or {}
+
+        # request-to-first-byte of the first write on this connection
+        self.ttfb_ms: Optional[float] = None
+        self._first_sent_ns: Optional[int] = None
+
+        # None until a batch has been tried on this connection
+        self.batch_supported: Optional[bool] = None
+
+        self._next_id = 0
+        self._pending: Dict[int, Tuple[asyncio.Future, float]] = {}
+        self._batch_waiter: Optional[asyncio.Future] = None
+        self._closed = False
+        self._read_task = asyncio.create_task(self._read_loop())
+
+    @classmethod
+    async def open(cls, host: str, port: int, timeout: float = 4, tcp_port: int = 50001,
+                   policy: str = DEFAULT_POLICY, request_timeout: Optional[float] = None):
+        stream = await connect(host, port, timeout, tcp_port, policy)
+        return cls(stream.reader, stream.writer, host, port, stream.protocol, request_timeout or timeout,
+                   stream.connect_ms, stream.phases)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def timing(self) -> Dict[str, Optional[float]]:
+        return {
+            "dns_ms": self.phases.get("dns_ms"),
+            "tcp_ms": self.phases.get("tcp_ms"),
+            "tls_ms": self.phases.get("tls_ms"),
+            "ttfb_ms": self.ttfb_ms,
+        }
+
+    async def close(self):
+        if self.protocol == "ssl":
+            get_ssl_context().save_session(self.host, self.writer.get_extra_info("ssl_object"))
+
+        self._closed = True
+        self._read_task.cancel()
+        self._fail_pending("connection_closed")
+
+        self.writer.close()
+        try:
+            await asyncio.wait_for(self.writer.wait_closed(), timeout=self.timeout)
+        except Exception:
+            pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+    def _request(self, method: str, params: List) -> Tuple[int, Dict]:
+        request_id = self._next_id
+        self._next_id += 1
+        return request_id, {"id": request_id, "method": method, "params": params}
+
+    def _register(self, request_id: int, sent_at: float) -> asyncio.Future:
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = (fut, sent_at)
+        return fut
+
+    def _resolve(self, request_id, raw: bytes, response: Optional[Dict], error: str) -> bool:
+        entry = self._pending.pop(request_id, None)
+        if entry is None:
+            return False
+
+        fut, sent_at = entry
+        if not fut.done():
+            latency = (time.perf_counter() - sent_at) * 1000
+            fut.set_result(Reply(response, error, latency, raw))
+        return True
+
+    def _fail_pending(self, error: str):
+        for fut, _ in self._pending.values():
+            if not fut.done():
+                fut.set_result(Reply(None, error, None))
+        self._pending.clear()
+
+        if self._batch_waiter is not None and not self._batch_waiter.done():
+            self._batch_waiter.set_result(None)
+
+    async def _read_loop(self):
+        try:
+            while True:
+                raw = await self.reader.readline()
+                if not raw:
+                    break
+
+                if self.ttfb_ms is None and self._first_sent_ns is not None:
+                    first = getattr(self.reader, "first_data_ns", None)
+                    self.ttfb_ms = elapsed_ms(self._first_sent_ns, first)
+
+                try:
+                    message = json.loads(raw.decode().strip())
+                except Exception:
+                    # can't demultiplex garbage, charge it to the oldest request
+                    if self._pending:
+                        self._resolve(next(iter(self._pending)), raw, None, "invalid_json")
+                    continue
+
+                if isinstance(message, list):
+                    for item in message:
+                        if isinstance(item, dict):
+                            self._resolve(item.get("id"), json.dumps(item).encode(), item, "ok")
+                    continue
+
+                if not isinstance(message, dict):
+                    continue
+
+                if self._resolve(message.get("id"), raw, message, "ok"):
+                    continue
+
+                # servers without batch support answer the array with a
+                # single id-less error
+                if message.get("id") is None and "error" in message:
+                    if self._batch_waiter is not None and not self._batch_waiter.done():
+                        self._batch_waiter.set_result(message)
+
+                # anything else is a subscription notification, ignore it
+
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            pass
+
+        self._closed = True
+        self._fail_pending("connection_closed")
+
+    async def _wait(self, request_id: int, fut: asyncio.Future, timeout: Optional[float]) -> Reply:
+        try:
+            return await asyncio.wait_for(asyncio.shield(fut), timeout=timeout or self.timeout)
+        except Exception as e:
+            # only this request is dropped, the session stays usable
+            self._pending.pop(request_id, None)
+            return Reply(None, "timeout" if isinstance(e, asyncio.TimeoutError) else str(e), None)
+
+    async def _send(self, payload) -> Optional[str]:
+        if self._closed:
+            return "connection_closed"
+        if self._first_sent_ns is None:
+            self._first_sent_ns = now_ns()
+        try:
+            self.writer.write(payload)
+            await self.writer.drain()
+        except Exception as e:
+            return str(e)
+        return None
+
+
+    async def call(self, method: str, params: List, timeout: Optional[float] = None) -> Reply:
+        replies = await self.pipeline([(method, params)], timeout)
+        return replies[0]
+
+    async def pipeline(self, calls: List, timeout: Optional[float] = None) -> List[Reply]:
+        # every request goes out in a single write; order is preserved so
+        # server.version can lead the pipeline
+        requests = [self._request(method, params) for method, params in calls]
+        sent_at = time.perf_counter()
+        futures = [self._register(request_id, sent_at) for request_id, _ in requests]
+
+        payload = b"".join((json.dumps(req) + "\n").encode() for _, req in requests)
+        err = await self._send(payload)
+        if err is not None:
+            for request_id, _ in requests:
+                self._pending.pop(request_id, None)
+            return [Reply(None, err, None) for _ in requests]
+
+        return list(await asyncio.gather(*(
+            self._wait(request_id, fut, timeout)
+            for (request_id, _), fut in zip(requests, futures)
+        )))
+
+    async def batch(self, calls: List, timeout: Optional[float] = None) -> List[Reply]:
+        if self.batch_supported is False:
+            return await self.pipeline(calls, timeout)
+
+        requests = [self._request(method, params) for method, params in calls]
+        sent_at = time.perf_counter()
+        futures = [self._register(request_id, sent_at) for request_id, _ in requests]
+        self._batch_waiter = asyncio.get_running_loop().create_future()
+
+        err = await self._send((json.dumps([req for _, req in requests]) + "\n").encode())
+        if err is not None:
+            for request_id, _ in requests:
+                self._pending.pop(request_id, None)
+            return [Reply(None, err, None) for _ in requests]
+
+        replies = asyncio.gather(*(
+            self._wait(request_id, fut, timeout)
+            for (request_id, _), fut in zip(requests, futures)
+        ))
+        done, _ = await asyncio.wait(
+            [replies, self._batch_waiter],
+            return_when=asyncio.FIRST_COMPLETED
+        )
+
+        if replies in done:
+            self._batch_waiter.cancel()
+            results = list(replies.result())
+            # a server that silently drops arrays times out on every request
+            if results and all(r.error == "timeout" for r in results):
+                self.batch_supported = False
+                return await self.pipeline(calls, timeout)
+            self.batch_supported = True
+            return results
+
+        rejection = self._batch_waiter.result()
+        replies.cancel()
+        replies.add_done_callback(lambda f: f.cancelled() or f.exception())
+        for request_id, _ in requests:
+            self._pending.pop(request_id, None)
+
+        if rejection is None:
+            # connection dropped on the batch, nothing to fall back to
+            return [Reply(None, "connection_closed", None) for _ in requests]
+
+        self.batch_supported = False
+        return await self.pipeline(calls, timeout)
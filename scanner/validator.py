@@ -1,125 +1,224 @@
+import argparse
 import asyncio
 import json
-import ssl
-import time
 from pathlib import Path
-from typing import Dict, List
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional
+
+from scanner.adaptive import AdaptiveController, adaptive_from_args, add_adaptive_args, open_connection
+from scanner.canonical import DEFAULT_HASH, add_hash_args, raw_hash, response_hash
+from scanner.columnar import add_columnar_args, require_pyarrow, write_columnar
+from scanner.executor import BoundedExecutor, add_executor_args, executor_from_args
+from scanner.history import add_history_args, record_history
+from scanner.journal import ScanJournal, skip_done
+from scanner.peers import DEFAULT_TCP_PORT, PeerRecord
+from scanner.records import NDJSONWriter, iter_ndjson, iter_records, merge_records, ndjson_path, streamed
+from scanner.resolver import EndpointSet, dns_summary, get_resolver
+from scanner.sharding import add_shard_args, print_shards, require_uvloop, scan_sharded, sharded, stage_stats
+from scanner.timing import PhaseHistogram, elapsed_ms, now_ns
+from scanner.tls_analyzer import TLSAnalyzer
+from scanner.tls_context import handshake_summary
+from scanner.transport import DEFAULT_POLICY, POLICIES, TCP_ONLY, ConnectError
 
 
 class ElectrumValidator:
 
-    def __init__(self, timeout: int = 4, max_concurrent: int = 200):
+    def __init__(self, timeout: int = 4, max_concurrent: int = 200, connect_policy: str = DEFAULT_POLICY,
+                 executor: Optional[BoundedExecutor] = None, hash_algorithm: str = DEFAULT_HASH,
+                 adaptive: Optional[AdaptiveController] = None):
         self.timeout = timeout
-        self.sem = asyncio.Semaphore(max_concurrent)
+        self.connect_policy = connect_policy
+        self.hash_algorithm = hash_algorithm
+        self.adaptive = adaptive
+        self.sem = adaptive.limiter if adaptive else asyncio.Semaphore(max_concurrent)
+        self.executor = executor or BoundedExecutor(concurrency=max_concurrent)
+        self.endpoints = EndpointSet()
+        self.tls = TLSAnalyzer(timeout=timeout)
 
 
-    async def electrum_request(self, host: str, port: int):
-        async with self.sem:
-            ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
-            ctx.check_hostname = False
-            ctx.verify_mode = ssl.CERT_NONE
-            ctx.set_ciphers("DEFAULT:@SECLEVEL=1")
-
-            start = time.time()
-
-            try:
-                reader, writer = await asyncio.wait_for(
-                    asyncio.open_connection(
-                        host,
-                        port,
-                        ssl=ctx,
-                        server_hostname=host
-                    ),
-                    timeout=self.timeout
-                )
-                protocol = "ssl"
-
-            except Exception:
-                try:
-                    reader, writer = await asyncio.wait_for(
-                        asyncio.open_connection(host, 50001),
-                        timeout=self.timeout
-                    )
-                    protocol = "tcp"
-                except Exception:
-                    return None
-
-
-            # electrum handshake, mimic a real electrum client
-            try:
-                req_version = {
-                    "id": 1,
-                    "method": "server.version",
-                    "params": ["Electrum 4.4.5", "1.4"]
-                }
-
-                writer.write((json.dumps(req_version) + "\n").encode())
-                await writer.drain()
-
-                raw = await asyncio.wait_for(reader.readline(), timeout=self.timeout)
-                version_response = raw.decode().strip()
-                req_banner = {"id": 2, "method": "server.banner", "params": []}
-
-                writer.write((json.dumps(req_banner) + "\n").encode())
-                await writer.drain()
-
-                raw = await asyncio.wait_for(reader.readline(), timeout=self.timeout)
-                banner_response = raw.decode().strip()
-
-                writer.close()
-                await writer.wait_closed()
+    async def electrum_request(self, host: str, port: int, tcp_port: int = DEFAULT_TCP_PORT):
+        record, _ = await self.probe(host, port, tcp_port=tcp_port)
+        return record
 
-                latency = round((time.time() - start) * 1000, 2)
+    # with capture_cert the certificate is read off the same TLS connection,
+    # so no separate tls_analyzer handshake is needed
+    async def probe(self, host: str, port: int, capture_cert: bool = False, tcp_port: int = DEFAULT_TCP_PORT):
+        # peers that advertise no SSL port are probed over plain TCP only
+        policy = TCP_ONLY if port == tcp_port else self.connect_policy
 
-                return {
-                    "host": host,
-                    "port": port,
-                    "protocol": protocol,
-                    "latency_ms": latency,
-                    "version_raw": version_response,
-                    "banner_raw": banner_response
-                }
+        async with self.sem:
+            start = now_ns()
 
-            except Exception:
+            try:
+                conn = await open_connection(self.adaptive, host, port, self.timeout, policy, tcp_port)
+            except ConnectError:
+                return None, None
+
+            cert = None
+
+            # electrum handshake, mimic a real electrum client.
+            # version and banner are pipelined on one write.
+            async with conn:
+                version, banner = await conn.pipeline([
+                    ("server.version", ["Electrum 4.4.5", "1.4"]),
+                    ("server.banner", []),
+                ])
+                if self.adaptive:
+                    self.adaptive.record_replies(host, (version, banner))
+
+                if capture_cert and conn.protocol == "ssl":
+                    try:
+                        cert = self.tls.cert_record(host, port, conn.writer.get_extra_info("ssl_object"))
+                    except Exception:
+                        cert = None
+
+            # a closed stream still proves the server is up, a timeout doesn't
+            if any(r.error not in ("ok", "invalid_json", "connection_closed") for r in (version, banner)):
+                return None, None
+
+            latency = elapsed_ms(start)
+            version_raw = version.raw.decode(errors="replace").strip()
+            banner_raw = banner.raw.decode(errors="replace").strip()
+
+            record = {
+                "host": host,
+                "port": port,
+                "tcp_port": tcp_port,
+                "protocol": conn.protocol,
+                "connect_ms": conn.connect_ms,
+                "latency_ms": latency,
+                **conn.timing(),
+                "total_ms": latency,
+                "version_raw": version_raw,
+                "banner_raw": banner_raw,
+                "version_hash": self.reply_hash(version, version_raw),
+                "banner_hash": self.reply_hash(banner, banner_raw),
+            }
+            return record, cert
+
+
+    def reply_hash(self, reply, raw: str):
+        # the parsed reply is reused; only replies that weren't JSON go by their text
+        if reply.response is not None:
+            return response_hash(reply.response, self.hash_algorithm)
+        return raw_hash(raw, self.hash_algorithm)
+
+    @staticmethod
+    def target(peer: Dict):
+        # (host, port, tcp fallback port) as the peer advertised them
+        p = PeerRecord.from_record(peer)
+        return p.host, p.port or DEFAULT_TCP_PORT, p.tcp_port
+
+    # peers are pulled lazily and results yielded as they complete
+    async def iter_validate(self, peers: Iterable[Dict], on_result: Optional[Callable[[Dict], None]] = None,
+                            journal: Optional[ScanJournal] = None) -> AsyncIterator[Dict]:
+        resolver = get_resolver()
+
+        def targets():
+            for p in peers:
+                resolver.add_peer(p.get("raw"))
+                host, port, tcp_port = self.target(p)
+                if not skip_done(journal, host, port):
+                    yield host, port, tcp_port
+
+        async def run(target):
+            host, port, tcp_port = target
+            # every server is reported by many peers, under its IP and its hostname
+            if not await self.endpoints.claim(host, port):
                 return None
+            return await streamed(self.electrum_request(host, port, tcp_port), on_result, journal, host, port)
 
+        async for r in self.executor.map(run, targets(), key=lambda t: t[0]):
+            if r:
+                yield r
 
-    async def validate_all(self, peers: List[Dict]):
-        tasks = []
-
-        for p in peers:
-            host = p["host"]
-            port = p["ssl"] if p["ssl"] else (p["tcp"] or 50001)
-            tasks.append(self.electrum_request(host, port))
+    async def validate_all(self, peers: Iterable[Dict], on_result: Optional[Callable[[Dict], None]] = None,
+                           journal: Optional[ScanJournal] = None):
+        return [r async for r in self.iter_validate(peers, on_result, journal)]
 
-        results = await asyncio.gather(*tasks)
 
-        return [r for r in results if r]
+PEERS_PATH = Path("data/peers/peers.json")
 
 
-async def main():
-    with open("data/peers/peers.json", "r") as f:
-        peers = json.load(f)
-
-    validator = ElectrumValidator()
+def build_validator(args) -> ElectrumValidator:
+    return ElectrumValidator(
+        max_concurrent=args.max_concurrent,
+        connect_policy=args.connect_policy,
+        executor=executor_from_args(args),
+        hash_algorithm=args.hash_algorithm,
+        adaptive=adaptive_from_args(args),
+    )
 
-    print(f"[+] Validating {len(peers)} peers...\n")
 
-    results = await validator.validate_all(peers)
+async def main():
+    p = argparse.ArgumentParser(description="Check which discovered peers answer the Electrum handshake")
+    p.add_argument("--connect-policy", choices=POLICIES, default=DEFAULT_POLICY,
+                   help="ssl-only, prefer-ssl (TCP after SSL fails) or race (SSL and TCP staggered)")
+    p.add_argument("--resume", action="store_true",
+                   help="skip targets finished by an interrupted run and merge with its results")
+    add_hash_args(p)
+    add_executor_args(p)
+    add_shard_args(p)
+    add_adaptive_args(p)
+    add_columnar_args(p)
+    add_history_args(p)
+    args = p.parse_args()
+
+    if args.columnar:
+        require_pyarrow()
+    if args.uvloop:
+        require_uvloop()
+
+    validator = build_validator(args)
+
+    print("[+] Validating peers...\n")
 
     output_dir = Path("data/online_peers")
     output_dir.mkdir(parents=True, exist_ok=True)
     output_path = output_dir / "online_peers.json"
-    
+
+    with ScanJournal("validator", resume=args.resume) as journal, \
+         NDJSONWriter(ndjson_path(output_path), append=args.resume) as out:
+        if journal.resumed:
+            print(f"[*] Resuming: {journal.resumed} targets already done")
+        if sharded(args):
+            stats = await scan_sharded("scanner.validator:build_validator", "iter_validate", args, PEERS_PATH,
+                                       on_result=out.write, journal=journal)
+        else:
+            async for _ in validator.iter_validate(iter_records(PEERS_PATH), on_result=out.write, journal=journal):
+                pass
+            stats = stage_stats(validator)
+
+    # the streamed NDJSON holds every result, including a resumed run's
+    results = merge_records(iter_ndjson(ndjson_path(output_path))) if args.resume \
+        else list(iter_ndjson(ndjson_path(output_path)))
+
     with open(output_path, "w") as f:
         json.dump(results, f, indent=2)
 
+    if args.columnar:
+        write_columnar("online_peers", results, args.scan_id)
+
+    if args.history:
+        record_history("online_peers", results, args.scan_id)
+
+    timing = PhaseHistogram().add_all(results)
+    timing.save(output_dir / "timing_summary.json")
 
     print("\n==============================")
     print("      VALIDATION RESULTS")
     print("==============================\n")
+    print(f"[✓] Peers probed: {stats['completed'] - stats['duplicates']} "
+          f"({stats['duplicates']} duplicate endpoints skipped)")
     print(f"[✓] Peers online: {len(results)}")
-    print(f"[✓] Output saved to {output_path}\n")
+    print(f"[✓] TLS handshakes: {handshake_summary(stats['handshakes'])}")
+    print(f"[✓] DNS: {dns_summary(stats['dns'])}")
+    if sharded(args):
+        print_shards(stats)
+    elif validator.adaptive:
+        validator.adaptive.print_summary()
+    print(f"[✓] Output saved to {output_path} and {ndjson_path(output_path)}")
+    print(f"[✓] Timing summary saved to {output_dir / 'timing_summary.json'}\n")
+    timing.print_summary()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,17 @@
+from scanner.adaptive import MIN_SAMPLES, AdaptiveController
+
+
+def test_group_estimate_keeps_half_the_fixed_timeout():
+    adaptive = AdaptiveController(timeout=4, min_timeout=0.1)
+    for i in range(MIN_SAMPLES):
+        adaptive.observe_connect(f"10.0.0.{i + 1}", 20)
+
+    # unseen or barely seen hosts on a fast /24
+    assert adaptive.connect_timeout("10.0.0.200") == 2
+    assert adaptive.connect_timeout("10.0.0.1") == 2
+    # a host with enough samples of its own gets its own estimate
+    for _ in range(MIN_SAMPLES):
+        adaptive.observe_connect("10.0.0.50", 20)
+    assert adaptive.connect_timeout("10.0.0.50") < 1
+    # a host with no group estimate at all keeps the fixed timeout
+    assert adaptive.connect_timeout("10.9.9.9") == 4
@@ -0,0 +1,92 @@
+import json
+import sys
+
+from scanner import geoip
+from scanner.geoip import FixtureSource, GeoCache, GeoEnricher, load_geo_cache, to_ip_api
+
+
+NETWORKS = {
+    "203.0.113.0/24": {"country": "Testland", "country_code": "TL", "asn": 64500, "as_org": "Test Net"},
+    "203.0.113.128/25": {"country": "Testland", "country_code": "TL", "asn": 64501, "as_org": "Sub Net"},
+    "2001:db8::/32": {"country": "Sixland", "country_code": "SX", "asn": 64502, "as_org": "Six Net"},
+}
+
+
+def _fixture(tmp_path):
+    path = tmp_path / "fixture.json"
+    path.write_text(json.dumps(NETWORKS))
+    return FixtureSource(path)
+
+
+def test_fixture_source_takes_the_longest_prefix(tmp_path):
+    source = _fixture(tmp_path)
+    assert source.lookup("203.0.113.10")["asn"] == 64500
+    assert source.lookup("203.0.113.200")["prefix"] == "203.0.113.128/25"
+    assert source.lookup("2001:db8::1")["country_code"] == "SX"
+    assert source.lookup("198.51.100.1") is None
+
+
+def test_enricher_answers_from_lru_then_cache_then_database(tmp_path):
+    source = _fixture(tmp_path)
+    hosts = ["203.0.113.10", "203.0.113.200", "198.51.100.1", "electrum.example.org", "203.0.113.10"]
+
+    with GeoCache(tmp_path / "geo.sqlite") as cache:
+        enricher = GeoEnricher(source, cache)
+        first = enricher.enrich(hosts)
+        assert enricher.stats == {"lru": 0, "cache": 0, "db": 3, "not_ip": 1}
+        assert first["198.51.100.1"] is None and first["electrum.example.org"] is None
+
+        enricher.enrich(["203.0.113.10"])
+        assert enricher.stats["lru"] == 1
+
+        # a new process starts with an empty LRU; misses are cached too
+        again = GeoEnricher(source, cache)
+        assert again.enrich(hosts[:3]) == {h: first[h] for h in hosts[:3]}
+        assert again.stats == {"lru": 0, "cache": 3, "db": 0, "not_ip": 0}
+
+
+def test_lru_evicts_the_least_recently_used(tmp_path):
+    enricher = GeoEnricher(_fixture(tmp_path), lru_size=2)
+    enricher.enrich(["203.0.113.1", "203.0.113.2"])
+    enricher.lookup("203.0.113.1")
+    enricher.lookup("203.0.113.3")
+
+    assert list(enricher._lru) == ["203.0.113.1", "203.0.113.3"]
+    assert enricher.stats["db"] == 3
+
+
+def test_cache_drops_expired_entries_and_other_builds(tmp_path):
+    path = tmp_path / "geo.sqlite"
+    record = {"asn": 64500}
+    with GeoCache(path) as cache:
+        cache.put_many({"203.0.113.1": record, "203.0.113.2": None}, "build-1")
+        assert cache.get_many(["203.0.113.1", "203.0.113.2"], "build-1") == {"203.0.113.1": record,
+                                                                            "203.0.113.2": None}
+        assert cache.get_many(["203.0.113.1"], "build-2") == {}
+        cache.db.execute("UPDATE geo SET fetched_at = 0 WHERE ip = '203.0.113.1'")
+        cache.db.commit()
+
+    with GeoCache(path) as cache:
+        assert cache.evicted == 1
+        assert cache.get_many(["203.0.113.1", "203.0.113.2"], "build-1") == {"203.0.113.2": None}
+
+
+def test_main_writes_only_under_data_geoip(tmp_path, monkeypatch):
+    fixture = tmp_path / "fixture.json"
+    fixture.write_text(json.dumps(NETWORKS))
+    monkeypatch.chdir(tmp_path)
+    for stage in ("peers", "online_peers"):
+        (tmp_path / "data" / stage).mkdir(parents=True)
+        (tmp_path / "data" / stage / f"{stage}.json").write_text(json.dumps([{"host": "203.0.113.10"}]))
+    notebook = {"198.51.100.1": to_ip_api("198.51.100.1", {"asn": 64999, "as_org": "Old"})}
+    (tmp_path / "data" / "global_network").mkdir()
+    (tmp_path / "data" / "global_network" / "geo_cache.json").write_text(json.dumps(notebook))
+
+    monkeypatch.setattr(sys, "argv", ["geoip", "--fixture", str(fixture)])
+    geoip.main()
+
+    assert json.loads((tmp_path / "data" / "global_network" / "geo_cache.json").read_text()) == notebook
+    assert [r["host"] for r in json.loads((tmp_path / "data" / "geoip" / "geo.json").read_text())] == ["203.0.113.10"]
+    merged = load_geo_cache()
+    assert merged["203.0.113.10"]["as"] == "AS64500 Test Net"
+    assert merged["198.51.100.1"]["as"] == "AS64999 Old"
@@ -0,0 +1,38 @@
+from analysis.honeypot_score import write_scores
+from analysis.honeypot_vector import (FINGERPRINT_COLUMNS, TLS_COLUMNS, score_records, score_tables,
+                                      write_score_columns)
+from benchmarks.honeypot_scoring import score_rowwise, synthetic
+from scanner.columnar import load_table, write_columnar
+from scanner.records import ndjson_path
+
+
+def test_store_columns_write_the_row_wise_files(tmp_path):
+    fingerprints, tls = synthetic(400, seed=3)
+    # a host with two certificates scores against the last one
+    tls.append({**tls[0], "fingerprint_sha256": "f" * 64, "issuer_cn": "UNKNOWN_ISSUER"})
+    root = tmp_path / "columnar"
+    write_columnar("fingerprints", fingerprints, root=root)
+    write_columnar("tls_certs", tls, root=root)
+
+    expected = score_rowwise(fingerprints, tls)
+    assert score_records(fingerprints, tls) == expected
+
+    write_scores(expected, tmp_path / "rowwise.json")
+    scored = score_tables(load_table("fingerprints", FINGERPRINT_COLUMNS, root=root),
+                          load_table("tls_certs", TLS_COLUMNS, root=root))
+    assert write_score_columns(scored, tmp_path / "vectorized.json") == len(fingerprints)
+
+    assert (tmp_path / "vectorized.json").read_text() == (tmp_path / "rowwise.json").read_text()
+    assert ndjson_path(tmp_path / "vectorized.json").read_text() == ndjson_path(tmp_path / "rowwise.json").read_text()
+
+
+def test_empty_scan_writes_empty_files(tmp_path):
+    root = tmp_path / "columnar"
+    write_columnar("fingerprints", [], root=root)
+    write_columnar("tls_certs", [], root=root)
+    scored = score_tables(load_table("fingerprints", FINGERPRINT_COLUMNS, root=root),
+                          load_table("tls_certs", TLS_COLUMNS, root=root))
+
+    assert write_score_columns(scored, tmp_path / "scores.json") == 0
+    assert (tmp_path / "scores.json").read_text() == "[]"
+    assert ndjson_path(tmp_path / "scores.json").read_text() == ""
@@ -0,0 +1,34 @@
+from analysis.operator_clusters import build_clusters, cluster_operators
+
+
+def _clusters(host_keys, max_group=50):
+    dsu, edges, skipped = cluster_operators(host_keys, max_group=max_group)
+    return [c["hosts"] for c in build_clusters(dsu, edges)], skipped
+
+
+def test_a_shared_asn_alone_does_not_link_hosts():
+    host_keys = [(f"10.0.{i}.1", "asn", "AS14061") for i in range(40)]
+    host_keys += [(f"10.0.{i}.1", "banner_hash", f"banner-{i}") for i in range(40)]
+
+    clusters, _ = _clusters(host_keys)
+    assert clusters == []
+
+
+def test_network_keys_join_strongly_linked_hosts():
+    host_keys = [
+        ("10.0.0.1", "cert_fingerprint", "aa"), ("10.0.0.2", "cert_fingerprint", "aa"),
+        ("10.0.1.1", "cert_fingerprint", "bb"), ("10.0.1.2", "cert_fingerprint", "bb"),
+        ("10.0.0.1", "asn", "AS1"), ("10.0.1.1", "asn", "AS1"), ("10.0.2.1", "asn", "AS1"),
+    ]
+
+    clusters, _ = _clusters(host_keys)
+    assert clusters == [["10.0.0.1", "10.0.0.2", "10.0.1.1", "10.0.1.2"]]
+
+
+def test_group_cap_applies_only_to_network_keys():
+    hosts = [f"10.0.{i}.1" for i in range(6)]
+    host_keys = [(h, "cert_fingerprint", "aa") for h in hosts] + [(h, "asn", "AS1") for h in hosts]
+
+    clusters, skipped = _clusters(host_keys, max_group=3)
+    assert clusters == [sorted(hosts)]
+    assert skipped == [{"via": "asn", "value": "AS1", "hosts": 6}]
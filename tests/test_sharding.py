@@ -0,0 +1,21 @@
+import asyncio
+import json
+
+from scanner.sharding import plan_shards
+
+
+def test_every_spelling_of_a_server_lands_in_one_shard(tmp_path):
+    peers = [
+        {"host": "10.0.0.5", "port": 50002, "raw": ["10.0.0.5", "electrum.example.org", ["s50002"]]},
+        {"host": "electrum.example.org", "port": 50002},
+        {"host": "127.0.0.1", "port": 50002},
+        {"host": "localhost", "port": 50002},
+    ] + [{"host": f"10.1.0.{i}", "port": 50002} for i in range(20)]
+    path = tmp_path / "peers.json"
+    path.write_text(json.dumps(peers))
+
+    assignment = asyncio.run(plan_shards(path, 4))
+
+    assert assignment["electrum.example.org"] == assignment["10.0.0.5"]
+    assert assignment["localhost"] == assignment["127.0.0.1"]
+    assert set(assignment.values()) == {0, 1, 2, 3}
@@ -0,0 +1,43 @@
+import datetime
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+from analysis.signal_rules import RuleEngine
+from scanner.tls_analyzer import cert_fields
+
+
+def _der_cert(not_before, not_after) -> bytes:
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    cert = (x509.CertificateBuilder()
+            .subject_name(name)
+            .issuer_name(name)
+            .public_key(key.public_key())
+            .serial_number(1)
+            .not_valid_before(not_before)
+            .not_valid_after(not_after)
+            .sign(key, hashes.SHA256()))
+    return cert.public_bytes(serialization.Encoding.DER)
+
+
+def test_certificate_dates_from_a_tls_analyzer_record():
+    utc = datetime.timezone.utc
+    der = _der_cert(datetime.datetime(2024, 1, 1, tzinfo=utc), datetime.datetime(2050, 1, 1, tzinfo=utc))
+    tls = {"host": "10.0.0.1", "port": 50002, "fingerprint_sha256": "ab" * 32, **cert_fields(der)}
+    fingerprint = {"host": "10.0.0.1", "port": 50002, "response_hash_banner": None}
+
+    engine = RuleEngine({
+        "rules": [
+            {"name": "long_validity", "when": {"field": "tls_validity_days", "op": ">", "value": 3650},
+             "score": 15, "signal": "validity_{tls_validity_days:.0f}_days"},
+            {"name": "far_expiry", "when": {"field": "tls_expires_year", "op": ">=", "value": 2035},
+             "score": 10, "signal": "expires_{tls_expires_year}"},
+        ],
+    })
+    [result] = engine.score_records([fingerprint], [tls])
+
+    assert result["honeypot_score"] == 25
+    assert result["signals"] == ["validity_9497_days", "expires_2050"]
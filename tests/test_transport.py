@@ -0,0 +1,37 @@
+import asyncio
+import json
+
+from scanner.transport import TCP_ONLY, ElectrumConnection
+
+
+async def _serve_objects_only(reader, writer):
+    # answers single requests, never JSON arrays
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        message = json.loads(line)
+        if isinstance(message, dict):
+            reply = {"jsonrpc": "2.0", "id": message["id"], "result": message["method"]}
+            writer.write((json.dumps(reply) + "\n").encode())
+            await writer.drain()
+    writer.close()
+
+
+def test_batch_falls_back_when_arrays_are_ignored():
+    async def run():
+        server = await asyncio.start_server(_serve_objects_only, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            conn = await ElectrumConnection.open("127.0.0.1", port, timeout=0.3, tcp_port=port, policy=TCP_ONLY)
+            async with conn:
+                calls = [("server.banner", []), ("server.ping", [])]
+                first = await conn.batch(calls)
+                assert conn.batch_supported is False
+                second = await conn.batch(calls)
+        return first, second
+
+    first, second = asyncio.run(run())
+    for replies in (first, second):
+        assert [r.error for r in replies] == ["ok", "ok"]
+        assert [r.response["result"] for r in replies] == ["server.banner", "server.ping"]